@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+#
+# clp_startup: Time clp from a cold start to exit, as scripts run it, for
+#              one command line given in argv (which only imports the
+#              command's service) against the same command line typed
+#              into an interactive session:
+#
+#   bench/clp_startup.py [--runs N] [COMMAND LINE ...]
+#
+# Each is timed over N runs (the best and the median), along with the
+# modules imported (from python -X importtime). The command catalog is
+# written by a first, untimed, run, as it is on any machine clp has run on.
+
+import argparse, os, statistics, subprocess, sys, time
+
+CLP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'clp')
+
+COMMAND_LINES = (['serial.devices'], ['config.services', 'all'])
+
+def run(argv, stdin=None, importtime=False):
+    """
+    Run clp with argv (and stdin), returning its exit status, how long it
+    took, and the modules it imported if importtime
+    """
+    python = [sys.executable] + (['-X', 'importtime'] if importtime else [])
+    start = time.perf_counter()
+    done = subprocess.run(python + [CLP] + argv, input=stdin, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    modules = sum(1 for line in done.stderr.splitlines() if line.startswith('import time:')) - 1  # less the header
+    return done.returncode, elapsed, modules
+
+def bench(name, argv, stdin, runs):
+    status, _, modules = run(argv, stdin, importtime=True)
+    times = [run(argv, stdin)[1] for _ in range(runs)]
+    print(f'{name:48} {min(times) * 1000:8.1f} {statistics.median(times) * 1000:8.1f} {modules:8d} {status:7d}')
+    return statistics.median(times)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time clp from a cold start to exit')
+    parser.add_argument('--runs', type=int, default=20, help='runs of each (default: 20)')
+    parser.add_argument('cmdline', nargs=argparse.REMAINDER,
+                        help=f'command line to time (default: {" and ".join(" ".join(argv) for argv in COMMAND_LINES)})')
+    args = parser.parse_args()
+
+    run(['help'])  # writes the command catalog, if need be
+
+    print(f'{"":48} {"best ms":>8} {"p50 ms":>8} {"modules":>8} {"status":>7}')
+    for argv in [args.cmdline] if args.cmdline else COMMAND_LINES:
+        cmdline = ' '.join(argv)
+        one_shot = bench(f'clp {cmdline}', argv, None, args.runs)
+        interactive = bench(f'clp <<< "{cmdline}"', [], f'{cmdline}\nquit\n', args.runs)
+        print(f'{"":48} {interactive / one_shot:8.2f}x faster one-shot')
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+#
+# frame_decoder: Compare receiving PLM frames one read(1) at a time
+#                against the buffered FrameDecoder, both fed through
+#                pyserial's loop:// url handler
+
+import os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.config
+import serial
+from services.insteon.insteon_plm import InsteonPLM
+
+# a standard message broadcast, preceded by the kind of garbage that
+# the PLM leaves on the line (see doc/defs)
+FRAME   = bytes.fromhex('13000250190734000001cb1100')
+BATCH   = 4096 // len(FRAME)
+BATCHES = 200
+
+class CountingPort:
+    """
+    Wraps a serial port, counting the reads issued against it
+    """
+    def __init__(self, port):
+        self.port = port
+        self.reads = 0
+
+    @property
+    def in_waiting(self):
+        return self.port.in_waiting
+
+    def read(self, size=1):
+        self.reads += 1
+        return self.port.read(size)
+
+def legacy_receive(plm):
+    byte_read = plm.plm.read(1)
+    while (byte_read != bytearray.fromhex(plm.IMParms['IM_COMM_STX'])):
+        byte_read = plm.plm.read(1)
+    cmd_num = plm.plm.read(1).hex()
+    msg_len, _, _ = plm.IMReceiveCmds[cmd_num]
+    return cmd_num, plm.plm.read(msg_len)
+
+def run(label, receive):
+    plm = InsteonPLM()
+    loop = serial.serial_for_url('loop://', timeout=0)
+    plm.plm = CountingPort(loop)
+    frames = 0
+    elapsed = 0.0
+    for _ in range(BATCHES):
+        loop.write(FRAME * BATCH)
+        start = time.perf_counter()
+        for _ in range(BATCH):
+            cmd_num, _ = receive(plm)
+            frames += cmd_num == '50'
+        elapsed += time.perf_counter() - start
+    loop.close()
+    print(f'{label:10} {frames / elapsed:12.0f} frames/s  {plm.plm.reads / frames:7.3f} reads/frame')
+
+if __name__ == '__main__':
+    run('read(1)', legacy_receive)
+    run('decoder', lambda plm: plm._receive_msg())
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+#
+# insteon_stack: Benchmark the Insteon serial protocol stack against the
+#                simulated PLM (plmsim://), writing the results as JSON
+#                so that they can be compared across versions:
+#
+#   bench/insteon_stack.py [--output FILE] [--compare BASELINE.json]
+#
+#   receive   _receive_msg reading frames straight off the port
+#   send      send_command through the reader thread and send queue
+#   monitor   what monitoring does with each frame: dispatch to filtered
+#             subscribers, then format_message
+#   devices   _construct_device_id with device tables of 29 to 10k devices
+#
+# Syscalls are the read and write syscalls of the process (from
+# /proc/self/io), so they include the simulated PLM's writes. Allocations
+# are the net memory blocks allocated by the interpreter, and the peak
+# of the memory traced by tracemalloc, over each frame.
+
+import argparse, atexit, json, os, platform, shutil, subprocess, sys, tempfile, time, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.config
+from devices import DeviceRegistry, unpack_id
+from services.insteon.insteon_plm import InsteonPLM
+from services.insteon.insteon_sendq import CommandStats
+
+# a standard message broadcast, preceded by the kind of garbage that the
+# PLM leaves on the line (see doc/defs), and the echo of a sent message
+FRAME_50 = '13 00 02 50 19 07 34 00 00 01 cb 11 00'
+FRAME_62 = '02 62 19 07 34 05 11 ff 06'
+
+RECEIVE_FRAMES = 20000
+SEND_COMMANDS  = 2000
+MONITOR_FRAMES = 50000
+DEVICE_LOOKUPS = 200000
+DEVICE_COUNTS  = (29, 100, 1000, 10000)
+
+def syscalls():
+    try:
+        with open('/proc/self/io') as f:
+            io = dict(line.split(': ') for line in f.read().splitlines())
+        return int(io['syscr']) + int(io['syscw'])
+    except (OSError, KeyError, ValueError):
+        return 0
+
+def write_trace(frames, count):
+    """
+    A trace of the frames, repeated count times, all at once
+    """
+    trace = tempfile.NamedTemporaryFile('w', suffix='.trace', delete=False)
+    with trace:
+        for idx in range(count):
+            trace.write(f'0 {frames[idx % len(frames)]}\n')
+    return trace.name
+
+def new_plm():
+    plm = InsteonPLM()
+    # nothing of the benchmark is to be kept in the history
+    plm.history.log_dir = tempfile.mkdtemp(prefix='h8s-bench-')
+    atexit.register(shutil.rmtree, plm.history.log_dir, True)
+    return plm
+
+def bench_receive():
+    plm = new_plm()
+    trace = write_trace([FRAME_50], RECEIVE_FRAMES)
+    plm._open_port(f'plmsim://?trace={trace}&speed=0', 1)
+
+    frames = 0
+    calls = syscalls()
+    blocks = sys.getallocatedblocks()
+    start = time.perf_counter()
+    while frames < RECEIVE_FRAMES:
+        cmd_num, msg = plm._receive_msg()
+        if cmd_num is None:
+            break
+        frames += 1
+    elapsed = time.perf_counter() - start
+    calls = syscalls() - calls
+    blocks = sys.getallocatedblocks() - blocks
+    plm.disconnect()
+    os.unlink(trace)
+
+    return {'frames': frames,
+            'frames_per_sec': frames / elapsed,
+            'syscalls_per_frame': calls / frames,
+            'net_blocks_per_frame': blocks / frames,
+            'skipped_bytes': plm.decoder.skipped}
+
+def bench_send():
+    plm = new_plm()
+    plm.connect('plmsim://')
+
+    stats = CommandStats()
+    calls = syscalls()
+    start = time.perf_counter()
+    for _ in range(SEND_COMMANDS):
+        sent = time.perf_counter()
+        plm.send_command('SEND_STD_MSG', '1907340511ff')
+        stats.record(time.perf_counter() - sent)
+    elapsed = time.perf_counter() - start
+    calls = syscalls() - calls
+
+    start = time.perf_counter()
+    plm.send_commands([('SEND_STD_MSG', '1907340511ff')] * SEND_COMMANDS)
+    pipelined = time.perf_counter() - start
+    plm.disconnect()
+
+    summary = stats.summary()
+    return {'commands': SEND_COMMANDS,
+            'commands_per_sec': SEND_COMMANDS / elapsed,
+            'pipelined_commands_per_sec': SEND_COMMANDS / pipelined,
+            'p50_ms': summary['p50'] * 1000,
+            'p99_ms': summary['p99'] * 1000,
+            'syscalls_per_command': calls / SEND_COMMANDS}
+
+def bench_monitor():
+    plm = new_plm()
+    body_50 = memoryview(bytes.fromhex(FRAME_50)[4:])
+    body_62 = memoryview(bytes.fromhex(FRAME_62)[2:])
+
+    shown = []
+    def show(cmd_num, msg):
+        shown.append(plm.format_message(cmd_num, msg))
+        if len(shown) > 1000:
+            shown.clear()
+
+    results = {}
+    for label, cmd_num in (('filtered', '50'), ('unfiltered', None)):
+        plm.subscribe(cmd_num, show)
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        for idx in range(MONITOR_FRAMES):
+            if idx % 2:
+                plm.dispatcher.dispatch(0x62, body_62)
+            else:
+                plm.dispatcher.dispatch(0x50, body_50)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+        plm.unsubscribe(cmd_num, show)
+        results[label] = {'frames_per_sec': MONITOR_FRAMES / elapsed,
+                          'peak_traced_bytes_per_frame': peak / MONITOR_FRAMES}
+    return results
+
+def synthetic_devices(count):
+    devices = {}
+    types = ('SwitchLinc', 'LampLinc', 'KeypadLinc', 'OutletLinc', 'InlineLinc')
+    for idx in range(count):
+        devices[unpack_id(0x100000 + idx * 7)] = {
+            'name': f'device {idx}', 'room': f'room {idx % 40}', 'location': f'location {idx % 7}',
+            'type': 'insteon/' + types[idx % len(types)], 'active': 'True',
+            'properties': {'category': str(idx % 3), 'subcategory': str(idx % 50)}}
+    return devices
+
+class Msg:
+    __slots__ = ('from_id1', 'from_id2', 'from_id3')
+
+def bench_devices():
+    plm = new_plm()
+    results = {}
+    for count in DEVICE_COUNTS:
+        devices = synthetic_devices(count)
+        start = time.perf_counter()
+        plm.devices = DeviceRegistry(devices=devices)
+        built = time.perf_counter() - start
+
+        keys = [0x100000 + idx * 7 for idx in range(0, count * 2, 3)]  # half of them unknown
+        msgs = []
+        for key in keys[:1000]:
+            msg = Msg()
+            msg.from_id1, msg.from_id2, msg.from_id3 = key >> 16, (key >> 8) & 0xff, key & 0xff
+            msgs.append(msg)
+
+        start = time.perf_counter()
+        for idx in range(DEVICE_LOOKUPS):
+            plm._construct_device_id('from_id', msgs[idx % len(msgs)])
+        elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        selected = len(plm.devices.select(type_name='keypadlinc', room='room 2'))
+        selecting = time.perf_counter() - start
+
+        results[str(count)] = {'build_ms': built * 1000,
+                               'lookups_per_sec': DEVICE_LOOKUPS / elapsed,
+                               'select_us': selecting * 1e6,
+                               'selected': selected}
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+def flatten(results, prefix=''):
+    for name, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f'{prefix}{name}.')
+        else:
+            yield f'{prefix}{name}', value
+
+BENCHMARKS = {'receive': bench_receive, 'send': bench_send, 'monitor': bench_monitor, 'devices': bench_devices}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the Insteon serial protocol stack')
+    parser.add_argument('benchmarks', nargs='*',
+                        help=f'benchmarks to run: {", ".join(BENCHMARKS)} (default: all)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='show the change from the results in this JSON file')
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f'no such benchmark: {name}')
+
+    report = {'revision': git_revision(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'results': {}}
+    for name in args.benchmarks or BENCHMARKS:
+        report['results'][name] = BENCHMARKS[name]()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = dict(flatten(json.load(f)['results']))
+
+    for metric, value in flatten(report['results']):
+        line = f'{metric:48} {value:14.3f}' if isinstance(value, float) else f'{metric:48} {value:14}'
+        if baseline.get(metric):
+            line += f'  ({value / baseline[metric]:6.2f}x)'
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
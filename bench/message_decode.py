@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+#
+# message_decode: Compare decoding the body of a received PLM frame with
+#                 the regex over its hex string, against the layouts that
+#                 InsteonPLM compiles from cmds_receive.json
+
+import os, re, sys, timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.config
+from services.insteon.insteon_plm import InsteonPLM
+
+BODIES = {'50': bytes.fromhex('190734000001cb1100'),
+          '62': bytes.fromhex('1b037e05400206')}
+NUMBER = 200000
+
+if __name__ == '__main__':
+    plm = InsteonPLM()
+    for cmd_num, body in BODIES.items():
+        _, msg_regex, _ = plm.IMReceiveCmds[cmd_num]
+        layout = plm.layouts[int(cmd_num, 16)]
+        view = memoryview(body)
+        assert layout.decode(view).groupdict() == re.match(msg_regex, body.hex()).groupdict()
+
+        regex = timeit.timeit(lambda: re.match(msg_regex, view.hex()).groupdict(), number=NUMBER)
+        compiled = timeit.timeit(lambda: layout.decode(view), number=NUMBER)
+        print(f'{cmd_num}: regex {regex / NUMBER * 1e9:6.0f} ns  layout {compiled / NUMBER * 1e9:6.0f} ns  ({regex / compiled:.1f}x)')
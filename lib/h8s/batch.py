@@ -0,0 +1,164 @@
+import argparse
+import io
+import shlex
+import sys
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from daemon import ThreadOutput
+
+class BatchSyntaxError(Exception):
+    def __init__(self, msg):
+        self.data = msg
+
+class BatchParser(argparse.ArgumentParser):
+    """
+    An ArgumentParser that raises a BatchSyntaxError for a command line in
+    error, rather than exiting, so that every line of a script is checked
+    before any of it is executed
+    """
+
+    def error(self, message):
+        raise BatchSyntaxError(f'{self.prog.strip()}: {message}' if self.prog.strip() else message)
+
+    def exit(self, status=0, message=None):
+        # e.g. after the help asked for with -h, which a script has no use for
+        raise BatchSyntaxError(message.strip() if message else 'only the help of the command would be shown')
+
+
+class BatchCommand():
+    """
+    One command line of a batch, parsed, and once executed, its output
+    and exit status
+    """
+
+    def __init__(self, lineno, cmdline, args, key):
+        self.lineno = lineno
+        self.cmdline = cmdline
+        self.args = args
+        self.key = key              # ordering key, see Command.ordering
+        self.waiting = 0            # commands before it still to finish
+        self.dependents = []        # commands after it that wait for it
+        self.output = None
+        self.messages = None        # what it wrote to stderr
+        self.status = None
+        self.done = threading.Event()
+
+
+class Batch():
+    """
+    A Batch is a script of command lines (e.g. provisioning devices), all
+    parsed up front so that every syntax error is reported before any
+    hardware is touched, and then executed concurrently: each command
+    waits only for the commands before it that act on the same thing, by
+    their ordering keys (see Command.ordering). So e.g. serial devices are
+    listed while Insteon commands are sent, and the commands to each
+    Insteon device are sent in the order of the script.
+
+    The output of each command is printed whole, in the order of the
+    script, as soon as the commands before it have been printed.
+
+    parse(tokens) returns the args of a command line, raising a
+    BatchSyntaxError if it is in error, and ordering(args) its ordering
+    key. Parsing ends at a line for which parse returns None (e.g. quit).
+    """
+
+    def __init__(self, lines, parse, ordering):
+        self.commands = []
+        self.errors = []    # (lineno, message)
+
+        for lineno, cmdline in enumerate(lines, 1):
+            try:
+                tokens = shlex.split(cmdline, comments=True)
+                if not tokens:
+                    continue
+                args = parse(tokens)
+                if args is None:
+                    break
+                key = tuple(ordering(args))
+            except ValueError as err:  # e.g. unbalanced quotes
+                self.errors.append((lineno, str(err)))
+            except BatchSyntaxError as err:
+                self.errors.append((lineno, err.data))
+            except Exception as err:
+                self.errors.append((lineno, f'Cannot load the command: {err}'))
+            else:
+                self.commands.append(BatchCommand(lineno, cmdline.strip(), args, key))
+
+        self._order()
+
+    def run(self, execute, jobs=16):
+        """
+        Execute the commands, with up to jobs at a time, by execute(args),
+        which prints what the command outputs and returns its exit status.
+        Returns the highest exit status of the commands.
+        """
+        lock = threading.Lock()
+        installed = not isinstance(sys.stdout, ThreadOutput)
+        if installed:
+            sys.stdout, sys.stderr = ThreadOutput(sys.stdout), ThreadOutput(sys.stderr)
+
+        def execute_command(command):
+            # binary, as well as text, for output formats like msgpack
+            output = io.TextIOWrapper(io.BytesIO(), write_through=True)
+            messages = io.StringIO()
+            sys.stdout.redirect(output)
+            sys.stderr.redirect(messages)
+            try:
+                command.status = execute(command.args)
+            except Exception as err:  # TODO: convert to a log write
+                print(f'ERROR: Command failed: {err}')
+                command.status = 1
+            finally:
+                sys.stdout.restore()
+                sys.stderr.restore()
+            command.output = output.buffer.getvalue()
+            command.messages = messages.getvalue()
+            command.done.set()
+
+            with lock:
+                ready = []
+                for dependent in command.dependents:
+                    dependent.waiting -= 1
+                    if dependent.waiting == 0:
+                        ready.append(dependent)
+            for dependent in ready:
+                executor.submit(execute_command, dependent)
+
+        status = 0
+        try:
+            with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='Batch') as executor:
+                for command in [command for command in self.commands if command.waiting == 0]:
+                    executor.submit(execute_command, command)
+
+                for command in self.commands:
+                    command.done.wait()
+                    sys.stdout.flush()
+                    sys.stdout.buffer.write(command.output)
+                    sys.stdout.buffer.flush()
+                    sys.stderr.write(command.messages)
+                    status = max(status, command.status or 0)
+        finally:
+            if installed:
+                sys.stdout, sys.stderr = sys.stdout.stream, sys.stderr.stream
+
+        return status
+
+    def _order(self):
+        """
+        Have each command wait for the commands before it whose keys are
+        the same as its own, or one within the other. Looking back from
+        each command, no further is needed than a command whose key is
+        its own or within it, as that one waits for all the rest.
+        """
+        for idx, command in enumerate(self.commands):
+            key = command.key
+            for before in reversed(self.commands[:idx]):
+                common = min(len(key), len(before.key))
+                if key[:common] != before.key[:common]:
+                    continue
+                before.dependents.append(command)
+                command.waiting += 1
+                if len(before.key) <= len(key):
+                    break
@@ -0,0 +1,188 @@
+import json
+import os
+
+class CommandCatalog():
+    """
+    The command catalog caches what the CLP needs to know of every service's
+    commands to build its parser (FQN, description, version and argument
+    specs), so that starting the CLP does not import any command module.
+
+    Each service's entry is keyed on its commands directory: the hash of
+    each command file in it, with the directory's mtime and each file's
+    mtime and size sparing the listing and hashing of what has not been
+    touched. Only when a command file is added, removed or changed is the
+    service's entry stale, and only then are its commands loaded and the
+    entry recorded afresh.
+    """
+
+    VERSION = 1
+
+    # argument spec values that are types, which JSON cannot hold as is
+    ARG_TYPES = {'str': str, 'int': int, 'float': float}
+
+    def __init__(self, path, root_dir):
+        self.path = path
+        self.root_dir = root_dir
+        self.changed = False
+
+        try:
+            with open(self.path) as f:
+                self.catalog = json.load(f)
+        except (IOError, ValueError):
+            self.catalog = {}
+
+        if self.catalog.get('version') != self.VERSION or self.catalog.get('root_dir') != root_dir:
+            self.catalog = {'version': self.VERSION, 'root_dir': root_dir, 'services': {}}
+
+    def save(self):
+        if not self.changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self.catalog, f)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError:
+            pass  # no cache, the next start just loads the commands again
+        self.changed = False
+
+    def service_names(self, services_dir):
+        """
+        The names of the directories in services_dir, as of the last time
+        its mtime changed
+        """
+        mtime = os.stat(services_dir).st_mtime_ns
+        cached = self.catalog.get('services_dir')
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        names = sorted(name for name in os.listdir(services_dir)
+                           if os.path.isdir(os.path.join(services_dir, name)))
+        self.catalog['services_dir'] = [mtime, names]
+        self.changed = True
+        return names
+
+    def lookup(self, service):
+        """
+        The recorded command interfaces of the service, as a list of dicts,
+        or None if there are none or they are stale
+        """
+        entry = self.catalog['services'].get(service.getServiceName())
+        if not entry or entry['depends'] != self._depends(service):
+            return None
+
+        recorded = entry['fingerprint']
+        fingerprint = self._fingerprint(service.cmd_dir, recorded)
+        if fingerprint != recorded:
+            if self._digests(fingerprint) != self._digests(recorded):
+                return None
+            # touched or rewritten, but not changed
+            entry['fingerprint'] = fingerprint
+            self.changed = True
+        return entry['commands']
+
+    def is_stale(self, service):
+
+        return self.lookup(service) is None
+
+    def record(self, service):
+        """
+        Record the command interfaces of a service whose commands are loaded
+        """
+        commands = []
+        for interface in service.command_interfaces():
+            args = self._encode_args(interface.getArgs())
+            if args is None:
+                # cannot be cached, so neither can the service's entry
+                self.invalidate(service.getServiceName())
+                return
+            commands.append({'name': interface.getName(),
+                             'fqn': interface.getFQN(),
+                             'description': interface.getDescription(),
+                             'version': interface.getVersion(),
+                             'args': args})
+
+        self.catalog['services'][service.getServiceName()] = {
+            'depends': self._depends(service),
+            'fingerprint': self._fingerprint(service.cmd_dir),
+            'commands': commands}
+        self.changed = True
+
+    def invalidate(self, service_name=None):
+        if service_name is None:
+            self.catalog['services'] = {}
+            self.changed = True
+        elif self.catalog['services'].pop(service_name, None):
+            self.changed = True
+
+    def decode_args(self, args):
+        decoded = {}
+        for arg_name, spec in args.items():
+            spec = dict(spec)
+            if 'type' in spec:
+                spec['type'] = self.ARG_TYPES[spec['type']]
+            decoded[arg_name] = spec
+        return decoded
+
+    def _encode_args(self, args):
+        type_names = {arg_type: name for name, arg_type in self.ARG_TYPES.items()}
+        encoded = {}
+        for arg_name, spec in args.items():
+            spec = dict(spec)
+            if 'type' in spec:
+                if spec['type'] not in type_names:
+                    return None
+                spec['type'] = type_names[spec['type']]
+            try:
+                json.dumps(spec)
+            except (TypeError, ValueError):
+                return None
+            encoded[arg_name] = spec
+        return encoded
+
+    def _depends(self, service):
+        # e.g. the config service's commands depend on the set of services
+        return [self._mtime(path) for path in service.catalog_depends()]
+
+    def _mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _digests(self, fingerprint):
+        return {fname: fingerprint['files'][fname][2] for fname in fingerprint['files']}
+
+    def _fingerprint(self, cmd_dir, recorded=None):
+        """
+        The mtime of the commands directory, and the mtime, size and hash of
+        each command file in it. When the directory's mtime is as recorded,
+        no file was added or removed, so it need not be listed; and a
+        file's hash is only computed when its mtime or size has changed.
+        """
+        fingerprint = {'mtime': self._mtime(cmd_dir), 'files': {}}
+        if fingerprint['mtime'] is None:
+            return fingerprint
+
+        recorded_files = recorded['files'] if recorded else {}
+        if recorded and recorded['mtime'] == fingerprint['mtime']:
+            fnames = list(recorded_files)
+        else:
+            fnames = sorted(fname for fname in os.listdir(cmd_dir) if fname.endswith('.py'))
+
+        for fname in fnames:
+            path = os.path.join(cmd_dir, fname)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            was = recorded_files.get(fname)
+            if was and was[0] == st.st_mtime_ns and was[1] == st.st_size:
+                digest = was[2]
+            else:
+                import hashlib  # only when a file changed, as it is slow to import
+
+                with open(path, 'rb') as f:
+                    digest = hashlib.sha1(f.read()).hexdigest()
+            fingerprint['files'][fname] = [st.st_mtime_ns, st.st_size, digest]
+        return fingerprint
@@ -1,4 +1,18 @@
+import collections
+import csv
+import json
+import sys
 
+# format spec types of quantities, whose columns are aligned right (unlike
+# e.g. codes in hex)
+NUMBER_TYPES = set('deEfFgGn%')
+
+# formats that command output can be written in
+FORMATS = ('text', 'json', 'jsonl', 'csv', 'msgpack')
+
+class OutputFormatError(Exception):
+    def __init__(self, msg):
+        self.data = msg
 
 class CommandInterface():
     """
@@ -40,6 +54,32 @@ class CommandInterface():
         self.command.execute(args)
         
 
+class CachedCommandInterface(CommandInterface):
+    """
+    The interface of a command as recorded in the command catalog, which
+    stands in for the command until the command's module is imported:
+    asked for the command, or to execute it, it has the owning service
+    load the command (once), and hands over to it
+    """
+
+    def __init__(self, service, fqn, name, description, version, args):
+
+        self.service     = service
+        self.name        = name
+        self.fqn         = fqn
+        self.description = description
+        self.version     = version
+        self.command     = None
+        self.args        = args
+
+    def getCommand(self):
+        return self.service.get_command(self.name)
+
+    def execute(self, args):
+        # through the service, which a ServiceProxy starts first
+        return self.service.execute_command(self.name, args)
+
+
 class Command():
     """
     A Command class is the generic representation of a command of a service,
@@ -50,9 +90,179 @@ class Command():
           by the owning service.
     """
 
+    # whether the owning service is started (e.g. its hardware connected
+    # to) before the command is executed, which a command that only reads
+    # what is on disk has no need of
+    starts_service = True
+
     def getService(self):
         return self.owning_service
 
     def getInterface(self):
         return self.interface
 
+    def ordering(self, args):
+        """
+        The key of what executing the command with args acts on, as a
+        tuple from the general to the particular, e.g. (service, device):
+        a batch executes the commands whose keys are the same, or one
+        within the other, in order, and the others concurrently. By
+        default, the commands of a service are executed in order.
+        """
+        return (self.getService().getServiceName(),)
+
+
+
+# a column of a Table: the field of the records, its heading, its width,
+# and the format spec of its values
+Column = collections.namedtuple('Column', ['field', 'heading', 'width', 'spec'], defaults=[''])
+
+class Table():
+    """
+    A Table is how the records a command outputs are rendered as text.
+
+    A command's execute returns (or yields, as a generator, so that the
+    output is printed as it is produced rather than once it is all in
+    memory) the lines of its output. In among the lines, it can output a
+    Table and then records, which are dicts of the values of fields,
+    formatted only when the output is rendered: the Table is rendered as
+    the heading of its columns, and each record after it as a line of its
+    fields, in its columns.
+    """
+
+    def __init__(self, *columns):
+        self.columns = [Column(*column) for column in columns]
+
+    def fields(self):
+        return [column.field for column in self.columns]
+
+    def heading(self):
+        return self._line(column.heading for column in self.columns)
+
+    def format(self, record):
+        # a field of None (or missing) is left blank
+        return self._line('' if record.get(column.field) is None else format(record[column.field], column.spec)
+                              for column in self.columns)
+
+    def _line(self, texts):
+        return ' '.join(f'{text:{">" if column.spec[-1:] in NUMBER_TYPES else "<"}{column.width}}'
+                            for text, column in zip(texts, self.columns)).rstrip()
+
+
+
+class Form():
+    """
+    A Form is how the records a command outputs are rendered as text
+    when each is to be a block of lines (e.g. verbose output): by a
+    template of the record's fields, for str.format
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    def heading(self):
+        return None
+
+    def format(self, record):
+        return self.template.format_map(record)
+
+
+def render(output):
+    """
+    Generator of the lines of text of a command's output, as it is read,
+    with the records formatted by the Table (or Form) before them
+    """
+    layout = None
+    for item in output:
+        if isinstance(item, (Table, Form)):
+            layout = item
+            if layout.heading() is not None:
+                yield layout.heading()
+        elif isinstance(item, dict):
+            yield layout.format(item) if layout else '  '.join(f'{field}={value}' for field, value in item.items())
+        else:
+            yield item
+
+
+def write_output(output, stream, output_format='text', messages=None):
+    """
+    Write a command's output to stream, as it is read, in the output
+    format: as text, or else just the records, serialized as a JSON
+    array, JSON lines, CSV or msgpack (to stream's binary buffer). The
+    lines of the output (e.g. errors) are then written to messages
+    (stderr by default) instead. Returns whether any of the lines was an
+    error.
+
+    The records from one Table or Form to the next are a section of the
+    CSV, with a header of every field of its records, in the order they
+    first appear, so a section is written whole once its last record is
+    read (the other formats are written record by record).
+    """
+    if output_format not in FORMATS:
+        raise OutputFormatError(f'No such output format: "{output_format}"')
+
+    error = False
+    if output_format == 'text':
+        for line in render(output):
+            stream.write(line + '\n')
+            error = error or line.startswith('ERROR:')
+        return error
+
+    messages = messages or sys.stderr
+    serialize, end = _serializer(output_format, stream)
+    section = []    # the records of the CSV section read so far
+    for item in output:
+        if isinstance(item, dict):
+            if output_format == 'csv':
+                section.append(item)
+            else:
+                serialize(item)
+        elif isinstance(item, (Table, Form)):
+            _write_section(section, serialize)
+            section = []
+        else:
+            messages.write(item + '\n')
+            error = error or item.startswith('ERROR:')
+    _write_section(section, serialize)
+    end()
+    return error
+
+def _write_section(records, serialize):
+    # dict keys, as an ordered set of the fields, in the order they first appear
+    fields = list(dict.fromkeys(field for record in records for field in record))
+    if fields:
+        serialize(fields)
+    for record in records:
+        serialize([record.get(field, '') for field in fields])
+
+def _serializer(output_format, stream):
+    """
+    The function writing each record to stream in the output format, and
+    the one ending the output
+    """
+    if output_format == 'jsonl':
+        encode = json.JSONEncoder(default=str).encode
+        return (lambda record: stream.write(encode(record) + '\n')), (lambda: None)
+
+    if output_format == 'json':
+        encode = json.JSONEncoder(default=str).encode
+        separator = '['
+        def serialize(record):
+            nonlocal separator
+            stream.write(separator + encode(record))
+            separator = ',\n'
+        return serialize, lambda: stream.write('[]\n' if separator == '[' else ']\n')
+
+    if output_format == 'csv':
+        return csv.writer(stream).writerow, lambda: None
+
+    # msgpack
+    try:
+        import msgpack
+    except ImportError:
+        raise OutputFormatError('msgpack output needs the msgpack package (pip install msgpack)')
+    if not hasattr(stream, 'buffer'):
+        raise OutputFormatError('msgpack output needs a binary stream')
+    stream.flush()
+    pack = msgpack.Packer(default=str).pack
+    return (lambda record: stream.buffer.write(pack(record))), stream.buffer.flush
@@ -0,0 +1,171 @@
+import base64
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+class ThreadOutput():
+    """
+    A ThreadOutput stands in for sys.stdout (or sys.stderr), sending what
+    a thread writes to the stream that thread has redirected it to, if
+    any, so that each client of the daemon gets only its own output.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def redirect(self, stream):
+        self.local.stream = stream
+
+    def current(self):
+        """
+        The stream the thread writes to
+        """
+        return getattr(self.local, 'stream', None) or self.stream
+
+    def restore(self):
+        self.local.stream = None
+
+    def write(self, text):
+        return (getattr(self.local, 'stream', None) or self.stream).write(text)
+
+    @property
+    def buffer(self):
+        return (getattr(self.local, 'stream', None) or self.stream).buffer
+
+    def flush(self):
+        (getattr(self.local, 'stream', None) or self.stream).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class ClientOutput():
+    """
+    Output to a client of the daemon: each write is sent as one JSON line,
+    of the key of the stream (out for stdout, err for stderr)
+    """
+
+    def __init__(self, wfile, key='out'):
+        self.wfile = wfile
+        self.key = key
+        self.buffer = ClientBinaryOutput(wfile)
+
+    def write(self, text):
+        if text:
+            self.wfile.write(json.dumps({self.key: text}).encode() + b'\n')
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class ClientBinaryOutput():
+    """
+    Binary output to a client of the daemon (e.g. msgpack): each write is
+    sent as one JSON line, in base64
+    """
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, data):
+        if data:
+            self.wfile.write(json.dumps({'outb': base64.b64encode(data).decode()}).encode() + b'\n')
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class ClpRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one command line sent by a client, which is a JSON line of
+    {"argv": [...], "format": <output format>}. Everything the command
+    prints is sent back to the client as it happens, as {"out": <text>}
+    (or {"err": <text>} of stderr, {"outb": <base64>} of binary output),
+    followed by
+    {"status": <exit status>}.
+    """
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            argv, output_format = request['argv'], request.get('format', 'text')
+        except (ValueError, KeyError, TypeError):
+            self.wfile.write(json.dumps({'out': 'ERROR: Malformed request\n', 'status': 2}).encode() + b'\n')
+            return
+
+        sys.stdout.redirect(ClientOutput(self.wfile))
+        sys.stderr.redirect(ClientOutput(self.wfile, 'err'))
+        try:
+            status = self.server.execute(argv, output_format)
+        except (BrokenPipeError, ConnectionResetError):
+            return  # the client went away
+        except Exception as err:  # TODO: convert to a log write
+            print(f'ERROR: Command failed: {err}')
+            status = 1
+        finally:
+            sys.stdout.restore()
+            sys.stderr.restore()
+
+        try:
+            self.wfile.write(json.dumps({'status': status}).encode() + b'\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class ClpDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    A ClpDaemon keeps the configuration of the mesh (and with it, the
+    services and their open devices like the Insteon PLM) initialized,
+    and runs command lines sent to it over a Unix domain socket, each
+    on a thread of its own.
+
+    execute(argv, output_format) runs a command line, printing its output
+    in the output format, and returns its exit status.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, execute):
+
+        if os.path.exists(socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(socket_path)
+            except OSError:
+                os.unlink(socket_path)  # left behind by a daemon that died
+            else:
+                raise OSError(f'A daemon is already listening on "{socket_path}"')
+            finally:
+                probe.close()
+
+        # made with no access for others, rather than changed to that once
+        # bound, when another user could have connected already
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, socket_path, ClpRequestHandler)
+        finally:
+            os.umask(umask)
+
+        self.socket_path = socket_path
+        self.execute = execute
+
+        if not isinstance(sys.stdout, ThreadOutput):
+            sys.stdout = ThreadOutput(sys.stdout)
+        if not isinstance(sys.stderr, ThreadOutput):
+            sys.stderr = ThreadOutput(sys.stderr)
+
+    def serve(self):
+
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server_close()
+            os.unlink(self.socket_path)
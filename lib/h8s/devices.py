@@ -1,4 +1,10 @@
 import json
+import os
+import sys
+
+# values of a device's active flag that mean it is in service, in any case
+# (HouseLinc exports, and devices.json, have both "True" and "Active")
+ACTIVE_VALUES = ('true', 'active')
 
 class DevicesIOError(Exception):
     def __init__(self, msg):
@@ -22,16 +28,32 @@ class Devices():
           the Devices class, which is then embedded in this service object
     """
 
-    def __init__(self, service):
-        
+    def __init__(self, service, devices=None, devices_file='devices.json'):
+
+        self.store = None
+        if devices is not None:
+            # already read, e.g. by the service itself
+            self.devices = devices
+            return
+
+        from store import ConfigStore, ConfigStoreError
+
+        # the service's devices.json is only read when it has changed since
+        # it was last put in the configuration store
+        path = os.path.join(os.path.dirname(sys.modules[service].__file__), devices_file)
         try:
-            f = open(os.path.join(os.path.dirname(sys.modules[service].__file__), 'devices.json'))
-            self.devices = json.load(f)
-            f.close()
-        except IOError:
-            self.devices = {}
-            raise DevicesIOError('Cannot read devices.json file')
+            self.store = ConfigStore.open()
+            self.devices = self.store.load(service.rsplit('.', 1)[-1], 'devices', path)
+        except ConfigStoreError:
+            try:
+                f = open(path)
+                self.devices = json.load(f)
+                f.close()
+            except (IOError, ValueError):
+                self.devices = {}
 
+        if not self.devices:
+            raise DevicesIOError(f'Cannot read {devices_file} file')
 
     def get_device(self):
 
@@ -42,3 +64,147 @@ class Devices():
 
         return self.devices
 
+
+
+def pack_id(dev_id):
+    """
+    The 24-bit integer of a device ID written as three dotted hex bytes,
+    e.g. '18.3D.DA' => 0x183dda
+    """
+    id1, id2, id3 = dev_id.split('.')
+    return (int(id1, 16) << 16) | (int(id2, 16) << 8) | int(id3, 16)
+
+def unpack_id(dev_key):
+
+    return f'{dev_key >> 16:02X}.{(dev_key >> 8) & 0xff:02X}.{dev_key & 0xff:02X}'
+
+
+class Device():
+    """
+    A Device is one entry of a DeviceRegistry, with its attributes taken
+    out of the device's dict once, when it is added, rather than each
+    time the device is looked at
+    """
+
+    __slots__ = ('id', 'key', 'name', 'type', 'type_name', 'room', 'location',
+                 'active', 'category', 'subcategory', 'properties', 'display', 'entry')
+
+    def __init__(self, dev_id, entry):
+        properties = entry.get('properties', {})
+
+        self.id = dev_id.upper()
+        self.key = pack_id(dev_id)
+        self.name = entry['name']
+        self.type = entry['type']
+        self.type_name = self.type.rsplit('/', 1)[-1].lower()  # e.g. 'insteon/SwitchLinc' => 'switchlinc'
+        self.room = entry['room']
+        self.location = entry['location']
+        self.active = str(entry.get('active')).lower() in ACTIVE_VALUES
+        self.category = properties.get('category')
+        self.subcategory = properties.get('subcategory')
+        self.properties = properties
+        self.display = f'{self.name} in {self.room} at {self.location}'
+        self.entry = entry
+
+    def __repr__(self):
+        return f'Device({self.id}: {self.display})'
+
+
+class DeviceRegistry(Devices):
+    """
+    A DeviceRegistry holds a service's devices keyed on their 24-bit
+    integer ID, with secondary indexes on type, room, category and
+    subcategory, and active flag, so that finding a device, or the
+    devices of a kind, does not scan them all.
+
+    Each index maps a value to the keys of the devices having it, in
+    the order the devices were added.
+    """
+
+    INDEXES = ('type_name', 'room', 'category', 'subcategory', 'active')
+
+    def __init__(self, service=None, devices=None, devices_file='devices.json'):
+
+        Devices.__init__(self, service, devices, devices_file)
+
+        self.by_key = {}
+        self.indexes = {index: {} for index in self.INDEXES}
+        for dev_id in self.devices:
+            self._index(Device(dev_id, self.devices[dev_id]))
+
+    def __len__(self):
+        return len(self.by_key)
+
+    def __iter__(self):
+        return iter(list(self.by_key.values()))
+
+    def __contains__(self, dev_key):
+        return dev_key in self.by_key
+
+    def get(self, dev_key):
+        """
+        The Device of the 24-bit integer ID, or None if not known
+        """
+        return self.by_key.get(dev_key)
+
+    def get_by_id(self, dev_id):
+
+        return self.by_key.get(pack_id(dev_id))
+
+    def get_device(self):
+
+        for device in self:
+            yield device.entry
+
+    def add_device(self, dev_id, entry):
+        """
+        Add (or replace) the device, keeping the indexes up to date
+        """
+        self.remove_device(dev_id)
+        device = Device(dev_id, entry)
+        self.devices[device.id] = entry
+        self._index(device)
+        return device
+
+    def remove_device(self, dev_id):
+
+        device = self.by_key.pop(pack_id(dev_id), None)
+        if device is None:
+            return None
+        self.devices.pop(device.id, None)
+        for index in self.INDEXES:
+            keys = self.indexes[index].get(getattr(device, index))
+            if keys is not None:
+                keys.pop(device.key, None)
+                if not keys:
+                    del self.indexes[index][getattr(device, index)]
+        return device
+
+    def values(self, index):
+        """
+        The values of the index, e.g. the rooms there are devices in
+        """
+        return list(self.indexes[index])
+
+    def select(self, **criteria):
+        """
+        The devices matching all the criteria, each being an index and the
+        value wanted of it, e.g. select(type_name='switchlinc', active=True).
+        Criteria of None are ignored.
+        """
+        matching = [self.indexes[index].get(value, {}) for index, value in criteria.items() if value is not None]
+        if not matching:
+            return list(self.by_key.values())
+
+        # intersect starting from the fewest devices
+        matching.sort(key=len)
+        keys = matching[0]
+        for other in matching[1:]:
+            keys = [dev_key for dev_key in keys if dev_key in other]
+        return [self.by_key[dev_key] for dev_key in keys]
+
+    def _index(self, device):
+        self.by_key[device.key] = device
+        for index in self.INDEXES:
+            # dicts rather than sets, to keep the devices in order
+            self.indexes[index].setdefault(getattr(device, index), {})[device.key] = None
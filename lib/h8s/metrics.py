@@ -0,0 +1,225 @@
+import bisect
+import os
+import threading
+import weakref
+
+# latency buckets of histograms, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class MetricsError(Exception):
+    def __init__(self, msg):
+        self.data = msg
+
+class Histogram():
+    """
+    Counts of the values observed that fall in each bucket, each bucket
+    being the values up to its upper bound, with the last one for all the
+    values beyond the highest bound
+    """
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        The upper bound of the bucket the q quantile falls in (inf if it is
+        beyond the highest bound)
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics():
+    """
+    The Metrics of the process: counters and latency histograms, each
+    named as in Prometheus and told apart by labels, e.g. the latency of
+    executing each command, by its FQN.
+
+    Instrumented code checks metrics.enabled before recording anything,
+    so that when disabled (the default, unless $H8S_METRICS is set) the
+    instrumentation costs no more than that check. What is already
+    counted elsewhere, such as the bytes the Insteon PLM's frame decoder
+    took in, is not counted again: a collector registered for it reports
+    it only when the metrics are read. Resetting the metrics cannot zero
+    what collectors count, so their values as of the reset are taken off
+    what they report from then on.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.described = {}     # name: (type, help)
+        self.counters = {}      # (name, labels): value
+        self.histograms = {}    # (name, labels): Histogram
+        self.collectors = []    # weak references to callables yielding (name, labels, value)
+        self.baselines = {}     # (name, labels): value collected as of the last reset
+
+    def describe(self, name, metric_type, help_text):
+        self.described[name] = (metric_type, help_text)
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def register(self, collector):
+        """
+        Have collector() called whenever the metrics are read, for the
+        (name, labels, value) it yields. The collector is only held
+        weakly, so that registering it does not keep its owner alive.
+        """
+        ref = weakref.WeakMethod(collector) if hasattr(collector, '__self__') else weakref.ref(collector)
+        with self.lock:
+            self.collectors.append(ref)
+
+    def reset(self):
+        collected = self._collect()
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.baselines = collected
+
+    def values(self):
+        """
+        The value of every counter, as (name, labels, value) sorted by name
+        and labels, labels being a tuple of (label, value) pairs
+        """
+        collected = self._collect()
+        with self.lock:
+            values = dict(self.counters)
+            for key, value in collected.items():
+                baseline = self.baselines.get(key, 0)
+                if value < baseline:  # counted afresh since, e.g. by a new PLM
+                    del self.baselines[key]
+                    baseline = 0
+                values[key] = values.get(key, 0) + value - baseline
+        return [(name, labels, values[name, labels]) for name, labels in sorted(values)]
+
+    def _collect(self):
+        """
+        What the collectors report, as {(name, labels): value}
+        """
+        with self.lock:
+            self.collectors = [ref for ref in self.collectors if ref() is not None]
+            collectors = [ref() for ref in self.collectors]
+        collected = {}
+        for collector in collectors:
+            if collector is None:
+                continue
+            try:
+                for name, labels, value in collector():
+                    key = (name, tuple(sorted(labels.items())))
+                    collected[key] = collected.get(key, 0) + value
+            except Exception as err:  # TODO: convert to a log write
+                print(f'ERROR: Metrics collector failed: {err}')
+        return collected
+
+    def distributions(self):
+        """
+        A copy of every histogram, as (name, labels, Histogram) sorted by
+        name and labels
+        """
+        with self.lock:
+            distributions = []
+            for name, labels in sorted(self.histograms):
+                histogram = self.histograms[name, labels]
+                copy = Histogram(histogram.bounds)
+                copy.counts, copy.count, copy.sum = list(histogram.counts), histogram.count, histogram.sum
+                distributions.append((name, labels, copy))
+        return distributions
+
+    def prometheus(self):
+        """
+        The metrics in the Prometheus text exposition format
+        """
+        lines = []
+        described = set()
+
+        def header(name, default_type):
+            if name not in described:
+                described.add(name)
+                metric_type, help_text = self.described.get(name, (default_type, ''))
+                if help_text:
+                    lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {metric_type}')
+
+        for name, labels, value in self.values():
+            header(name, 'counter')
+            lines.append(f'{name}{format_labels(labels)} {value}')
+
+        for name, labels, histogram in self.distributions():
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum}')
+            lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def export(self, target):
+        """
+        Write the metrics in the Prometheus text format to target: a file
+        (replaced whole, as the node exporter's textfile collector wants
+        it), or a socket, as unix:PATH or tcp:HOST:PORT, that is sent the
+        metrics and then closed
+        """
+        import socket  # only here, so as not to slow down starting the CLP
+
+        text = self.prometheus().encode()
+        try:
+            if target.startswith('unix:'):
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(target[len('unix:'):])
+                    sock.sendall(text)
+            elif target.startswith('tcp:'):
+                host, _, port = target[len('tcp:'):].rpartition(':')
+                with socket.create_connection((host or 'localhost', int(port)), timeout=10) as sock:
+                    sock.sendall(text)
+            else:
+                tmp_path = f'{target}.{os.getpid()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(text)
+                os.replace(tmp_path, target)
+        except (OSError, ValueError) as err:
+            raise MetricsError(f'Cannot export the metrics to "{target}": {err}')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{label}="{escape_label(value)}"' for label, value in labels) + '}'
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# the metrics of the process
+metrics = Metrics(enabled=os.environ.get('H8S_METRICS', '') not in ('', '0'))
+
+metrics.describe('h8s_command_seconds', 'histogram', 'Time taken to execute a command, by its FQN')
+metrics.describe('h8s_command_errors_total', 'counter', 'Commands whose execution raised an exception, by FQN')
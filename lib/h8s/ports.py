@@ -0,0 +1,232 @@
+import collections
+import copy
+import fnmatch
+import glob
+import os
+import select
+import socket
+import threading
+import time
+
+from serial.tools import list_ports, list_ports_common
+from serial.tools.list_ports_linux import SysFS
+
+# Terminology:
+#   uevent = the kernel's notice, over netlink, of a device added or removed
+#   by-id link = the link udev makes to a serial device in /dev/serial/by-id,
+#                named after the device's serial number, so it is the same
+#                each time the device is plugged in (unlike /dev/ttyUSBn)
+
+BY_ID_DIR = '/dev/serial/by-id'
+SYSFS_TTY_DIR = '/sys/class/tty'
+NETLINK_KOBJECT_UEVENT = 15
+
+# the ttys that are serial ports, as pyserial's comports() has them
+PORT_PATTERNS = ('ttyS*', 'ttyUSB*', 'ttyACM*', 'ttyAMA*', 'rfcomm*', 'ttyAP*')
+
+def by_id_link(device):
+    """
+    The by-id link to the device, or the device itself if it has none
+    """
+    try:
+        real_path = os.path.realpath(device)
+        for link_name in sorted(os.listdir(BY_ID_DIR)):
+            if os.path.realpath(os.path.join(BY_ID_DIR, link_name)) == real_path:
+                return os.path.join(BY_ID_DIR, link_name)
+    except OSError:
+        pass
+    return device
+
+
+class PortInventory():
+    """
+    The PortInventory is what pyserial's comports() finds of the serial
+    ports on Linux, kept up to date rather than found afresh each time:
+    finding a port reads a dozen files of sysfs about it, which takes a
+    while on boards with many ttys, and is only done for a port when it
+    appears.
+
+    Ports are indexed on their USB vendor and product IDs and their
+    serial numbers. The inventory follows the kernel's uevents of ttys
+    added and removed, or where netlink cannot be listened to, looks for
+    ports come and gone (by name, in /dev) whenever it is asked. Where
+    there is no sysfs (e.g. macOS and the BSDs), the ports are those
+    pyserial's comports() finds, each time the inventory is asked.
+
+    Use PortInventory.shared(), so that every service shares the one
+    inventory of the process.
+    """
+
+    POLL_INTERVAL = 0.1
+
+    shared_inventory = None
+    shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        with cls.shared_lock:
+            if cls.shared_inventory is None:
+                cls.shared_inventory = cls()
+            return cls.shared_inventory
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.ports = {}                                 # device: SysFS (or what comports() has)
+        self.by_usb_id = collections.defaultdict(set)   # (vid, pid): devices
+        self.by_serial = collections.defaultdict(set)   # serial number: devices
+        self.added = 0      # count of ports added since the inventory was taken
+        self.sysfs = os.path.isdir(SYSFS_TTY_DIR)
+        self.listener = None
+        self.sock = None
+        try:
+            if self.sysfs:  # without it, the ports of uevents cannot be looked up
+                self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+                self.sock.bind((0, 1))  # the kernel's multicast group of uevents
+        except (OSError, AttributeError):
+            if self.sock:
+                self.sock.close()
+            self.sock = None
+
+        # listening before taking the inventory, so nothing is missed
+        if self.sock:
+            self.listener = threading.Thread(target=self._listen, name='PortInventory', daemon=True)
+            self.listener.start()
+        with self.cond:
+            self._rescan()
+
+    def comports(self, include_links=False):
+        """
+        The serial ports, as comports() has them, including the links in
+        /dev to them with include_links
+        """
+        with self.cond:
+            if not self.sock:
+                self._rescan()
+            ports = list(self.ports.values())
+        if include_links:
+            for link in list_ports_common.list_links([port.device for port in ports]):
+                port = copy.copy(self.ports.get(os.path.realpath(link)))
+                if port is not None:
+                    port.device = link
+                    port.hwid += f' LINK={os.path.realpath(link)}'
+                    ports.append(port)
+        return ports
+
+    def find(self, vid=None, pid=None, serial_number=None):
+        """
+        The serial ports of the USB vendor and product IDs, and/or of the
+        serial number, sorted on their device names
+        """
+        with self.cond:
+            if not self.sock:
+                self._rescan()
+            devices = set(self.ports)
+            if vid is not None or pid is not None:
+                devices &= self.by_usb_id.get((vid, pid), set())
+            if serial_number is not None:
+                devices &= self.by_serial.get(serial_number, set())
+            return sorted(self.ports[device] for device in devices)
+
+    def get(self, device):
+        with self.cond:
+            if not self.sock:
+                self._rescan()
+            return self.ports.get(os.path.realpath(device))
+
+    def generation(self):
+        """
+        A mark of the ports added so far, for wait_for_port
+        """
+        with self.cond:
+            return self.added
+
+    def wait_for_port(self, generation, timeout, stop=None):
+        """
+        Wait up to timeout seconds for a port to be added since generation,
+        returning whether one was. Waiting also ends early when the stop
+        callable says so, after wake() is called.
+        """
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.added == generation and not (stop and stop()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if self.sock:
+                    self.cond.wait(remaining)
+                else:
+                    self.cond.wait(min(remaining, self.POLL_INTERVAL))
+                    self._rescan()
+            return self.added != generation
+
+    def wake(self):
+        with self.cond:
+            self.cond.notify_all()
+
+    def _rescan(self):
+        """
+        Take in the ports come and gone since, by their names in /dev, or
+        without sysfs, as comports() finds them
+        """
+        if self.sysfs:
+            found = {}
+            devices = set()
+            for pattern in PORT_PATTERNS:
+                devices.update(glob.glob(os.path.join('/dev', pattern)))
+        else:
+            found = {port.device: port for port in list_ports.comports()}
+            devices = set(found)
+        for device in set(self.ports) - devices:
+            self._remove(device)
+        for device in devices - set(self.ports):
+            self._add(device, found.get(device))
+
+    def _add(self, device, port=None):
+        port = port or SysFS(device)
+        if getattr(port, 'subsystem', None) == 'platform':  # not present, as comports() has it
+            return
+        self.ports[device] = port
+        if port.vid is not None:
+            self.by_usb_id[port.vid, port.pid].add(device)
+            self.by_usb_id[port.vid, None].add(device)
+        if port.serial_number:
+            self.by_serial[port.serial_number].add(device)
+        self.added += 1
+        self.cond.notify_all()
+
+    def _remove(self, device):
+        port = self.ports.pop(device, None)
+        if port is None:
+            return
+        if port.vid is not None:
+            self.by_usb_id[port.vid, port.pid].discard(device)
+            self.by_usb_id[port.vid, None].discard(device)
+        if port.serial_number:
+            self.by_serial[port.serial_number].discard(device)
+
+    def _listen(self):
+        while True:
+            try:
+                select.select([self.sock], [], [])
+                uevent = self.sock.recv(65536)
+            except OSError:  # e.g. the kernel's uevents overran the socket
+                with self.cond:
+                    self._rescan()
+                continue
+            self._apply_uevent(uevent)
+
+    def _apply_uevent(self, uevent):
+        # e.g. b'add@/devices/.../ttyUSB0\0ACTION=add\0...\0SUBSYSTEM=tty\0DEVNAME=ttyUSB0\0...'
+        fields = dict(field.split(b'=', 1) for field in uevent.split(b'\0')[1:] if b'=' in field)
+        if fields.get(b'SUBSYSTEM') != b'tty' or b'DEVNAME' not in fields:
+            return
+        name = os.path.basename(fields[b'DEVNAME'].decode(errors='replace'))
+        if not any(fnmatch.fnmatchcase(name, pattern) for pattern in PORT_PATTERNS):
+            return
+        device = os.path.join('/dev', name)
+        with self.cond:
+            if fields.get(b'ACTION') == b'add':
+                self._remove(device)
+                self._add(device)
+            elif fields.get(b'ACTION') == b'remove':
+                self._remove(device)
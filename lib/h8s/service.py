@@ -1,6 +1,10 @@
 import os
 import importlib
 import re
+import sys
+import threading
+
+from command import CachedCommandInterface
 
 class Service():
     """
@@ -25,6 +29,8 @@ class Service():
         self.version = version
         self.state = None  # TBD
         self.commands = {}
+        self.cached_commands = {}   # command interfaces from the command catalog
+        self.proxy = None           # the ServiceProxy it was built behind, which holds its commands
         self.COMMANDS_IDX_MOD = 0 # command's python module
         self.COMMANDS_IDX_OBJ = 1 # command's python object
         self.COMMANDS_IDX_VER = 2 # version of the command (from filename)
@@ -52,46 +58,239 @@ class Service():
     def getPath(self):
         return self.root_dir
 
-    def load_commands(self):
-        for command_fname in os.listdir(self.cmd_dir):
-            m = self.re_command_fname.match(command_fname)
-            if m and os.path.isfile(os.path.join(self.cmd_dir, command_fname)):
-                command_name = m.group(2)
-                command_ver = int(m.group(3))
-
-                if command_name in self.commands and command_ver > self.commands[command_name][self.COMMANDS_IDX_VER]:
-                    del self.commands[command_name][self.COMMANDS_IDX_OBJ] 
-                    del self.commands[command_name][self.COMMANDS_IDX_MOD] 
-                    del self.commands[command_name]
-
-                if command_name not in self.commands:
-                    command_fullname = m.group(1)
-                    command_mod = importlib.import_module('services.'+self.service_name+'.commands.'+command_fullname)
-                    command_obj = getattr( command_mod, command_name.capitalize() )(self, command_ver)
-                    self.commands[command_name] = [ command_mod, command_obj, command_ver, command_ver ]
+    def resolve(self):
+        """
+        The service itself, which a ServiceProxy has to import first, but
+        without starting it
+        """
+        return self
+
+    def start(self):
+        """
+        Bring up whatever the service needs to carry out its commands,
+        such as hardware, which is deferred until a command is executed
+        so that merely loading the service stays cheap
+        """
+        pass
+
+    def catalog_depends(self):
+        """
+        Paths, beyond its commands directory, whose change makes the
+        service's entry in the command catalog stale
+        """
+        return []
+
+    def init_commands(self, proxy=None):
+        """
+        Load the service's commands, unless it is built behind a proxy,
+        which holds them instead, importing each command's module only
+        when the command is first executed
+        """
+        self.proxy = proxy
+        if proxy is None:
+            self.load_commands()
+
+    def catalog_commands(self, catalog):
+        """
+        Take the service's command interfaces from the command catalog if
+        its entry there is up to date, leaving each command's module to be
+        imported when the command is first executed. Otherwise, load the
+        commands, and record them in the catalog for next time.
+        """
+        cached = catalog.lookup(self)
+        if cached is None:
+            self.load_commands()
+            catalog.record(self)
+        else:
+            for command in cached:
+                self.cached_commands[command['name']] = CachedCommandInterface(self, command['fqn'], command['name'],
+                                                                               command['description'], command['version'],
+                                                                               catalog.decode_args(command['args']))
+
+    def refresh_commands(self, catalog):
+        """
+        Reload the service's commands if its catalog entry is stale,
+        returning whether it was
+        """
+        if not catalog.is_stale(self):
+            return False
+
+        importlib.invalidate_caches()
+        self.cached_commands = {}
+        self.load_commands(fresh=True)
+        catalog.record(self)
+        return True
+
+    def reload_commands(self, command_names):
+        """
+        Reload just the named commands, whose files have changed: the
+        highest version left of each is imported afresh and swapped in for
+        the old one, or the command is dropped if no version of it is left.
+        Returns the FQNs of the commands reloaded.
+        """
+        importlib.invalidate_caches()
+        versions = self.scan_commands()
+        reloaded = []
+        for command_name in command_names:
+            try:
+                if command_name in versions:
+                    self.load_command(command_name, versions[command_name], fresh=True)
                 else:
-                    if command_ver > self.commands[command_name][self.COMMANDS_IDX_SAW]:
-                        self.commands[command_name][self.COMMANDS_IDX_SAW] = command_ver
+                    self.commands.pop(command_name, None)
+            except Exception as err:  # e.g. caught in the middle of an edit
+                print(f'ERROR: Cannot reload command "{command_name}": {err}')
+                continue
+            self.cached_commands.pop(command_name, None)
+            reloaded.append(self.service_name + '.' + command_name)
+        return reloaded
 
-        for command_name in self.commands:
-            if self.commands[command_name][self.COMMANDS_IDX_SAW] == self.commands[command_name][self.COMMANDS_IDX_VER]:
-                self.commands[command_name][self.COMMANDS_IDX_SAW] = 0
-            else:
-                command_ver = self.commands[command_name][self.COMMANDS_IDX_SAW] 
+    def command_fqns(self):
+        return {interface.getFQN() for interface in self.command_interfaces()}
 
-                del self.commands[command_name][self.COMMANDS_IDX_OBJ] 
-                del self.commands[command_name][self.COMMANDS_IDX_MOD] 
-                del self.commands[command_name]
+    def scan_commands(self):
+        """
+        The highest version of each command in the commands directory
+        """
+        versions = {}
+        if os.path.isdir(self.cmd_dir):
+            for command_fname in os.listdir(self.cmd_dir):
+                m = self.re_command_fname.match(command_fname)
+                if m and os.path.isfile(os.path.join(self.cmd_dir, command_fname)):
+                    command_name = m.group(2)
+                    command_ver = int(m.group(3))
+                    if command_ver > versions.get(command_name, 0):
+                        versions[command_name] = command_ver
+        return versions
 
-                if command_ver > 0:
-                    command_mod = importlib.import_module('services.'+self.service_name+'.commands.'+command_name+'_v'+command_ver)
-                    command_obj = getattr( command_mod, command_name.capitalize() )(self, command_ver)
-                    self.commands[command_name] = [ command_mod, command_obj, command_ver, 0 ]
+    def load_command(self, command_name, command_ver, fresh=False):
+        module_name = 'services.'+self.service_name+'.commands.'+command_name+'_v'+str(command_ver)
+        if fresh and module_name in sys.modules:
+            command_mod = importlib.reload(sys.modules[module_name])
+        else:
+            command_mod = importlib.import_module(module_name)
+        command_obj = getattr( command_mod, command_name.capitalize() )(self, command_ver)
+        # swapped in whole, so that executing the command concurrently
+        # gets either the old command or the new one, never a mix
+        self.commands[command_name] = [ command_mod, command_obj, command_ver, command_ver ]
+        return command_obj
+
+    def load_commands(self, fresh=False):
+        """
+        Load the highest version of each command in the commands directory,
+        replacing any lower version loaded, and dropping commands whose
+        files are gone. With fresh, command modules already imported are
+        executed again, to pick up changes made to them.
+        """
+        versions = self.scan_commands()
+
+        for command_name in versions:
+            command_ver = versions[command_name]
+            loaded = self.commands.get(command_name)
+            if fresh or not loaded or loaded[self.COMMANDS_IDX_VER] != command_ver:
+                self.load_command(command_name, command_ver, fresh)
+            else:
+                loaded[self.COMMANDS_IDX_SAW] = command_ver
+
+        for command_name in [command_name for command_name in self.commands if command_name not in versions]:
+            del self.commands[command_name]
 
     def command_interfaces(self):
-        for command in self.commands:
-            yield self.commands[command][self.COMMANDS_IDX_OBJ].getInterface()
+        if self.proxy:
+            yield from self.proxy.command_interfaces()
+            return
+        # copies, as commands may be reloaded meanwhile by another thread
+        commands = self.commands.copy()
+        cached_commands = self.cached_commands.copy()
+        for command in commands:
+            yield commands[command][self.COMMANDS_IDX_OBJ].getInterface()
+        for command in cached_commands:
+            if command not in commands:
+                yield cached_commands[command]
+
+
+    def get_command(self, command):
+        if self.proxy:
+            return self.proxy.get_command(command)
+        loaded = self.commands.get(command)
+        if loaded:
+            return loaded[self.COMMANDS_IDX_OBJ]
+        return self.load_command(command, self.cached_commands[command].getVersion())
+
+    def execute_command(self, command, args):
+        return self.get_command(command).execute(args)
+
+    def command_ordering(self, command, args):
+        """
+        The ordering key of executing the command with args (see
+        Command.ordering), which loads the command but does not start
+        the service
+        """
+        return self.get_command(command).ordering(args)
 
 
+class ServiceProxy(Service):
+    """
+    A ServiceProxy stands in for a service that has not been loaded yet.
+    It knows the service's name and commands, which it takes from the
+    command catalog (or loads itself from the service's commands
+    directory), without importing the service.
+
+    The service is imported and instantiated the first time anything
+    else about it is needed, and started the first time one of its
+    commands is executed (but for commands with no need of it, see
+    Command.starts_service). From then on, the proxy forwards everything
+    the commands ask of their owning service to the real service. The
+    commands stay with the proxy, the real service asking it for them.
+    """
+
+    def __init__(self, path, service_key, catalog):
+        Service.__init__(self, path, name=os.path.basename(path), description=None, version=None)
+        self.service_key = service_key
+        self.service = None
+        self.started = False
+        self.lock = threading.RLock()
+        self.state = 'unloaded'
+
+        self.catalog_commands(catalog)
+
+    def resolve(self):
+        with self.lock:
+            if self.service is None:
+                service_mod = importlib.import_module(self.service_key)
+                self.service = getattr(service_mod, self.service_name.capitalize())(self.root_dir, proxy=self)
+        return self.service
+
+    def is_loaded(self):
+        return self.service is not None
+
+    def start(self):
+        with self.lock:
+            service = self.resolve()
+            if not self.started:
+                service.start()
+                self.started = True
+        return service
+
+    def getName(self):
+        return self.service.getName() if self.service else self.name
+
+    def getDescription(self):
+        return self.resolve().getDescription()
+
+    def getVersion(self):
+        return self.resolve().getVersion()
+
+    def getState(self):
+        return self.service.getState() if self.service else self.state
+
     def execute_command(self, command, args):
-        return self.commands[command][self.COMMANDS_IDX_OBJ].execute(args)
+        if self.get_command(command).starts_service:
+            self.start()
+        return Service.execute_command(self, command, args)
+
+    def __getattr__(self, name):
+        # only called for what the proxy does not have itself, which is
+        # whatever is particular to the real service (e.g. get_plm)
+        if name.startswith('__') or name in ('service', 'lock'):
+            raise AttributeError(name)
+        return getattr(self.start(), name)
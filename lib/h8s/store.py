@@ -0,0 +1,304 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from devices import pack_id
+
+# where the configuration store lives, unless H8S_CONFIG_STORE says otherwise
+store_path = os.environ.get('H8S_CONFIG_STORE',
+                            os.path.join(os.environ.get('XDG_DATA_HOME', os.path.expanduser('~/.local/share')),
+                                         'h8s', 'config.db'))
+
+class ConfigStoreError(Exception):
+    def __init__(self, msg):
+        self.data = msg
+
+class ConfigStore():
+    """
+    The ConfigStore keeps the configuration of every service in one SQLite
+    database: its parameters, the commands it sends and the layouts of
+    the messages it receives (as for the Insteon PLM), and its devices,
+    along with the link records of each device's link database.
+
+    Each table is filled from the service's JSON file of it, which is only
+    parsed again when the file has changed since (or when another source,
+    such as a HouseLinc export, has not been imported into the table
+    instead). The database is in WAL mode, so the daemon, the CLP and a
+    monitor can all read it at once, each loading only what it needs.
+
+    Devices are keyed on their packed 24-bit integer IDs, and recorded
+    with a digest of everything imported about them, so that importing
+    the devices again only writes those that changed (and removes those
+    that are gone), rather than rewriting them all.
+    """
+
+    VERSION = 1
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS sources (
+            service     TEXT NOT NULL,
+            kind        TEXT NOT NULL,
+            path        TEXT NOT NULL,
+            mtime       INTEGER NOT NULL,
+            size        INTEGER NOT NULL,
+            imported    INTEGER NOT NULL,
+            PRIMARY KEY (service, kind)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS parms (
+            service     TEXT NOT NULL,
+            seq         INTEGER NOT NULL,
+            name        TEXT NOT NULL,
+            value       TEXT NOT NULL,
+            PRIMARY KEY (service, name)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS send_cmds (
+            service     TEXT NOT NULL,
+            seq         INTEGER NOT NULL,
+            name        TEXT NOT NULL,
+            command     TEXT NOT NULL,
+            syntax      TEXT NOT NULL,
+            description TEXT NOT NULL,
+            PRIMARY KEY (service, name)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS receive_cmds (
+            service     TEXT NOT NULL,
+            seq         INTEGER NOT NULL,
+            cmd_num     TEXT NOT NULL,
+            msg_len     INTEGER NOT NULL,
+            msg_regex   TEXT NOT NULL,
+            description TEXT NOT NULL,
+            PRIMARY KEY (service, cmd_num)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS devices (
+            service     TEXT NOT NULL,
+            key         INTEGER NOT NULL,
+            id          TEXT NOT NULL,
+            name        TEXT NOT NULL,
+            type        TEXT NOT NULL,
+            room        TEXT NOT NULL,
+            location    TEXT NOT NULL,
+            active      TEXT NOT NULL,
+            properties  TEXT NOT NULL,
+            digest      TEXT NOT NULL,
+            PRIMARY KEY (service, key)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS devices_type ON devices (service, type);
+        CREATE INDEX IF NOT EXISTS devices_room ON devices (service, room);
+        CREATE TABLE IF NOT EXISTS links (
+            service     TEXT NOT NULL,
+            key         INTEGER NOT NULL,
+            sequence    INTEGER NOT NULL,
+            address     INTEGER NOT NULL,
+            grp         INTEGER NOT NULL,
+            control     INTEGER NOT NULL,
+            data1       INTEGER NOT NULL,
+            data2       INTEGER NOT NULL,
+            data3       INTEGER NOT NULL,
+            PRIMARY KEY (service, key, sequence)
+        ) WITHOUT ROWID;
+    '''
+
+    # table of each kind of configuration, and how a JSON file of it is
+    # turned into rows (after service and seq) and back
+    KINDS = {
+        'parms':        ('SELECT name, value FROM parms WHERE service = ? ORDER BY seq',
+                         lambda name, value: (name, json.dumps(value)),
+                         lambda name, value: (name, json.loads(value))),
+        'send_cmds':    ('SELECT name, command, syntax, description FROM send_cmds WHERE service = ? ORDER BY seq',
+                         lambda name, cmd: (name, cmd[0], cmd[1], cmd[2]),
+                         lambda name, command, syntax, description: (name, [command, syntax, description])),
+        'receive_cmds': ('SELECT cmd_num, msg_len, msg_regex, description FROM receive_cmds WHERE service = ? ORDER BY seq',
+                         lambda cmd_num, cmd: (cmd_num, cmd[0], cmd[1], cmd[2]),
+                         lambda cmd_num, msg_len, msg_regex, description: (cmd_num, [msg_len, msg_regex, description])),
+    }
+
+    shared = {}
+    shared_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path=None):
+        """
+        The store at path (store_path, by default), shared by all the
+        services of the process
+        """
+        path = path or store_path
+        with cls.shared_lock:
+            if path not in cls.shared:
+                cls.shared[path] = cls(path)
+            return cls.shared[path]
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+            self.db.execute('PRAGMA journal_mode = WAL')
+            self.db.execute('PRAGMA synchronous = NORMAL')
+            if self.db.execute('PRAGMA user_version').fetchone()[0] != self.VERSION:
+                with self.db:
+                    self.db.executescript(self.SCHEMA)
+                    self.db.execute(f'PRAGMA user_version = {self.VERSION}')
+        except (OSError, sqlite3.Error) as err:
+            raise ConfigStoreError(f'Cannot open the configuration store "{path}": {err}')
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def load(self, service, kind, path):
+        """
+        The service's configuration of the kind, as the dict the JSON file
+        at path holds, after taking it from the file if it has changed
+        """
+        self.sync(service, kind, path)
+        if kind == 'devices':
+            return self.load_devices(service)
+        query, _, from_row = self.KINDS[kind]
+        with self.lock:
+            rows = self.db.execute(query, (service,)).fetchall()
+        return dict(from_row(*row) for row in rows)
+
+    def sync(self, service, kind, path):
+        """
+        Fill the service's table of the kind from the JSON file at path, if
+        the file has changed since it was last, unless something else was
+        imported into the table. Returns whether the table was filled.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+
+        with self.lock:
+            source = self.db.execute('SELECT path, mtime, size, imported FROM sources WHERE service = ? AND kind = ?',
+                                     (service, kind)).fetchone()
+            if source and (source[3] or source[:3] == (path, st.st_mtime_ns, st.st_size)):
+                return False
+
+            try:
+                with open(path) as f:
+                    config_data = json.load(f)
+            except (IOError, ValueError):
+                return False
+
+            with self.db:
+                if kind == 'devices':
+                    self._apply_devices(service, ((dev_id, config_data[dev_id], []) for dev_id in config_data))
+                else:
+                    _, to_row, _ = self.KINDS[kind]
+                    rows = [(service, seq) + to_row(key, config_data[key]) for seq, key in enumerate(config_data)]
+                    self.db.execute(f'DELETE FROM {kind} WHERE service = ?', (service,))
+                    if rows:
+                        self.db.executemany(f'INSERT INTO {kind} VALUES ({",".join("?" * len(rows[0]))})', rows)
+                self._record_source(service, kind, path, st, imported=False)
+        return True
+
+    def load_devices(self, service, **criteria):
+        """
+        The service's devices, as the dict of device ID to device entry that
+        devices.json holds, or only those matching the criteria (type,
+        room, or active)
+        """
+        where = ['service = ?']
+        params = [service]
+        for column, value in criteria.items():
+            if column not in ('type', 'room', 'active'):
+                raise ConfigStoreError(f'Devices cannot be selected by "{column}"')
+            where.append(f'{column} = ?')
+            params.append(value)
+
+        devices = {}
+        with self.lock:
+            rows = self.db.execute('SELECT id, name, type, room, location, active, properties FROM devices '
+                                   'WHERE ' + ' AND '.join(where) + ' ORDER BY key', params).fetchall()
+        for dev_id, name, dev_type, room, location, active, properties in rows:
+            devices[dev_id] = {'name': name, 'type': dev_type, 'room': room, 'location': location,
+                               'active': active, 'properties': json.loads(properties)}
+        return devices
+
+    def get_device(self, service, dev_id):
+        """
+        The device entry of the device, or None if there is no such device
+        """
+        with self.lock:
+            row = self.db.execute('SELECT name, type, room, location, active, properties FROM devices '
+                                  'WHERE service = ? AND key = ?', (service, pack_id(dev_id))).fetchone()
+        if row is None:
+            return None
+        name, dev_type, room, location, active, properties = row
+        return {'name': name, 'type': dev_type, 'room': room, 'location': location,
+                'active': active, 'properties': json.loads(properties)}
+
+    def get_links(self, service, dev_id):
+        """
+        The link records of the device, as (address, group, control, data1,
+        data2, data3) with the address a packed 24-bit integer
+        """
+        with self.lock:
+            return self.db.execute('SELECT address, grp, control, data1, data2, data3 FROM links '
+                                   'WHERE service = ? AND key = ? ORDER BY sequence',
+                                   (service, pack_id(dev_id))).fetchall()
+
+    def import_devices(self, service, devices, path):
+        """
+        Bring the service's devices in line with the devices, an iterable of
+        (device ID, device entry, link records) imported from the file at
+        path, in one transaction. From then on, the devices are not taken
+        from the service's devices.json. Returns the entries of the devices
+        added or changed, by device ID, and the IDs of those removed.
+        """
+        with self.lock, self.db:
+            changed, removed = self._apply_devices(service, devices)
+            if changed or removed:
+                self._record_source(service, 'devices', os.path.abspath(path), os.stat(path), imported=True)
+        return changed, removed
+
+    def _apply_devices(self, service, devices):
+        """
+        Write only the devices added or changed, and delete those not among
+        the devices (unless there are none at all, which would rather be
+        something other than the devices)
+        """
+        digests = dict(self.db.execute('SELECT key, digest FROM devices WHERE service = ?', (service,)))
+        changed = {}
+        imported = 0
+        for dev_id, entry, links in devices:
+            imported += 1
+            dev_id = dev_id.upper()
+            key = pack_id(dev_id)
+            digest = self._digest(entry, links)
+            if digests.pop(key, None) == digest:
+                continue
+            self._delete_device(service, key)
+            self.db.execute('INSERT INTO devices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            (service, key, dev_id, entry['name'], entry['type'], entry['room'], entry['location'],
+                             entry['active'], json.dumps(entry['properties'], sort_keys=True), digest))
+            self.db.executemany('INSERT INTO links VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                [(service, key, sequence) + tuple(link) for sequence, link in enumerate(links)])
+            changed[dev_id] = entry
+
+        if not imported:
+            return changed, []
+
+        # whatever was not imported this time is gone
+        removed = [row[0] for row in self.db.execute(
+            f'SELECT id FROM devices WHERE service = ? AND key IN ({",".join("?" * len(digests))})',
+            [service] + list(digests))]
+        for key in digests:
+            self._delete_device(service, key)
+
+        return changed, removed
+
+    def _delete_device(self, service, key):
+        self.db.execute('DELETE FROM devices WHERE service = ? AND key = ?', (service, key))
+        self.db.execute('DELETE FROM links WHERE service = ? AND key = ?', (service, key))
+
+    def _record_source(self, service, kind, path, st, imported):
+        self.db.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?)',
+                        (service, kind, path, st.st_mtime_ns, st.st_size, int(imported)))
+
+    def _digest(self, entry, links):
+        return hashlib.sha1(json.dumps([entry, links], sort_keys=True).encode()).hexdigest()
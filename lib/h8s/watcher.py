@@ -0,0 +1,150 @@
+import ctypes
+import ctypes.util
+import os
+import re
+import select
+import struct
+import threading
+import time
+
+# inotify(7) event masks
+IN_MODIFY      = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+# IN_MODIFY too, for files written in place and left open (e.g. by editors
+# that keep them so); the events of a save are debounced into one change
+IN_WATCH_MASK  = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+IN_EVENT       = struct.Struct('iIII')
+
+re_command_fname = re.compile(r'^([^_.].*)_v\d+\.py$')
+
+class Inotify():
+    """
+    Just enough of inotify(7), through libc, to watch directories
+    """
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+    def add_watch(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed on "{path}"')
+        return wd
+
+    def read_events(self):
+        """
+        Generator of (wd, mask, name) of the events waiting to be read
+        """
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = IN_EVENT.unpack_from(data, offset)
+            offset += IN_EVENT.size
+            name = data[offset:offset+name_len].rstrip(b'\0').decode()
+            offset += name_len
+            yield wd, mask, name
+
+    def close(self):
+        os.close(self.fd)
+
+
+class CommandWatcher(threading.Thread):
+    """
+    A CommandWatcher watches the commands directory of services, and tells
+    changed(service, command_names) which commands had a file of theirs
+    (of any version) written, added, removed or renamed.
+
+    Events are gathered for a moment (DEBOUNCE) before they are reported,
+    as an editor saving a file makes several of them. Where inotify is not
+    to be had, the directories' files are polled for changes instead.
+    """
+
+    DEBOUNCE = 0.05
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, services, changed):
+        threading.Thread.__init__(self, name='CommandWatcher', daemon=True)
+        self.services = {}
+        self.changed = changed
+        self.lock = threading.Lock()
+        self.alive = True
+        try:
+            self.inotify = Inotify()
+        except (OSError, AttributeError):
+            self.inotify = None
+        self.watches = {}   # inotify watch descriptor -> service
+        self.polled = {}    # commands directory -> {fname: mtime}
+
+        for service in services:
+            self.watch(service)
+
+    def watch(self, service):
+        if not os.path.isdir(service.cmd_dir):
+            return
+        with self.lock:
+            if self.inotify:
+                self.watches[self.inotify.add_watch(service.cmd_dir, IN_WATCH_MASK)] = service
+            else:
+                self.polled[service.cmd_dir] = self._listing(service.cmd_dir)
+            self.services[service.cmd_dir] = service
+
+    def stop(self):
+        self.alive = False
+
+    def run(self):
+        while self.alive:
+            if self.inotify:
+                pending = self._wait_events()
+            else:
+                pending = self._poll()
+
+            for service, command_names in pending.items():
+                try:
+                    self.changed(service, sorted(command_names))
+                except Exception as err:  # TODO: convert to a log write
+                    print(f'ERROR: Reloading commands of "{service.getServiceName()}" failed: {err}')
+
+    def _wait_events(self):
+        pending = {}
+        timeout = 1.0   # so that stop() is noticed
+        while True:
+            ready, _, _ = select.select([self.inotify.fd], [], [], timeout)
+            if not ready:
+                return pending
+            for wd, mask, name in self.inotify.read_events():
+                m = re_command_fname.match(name)
+                with self.lock:
+                    service = self.watches.get(wd)
+                if m and service:
+                    pending.setdefault(service, set()).add(m.group(1))
+            timeout = self.DEBOUNCE
+
+    def _listing(self, cmd_dir):
+        listing = {}
+        try:
+            for fname in os.listdir(cmd_dir):
+                if re_command_fname.match(fname):
+                    listing[fname] = os.stat(os.path.join(cmd_dir, fname)).st_mtime_ns
+        except OSError:
+            pass
+        return listing
+
+    def _poll(self):
+        time.sleep(self.POLL_INTERVAL)
+        pending = {}
+        with self.lock:
+            polled = list(self.polled.items())
+        for cmd_dir, was in polled:
+            now = self._listing(cmd_dir)
+            changed = {fname for fname in set(was) | set(now) if was.get(fname) != now.get(fname)}
+            if changed:
+                self.polled[cmd_dir] = now
+                pending[self.services[cmd_dir]] = {re_command_fname.match(fname).group(1) for fname in changed}
+        return pending
@@ -1,4 +1,4 @@
-from command import Command, CommandInterface
+from command import Command, CommandInterface, Form, Table
 
 class Services(Command):
     def __init__(self, owning_service, version):
@@ -14,18 +14,14 @@ class Services(Command):
                                                          'help':'additional detail on each service'}})
 
     def execute(self, args):
+        services = [s for s in self.owning_service.services() if args.service=='all' or args.service==s.getName()]
         if args.verbose:
-            output = ['%s\n  %s\n  State=%s\n  Version=%d\n  Root directory=%s' % \
-                      (s.getName(), s.getDescription(), s.getState(), s.getVersion(), s.getPath())
-                         for s in self.owning_service.services()
-                             if args.service=='all' or args.service==s.getName()]
+            yield Form('{name}\n  {description}\n  State={state}\n  Version={version:d}\n  Root directory={path}')
+            yield from ({'name': s.getName(), 'description': s.getDescription(), 'state': s.getState(),
+                         'version': s.getVersion(), 'path': s.getPath()} for s in services)
         else:
-            output = ['%-12s%-15s%7d' % (s.getName(), s.getState(), s.getVersion())
-                                       for s in self.owning_service.services()
-                                           if args.service=='all' or args.service==s.getName()]
-            output.insert(0, 'Name        State          Version')
-
-        return output
+            yield Table(('name', 'Name', 11), ('state', 'State', 14), ('version', 'Version', 7, 'd'))
+            yield from ({'name': s.getName(), 'state': s.getState(), 'version': s.getVersion()} for s in services)
 
     def services_list(self):
         slist=['all']
@@ -0,0 +1,43 @@
+from command import Command, CommandInterface, Table
+from metrics import metrics, format_labels, MetricsError
+
+class Stats(Command):
+    def __init__(self, owning_service, version):
+        self.owning_service = owning_service
+        self.interface = CommandInterface('stats', 'List the metrics of commands executed and of the services', version, self,
+                                          {'--prometheus': {'type':str,
+                                                            'help':'also export the metrics in Prometheus text format to this file, '
+                                                                   'or socket (unix:PATH or tcp:HOST:PORT)'},
+                                           '--reset': {'action':'store_true',
+                                                       'help':'zero the metrics counted so far, once listed'}})
+
+    def execute(self, args):
+        output = []
+        if not metrics.enabled:
+            output.append('NOTE: Metrics are disabled (set H8S_METRICS=1 to enable them), so only what the services count anyway is listed')
+
+        output.append(Table(('metric', 'Metric', 60), ('value', 'Value', 12, 'n')))
+        for name, labels, value in metrics.values():
+            output.append({'metric': name + format_labels(labels), 'value': value})
+
+        distributions = metrics.distributions()
+        if distributions:
+            output.append('')
+            output.append(Table(('metric', 'Latency', 60), ('count', 'Count', 8, 'd'), ('mean_ms', 'Mean (ms)', 10, '.2f'),
+                                ('p50_ms', 'p50 (ms)', 9, '.1f'), ('p99_ms', 'p99 (ms)', 9, '.1f')))
+            for name, labels, histogram in distributions:
+                output.append({'metric': name + format_labels(labels), 'count': histogram.count,
+                               'mean_ms': histogram.sum / histogram.count * 1000,
+                               'p50_ms': histogram.quantile(0.5) * 1000, 'p99_ms': histogram.quantile(0.99) * 1000})
+
+        if args.prometheus:
+            try:
+                metrics.export(args.prometheus)
+                output.append(f'Exported the metrics to "{args.prometheus}"')
+            except MetricsError as err:
+                output.append(f'ERROR: {err.data}')
+
+        if args.reset:
+            metrics.reset()
+
+        return output
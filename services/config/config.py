@@ -1,4 +1,4 @@
-import sys, os, importlib
+import sys, os, threading, time
 
 root_dir = sys.path[0]
 lib_root_dir   = os.path.join(root_dir,'lib')
@@ -13,23 +13,23 @@ for dir in range(len(lib_dirs)):
        lib_dirs[dir] = os.path.join(lib_dirs[dir], 'lib') 
     sys.path.insert(1, lib_dirs[dir])
 
-from service import Service
+from catalog import CommandCatalog
+from metrics import metrics
+from service import Service, ServiceProxy
+
+catalog_path = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'h8s', 'catalog.json')
 
 class Config(Service):
     def __init__(self):
         self.service_modules = {}
-        self.SERVICE_MODULES_IDX_MOD = 0
-        self.SERVICE_MODULES_IDX_OBJ = 1
         self.services_dir = os.path.join(root_dir,'services')
+        self.catalog = CommandCatalog(catalog_path, root_dir)
+        self.generation = 0  # bumped whenever the set of commands changes
+        self.changes = []    # FQNs changed by each generation, None if it could be any
+        self.lock = threading.RLock()
+        self.watcher = None
 
-        for service_name in os.listdir(self.services_dir):
-            if not service_name == 'config' and not service_name.startswith('__'):
-                service_dir = os.path.join(self.services_dir, service_name)
-                if os.path.isdir(service_dir): 
-                    service_key = 'services.' + service_name
-                    service_mod = importlib.import_module( service_key )
-                    service_obj = getattr( service_mod, service_name.capitalize() )(service_dir)
-                    self.service_modules[service_key] = [ service_mod, service_obj ]
+        self.add_services()
 
         Service.__init__(self,
                          os.path.join(self.services_dir, 'config'),
@@ -39,11 +39,106 @@ class Config(Service):
 
         self.state = 'initialized'
 
-        self.load_commands()
+        self.catalog_commands(self.catalog)
+        self.catalog.save()
+
+    def add_services(self):
+        """
+        Add a proxy for each service not yet known. Services are only
+        imported, instantiated and started when first needed.
+        """
+        added = False
+        for service_name in self.catalog.service_names(self.services_dir):
+            if not service_name == 'config' and not service_name.startswith('__'):
+                service_key = 'services.' + service_name
+                if service_key not in self.service_modules:
+                    service_dir = os.path.join(self.services_dir, service_name)
+                    self.service_modules[service_key] = ServiceProxy(service_dir, service_key, self.catalog)
+                    added = True
+        return added
+
+    def catalog_depends(self):
+        # the services command lists the services there are
+        return [self.services_dir]
+
+    def refresh(self):
+        """
+        Pick up new services, and reload the commands of those whose
+        command catalog entry is stale, returning the names of the
+        services refreshed
+        """
+        with self.lock:
+            refreshed = []
+            fqns = set()
+            for service in self.services():
+                was = service.command_fqns()
+                if service.refresh_commands(self.catalog):
+                    refreshed.append(service.getServiceName())
+                    fqns |= was | service.command_fqns()
+            if self.add_services():
+                refreshed.append('(new services)')
+                fqns = None
+                if self.watcher:
+                    for service in self.service_modules.values():
+                        self.watcher.watch(service)
+            if refreshed:
+                self._changed(fqns)
+            self.catalog.save()
+        return refreshed
+
+    def watch_commands(self):
+        """
+        Reload commands as soon as their files change, for a CLP that
+        stays up (interactive or daemon)
+        """
+        from watcher import CommandWatcher
+
+        if self.watcher is None:
+            self.watcher = CommandWatcher(self.services(), self._commands_changed)
+            self.watcher.start()
+
+    def _commands_changed(self, service, command_names):
+        with self.lock:
+            was = service.command_fqns()
+            fqns = service.reload_commands(command_names)
+            if fqns:
+                self.catalog.record(service)
+                self.catalog.save()
+                self._changed(was.symmetric_difference(service.command_fqns()) | set(fqns))
+
+    def _changed(self, fqns):
+        self.changes.append(fqns)
+        self.generation += 1
+
+    def changes_since(self, generation):
+        """
+        The FQNs of the commands changed since the given generation, or
+        None if which ones is not known (e.g. services were added)
+        """
+        with self.lock:
+            fqns = set()
+            for changed in self.changes[generation:]:
+                if changed is None:
+                    return None
+                fqns |= changed
+        return fqns
+
+    def find_command(self, fqn):
+        """
+        The interface of the command with the given FQN, or None if there
+        is no such command (any longer)
+        """
+        service_name, _, command_name = fqn.partition('.')
+        service = self if service_name == 'config' else self.service_modules.get('services.'+service_name)
+        if service:
+            for command in service.command_interfaces():
+                if command.getName() == command_name:
+                    return command
+        return None
 
     def services(self):
         for service in self.service_modules:
-            yield self.service_modules[service][ self.SERVICE_MODULES_IDX_OBJ ]
+            yield self.service_modules[service]
         yield self
 
 
@@ -56,9 +151,44 @@ class Config(Service):
     def execute_service_command(self, command, args):
         service,cmd = command.split('.')
 
+        if not metrics.enabled:
+            return self._execute_service_command(service, cmd, args)
+
+        start = time.perf_counter()
+        try:
+            output = self._execute_service_command(service, cmd, args)
+        except Exception:
+            metrics.count('h8s_command_errors_total', command=command)
+            metrics.observe('h8s_command_seconds', time.perf_counter() - start, command=command)
+            raise
+        if isinstance(output, list):
+            metrics.observe('h8s_command_seconds', time.perf_counter() - start, command=command)
+            return output
+
+        # a generator, which is executing the command until it is exhausted
+        return self._timed_output(command, start, output)
+
+    def _timed_output(self, command, start, output):
+        try:
+            yield from output
+        except Exception:
+            metrics.count('h8s_command_errors_total', command=command)
+            raise
+        finally:
+            metrics.observe('h8s_command_seconds', time.perf_counter() - start, command=command)
+
+    def service_command_ordering(self, command, args):
+        service,cmd = command.split('.')
+
+        if service == 'config':
+            return self.command_ordering(cmd, args)
+        return self.service_modules['services.'+service].command_ordering(cmd, args)
+
+    def _execute_service_command(self, service, cmd, args):
+
         if service == 'config':
             output = self.execute_command(cmd, args)
         else:
-            output = self.service_modules['services.'+service][self.SERVICE_MODULES_IDX_OBJ].execute_command(cmd, args)
+            output = self.service_modules['services.'+service].execute_command(cmd, args)
 
         return output
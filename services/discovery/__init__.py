@@ -1 +1,7 @@
-from .discovery import Discovery
+# The service is only imported when it is first asked for, so that
+# loading just its commands (see ServiceProxy) stays cheap
+def __getattr__(name):
+    if name == 'Discovery':
+        from .discovery import Discovery
+        return Discovery
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,28 @@
+import time
+
+from command import Command, CommandInterface, Table
+
+class Members(Command):
+    def __init__(self, owning_service, version):
+        self.owning_service = owning_service
+        self.interface = CommandInterface('members', 'List the nodes of the mesh known, from the membership table, without waiting on the network', version, self,
+                                          {'--service': {'type':str,
+                                                         'help':'only the nodes that have this service'},
+                                           '--alive': {'action':'store_true',
+                                                       'help':'only the nodes alive, not those suspect or dead'}})
+
+    def execute(self, args):
+        now = time.time()
+        yield Table(('hostname', 'Node', 24), ('address', 'Address', 15), ('port', 'Port', 5, 'd'), ('state', 'State', 7),
+                    ('last_seen_s', 'Seen (s)', 8, '.1f'), ('load', 'Load', 5, '.2f'), ('services', 'Services', 0))
+        count = 0
+        for member, state in self.owning_service.get_members():
+            if args.service and args.service not in member.services:
+                continue
+            if args.alive and state != 'alive':
+                continue
+            count += 1
+            yield {'hostname': member.hostname or '?', 'address': member.address, 'port': member.port, 'state': state,
+                   'last_seen_s': now - member.last_seen, 'load': member.load, 'services': ' '.join(member.services),
+                   'node_id': str(member.node_id), 'commands': member.services}
+        yield f'{count} node(s) known'
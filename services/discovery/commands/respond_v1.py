@@ -0,0 +1,29 @@
+from command import Command, CommandInterface
+from services.discovery.discovery_protocol import DiscoveryError, DISCOVERY_PORT
+
+class Respond(Command):
+    def __init__(self, owning_service, version):
+        self.owning_service = owning_service
+        self.interface = CommandInterface('respond', 'Answer the scans of other nodes, for as long as the CLP (e.g. the daemon) runs', version, self,
+                                          {'--port': {'type':int,
+                                                      'default':DISCOVERY_PORT,
+                                                      'help':f'UDP port to answer scans on (default: {DISCOVERY_PORT})'},
+                                           '--interval': {'type':float,
+                                                          'default':1.0,
+                                                          'help':'seconds between gossips to other members (default: 1)'},
+                                           '--fanout': {'type':int,
+                                                        'default':3,
+                                                        'help':'members to gossip to each interval (default: 3)'},
+                                           '--stop': {'action':'store_true',
+                                                      'help':'stop answering scans'}})
+
+    def execute(self, args):
+        if args.stop:
+            self.owning_service.stop_responding()
+            return ['Not answering scans']
+
+        try:
+            self.owning_service.respond(args.port, args.interval, args.fanout)
+        except DiscoveryError as err:
+            return [f'ERROR: {err.data}']
+        return [f'Answering scans, and gossiping, on UDP port {self.owning_service.get_responder_port()}']
@@ -0,0 +1,43 @@
+from command import Command, CommandInterface, Table
+from services.discovery.discovery_protocol import DiscoveryError, DISCOVERY_PORT
+
+class Scan(Command):
+    def __init__(self, owning_service, version):
+        self.owning_service = owning_service
+        self.interface = CommandInterface('scan', 'Discover the nodes of the mesh, by broadcasting a ping they reply to', version, self,
+                                          {'--timeout': {'type':float,
+                                                         'default':1.0,
+                                                         'help':'seconds to collect replies for (default: 1)'},
+                                           '--spread': {'type':float,
+                                                        'default':0.25,
+                                                        'help':'seconds over which the nodes spread their replies (default: 0.25)'},
+                                           '--expect': {'type':int,
+                                                        'help':'stop as soon as this many nodes have replied'},
+                                           '--address': {'type':str,
+                                                         'action':'append',
+                                                         'help':'ping the node at this address, instead of broadcasting (repeatable)'},
+                                           '--port': {'type':int,
+                                                      'default':DISCOVERY_PORT,
+                                                      'help':f'UDP port the nodes answer scans on (default: {DISCOVERY_PORT})'}})
+
+    def execute(self, args):
+        try:
+            nodes, error = self.owning_service.scan(args.timeout, args.spread, args.port,
+                                                    args.address or ['<broadcast>'], args.expect)
+        except DiscoveryError as err:
+            return [f'ERROR: {err.data}']
+
+        output = [Table(('hostname', 'Node', 24), ('address', 'Address', 15), ('load', 'Load', 5, '.2f'), ('cpus', 'CPUs', 4, 'd'),
+                        ('reply_ms', 'Reply (ms)', 10, '.1f'), ('services', 'Services', 0))]
+        for node in nodes:
+            descriptor = node.descriptor
+            output.append({'hostname': descriptor.hostname, 'address': node.addresses[0], 'load': descriptor.load,
+                           'cpus': descriptor.cpus, 'reply_ms': node.reply_time * 1000,
+                           'services': ' '.join(descriptor.services), 'node_id': str(descriptor.node_id),
+                           'addresses': node.addresses, 'commands': descriptor.services})
+
+        if error and not nodes:
+            output.append(f'ERROR: No node replied, the last error being: {error}')
+        else:
+            output.append(f'{len(nodes)} node(s) found')
+        return output
@@ -1,11 +1,30 @@
+import os
+import threading
+
 from service import Service
 
+from .discovery_members import Membership
+from .discovery_protocol import DiscoveryError, DISCOVERY_PORT, current_load, local_descriptor
+
 class Discovery(Service):
     """
     A Discovery service manages joining the mesh and other lifecycle operations
+
+    Nodes find each other by scanning: a ping broadcast over UDP, which
+    every node answering scans (see respond) replies to with a compact
+    binary descriptor of itself (see discovery_protocol). Both run on an
+    event loop of the service's own, in a thread, so that a scan
+    collects the replies of hundreds of nodes within one timeout.
+    (asyncio is only imported when the loop is started, as it is slow to
+    import.)
+
+    The nodes found, and the members of the mesh heard of by gossip while
+    answering scans, are kept in a membership table (see
+    discovery_members), which is on disk between runs, so that the mesh
+    is listed at once, without waiting on the network.
     """
 
-    def __init__(self, path):
+    def __init__(self, path, proxy=None):
 
         Service.__init__(self,
                          path,
@@ -13,3 +32,89 @@ class Discovery(Service):
                          description = 'Discover all nodes in the mesh, and join as a node',
                          version=1)
 
+        self.loop = None
+        self.lock = threading.Lock()
+        self.descriptor = None  # of this node, but for its load, once described
+        self.responder = None   # (transport, DiscoveryResponder) while answering scans
+        self.gossiping = None   # the future of the gossip task, while answering scans
+        self.membership = Membership()
+        self.state = 'initialized'
+
+        self.init_commands(proxy)
+
+    def run(self, coro):
+        """
+        Run a coroutine on the service's event loop, waiting for its result
+        """
+        import asyncio
+
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name='DiscoveryLoop', daemon=True).start()
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def describe(self):
+        """
+        The NodeDescriptor of this node, as of now
+        """
+        if self.descriptor is None:
+            self.descriptor = local_descriptor(os.path.dirname(self.root_dir))
+        return self.descriptor._replace(load=current_load())
+
+    def scan(self, timeout=1.0, spread=0.25, port=DISCOVERY_PORT, addresses=('<broadcast>',), expected=None):
+        """
+        The DiscoveredNodes that replied to a scan (see discovery_aio.scan),
+        and the last error of it, if any
+        """
+        from .discovery_aio import scan
+
+        nodes, error = self.run(scan(timeout, spread, port, addresses, expected))
+        node_id = self.describe().node_id
+        for node in nodes:
+            if node.descriptor.node_id != node_id:
+                self.membership.heard(node.descriptor, node.addresses[0], port)
+        self.membership.save(force=True)
+        return nodes, error
+
+    def respond(self, port=DISCOVERY_PORT, interval=1.0, fanout=3):
+        """
+        Start answering the scans of other nodes, and gossiping with the
+        members of the mesh each interval, for as long as the CLP runs
+        """
+        import asyncio
+        from .discovery_aio import gossip, start_responder
+
+        if self.responder:
+            raise DiscoveryError(f'Already answering scans on UDP port {self.get_responder_port()}')
+        self.responder = self.run(start_responder(self.describe, port, self.membership))
+        self.membership.live = True
+        _, responder = self.responder
+        self.gossiping = asyncio.run_coroutine_threadsafe(gossip(responder, self.membership, interval, fanout, port), self.loop)
+
+    def stop_responding(self):
+
+        if self.gossiping:
+            self.gossiping.cancel()
+            self.gossiping = None
+            self.membership.live = False
+        if self.responder:
+            transport, _ = self.responder
+            self.loop.call_soon_threadsafe(transport.close)
+            self.responder = None
+
+    def get_members(self):
+        """
+        The (Member, state) of every member of the mesh known, by host name
+        """
+        return self.membership.get_members()
+
+    def get_responder_port(self):
+        """
+        The UDP port answered on, or None if scans are not being answered
+        """
+        if not self.responder:
+            return None
+        transport, _ = self.responder
+        return transport.get_extra_info('sockname')[1]
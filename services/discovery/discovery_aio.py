@@ -0,0 +1,208 @@
+import asyncio
+import collections
+import random
+import socket
+import time
+
+from .discovery_protocol import (DiscoveryError, DISCOVERY_PORT, GossipEntry, MAX_GOSSIP_ENTRIES, MSG_GOSSIP, MSG_PING, MSG_REPLY,
+                                 decode_gossip, decode_ping, decode_reply, encode_gossip, encode_ping, encode_reply,
+                                 message_type, services_digest)
+
+# Terminology:
+#   see discovery_protocol and discovery_members
+
+RECEIVE_BUFFER = 1 << 20    # of a scan's socket, to hold the replies of hundreds of nodes at once
+
+DiscoveredNode = collections.namedtuple('DiscoveredNode', ['descriptor', 'addresses', 'reply_time'])
+
+class DiscoveryResponder(asyncio.DatagramProtocol):
+    """
+    A DiscoveryResponder answers the pings of scans with the node's
+    descriptor, as describe() has it then, each after a random delay
+    within the spread the ping asks for.
+
+    With a Membership, it also records the gossip of other members, and
+    the replies to its own pings (see ask), in it.
+    """
+
+    def __init__(self, describe, membership=None):
+        self.describe = describe
+        self.membership = membership
+        self.node_id = describe().node_id
+        self.transport = None
+        self.pings = 0
+        self.gossips = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        msg_type = message_type(data)
+        try:
+            if msg_type == MSG_PING:
+                nonce, spread = decode_ping(data)
+                self.pings += 1
+                reply = encode_reply(nonce, self.describe())
+                asyncio.get_running_loop().call_later(random.uniform(0, spread), self.send, reply, addr)
+            elif self.membership is None:
+                return
+            elif msg_type == MSG_REPLY:
+                _, descriptor = decode_reply(data)
+                if descriptor.node_id != self.node_id:
+                    self.membership.heard(descriptor, addr[0], addr[1])
+            elif msg_type == MSG_GOSSIP:
+                self.gossips += 1
+                entries = decode_gossip(data)
+                for entry in entries:
+                    if entry.node_id == self.node_id:
+                        continue
+                    # the first entry is of the member that sent the gossip
+                    member = self.membership.gossiped(entry, addr[0] if entry is entries[0] else None)
+                    if member:
+                        self.ask(member.address, member.port)
+        except DiscoveryError:
+            return  # e.g. a stray datagram
+
+    def ask(self, address, port):
+        """
+        Ask the node at address and port for its descriptor, the reply
+        to which is recorded in the membership table
+        """
+        self.send(encode_ping(random.getrandbits(32), 0), (address, port))
+
+    def error_received(self, exc):
+        pass  # e.g. the scan is over, and its port closed
+
+    def send(self, datagram, addr):
+        if self.transport and not self.transport.is_closing():
+            self.transport.sendto(datagram, addr)
+
+
+class ScanProtocol(asyncio.DatagramProtocol):
+    """
+    A ScanProtocol collects the replies to the ping of a scan, of each
+    node once (on its node ID) however many of its addresses it replied
+    from, until expected nodes have replied (if it is given)
+    """
+
+    def __init__(self, nonce, expected=None):
+        self.nonce = nonce
+        self.expected = expected
+        self.sent = None
+        self.nodes = {}         # node ID: DiscoveredNode
+        self.replies = 0
+        self.error = None       # the last error, e.g. of sending a ping
+        self.all_replied = asyncio.Event()
+
+    def datagram_received(self, data, addr):
+        try:
+            nonce, descriptor = decode_reply(data)
+        except DiscoveryError:
+            return
+        if nonce != self.nonce:
+            return  # a late reply to an earlier scan
+        self.replies += 1
+
+        node = self.nodes.get(descriptor.node_id)
+        if node is None:
+            self.nodes[descriptor.node_id] = DiscoveredNode(descriptor, [addr[0]], time.monotonic() - self.sent)
+            if self.expected and len(self.nodes) >= self.expected:
+                self.all_replied.set()
+        elif addr[0] not in node.addresses:
+            node.addresses.append(addr[0])
+
+    def error_received(self, exc):
+        self.error = exc
+
+
+async def scan(timeout=1.0, spread=0.25, port=DISCOVERY_PORT, addresses=('<broadcast>',), expected=None):
+    """
+    Ping the nodes listening on port at the addresses (by default, every
+    node of the local network, by broadcast), collecting their replies
+    until timeout, or expected nodes have replied. Returns the nodes, in
+    the order they replied, and the last error (or None).
+    """
+    loop = asyncio.get_running_loop()
+    targets = []
+    for address in addresses:
+        if address == '<broadcast>':
+            targets.append((address, port))
+            continue
+        try:
+            infos = await loop.getaddrinfo(address, port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        except socket.gaierror as err:
+            raise DiscoveryError(f'Cannot resolve "{address}": {err.strerror}')
+        targets.append(infos[0][4])
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        sock.bind(('', 0))
+    except OSError as err:
+        sock.close()
+        raise DiscoveryError(f'Cannot open a socket to scan with: {err.strerror}')
+
+    nonce = random.getrandbits(32)
+    transport, protocol = await loop.create_datagram_endpoint(lambda: ScanProtocol(nonce, expected), sock=sock)
+    try:
+        # the nodes are to have replied by half the timeout, leaving the
+        # other half for the replies to arrive
+        ping = encode_ping(nonce, min(spread, timeout / 2))
+        protocol.sent = time.monotonic()
+        for target in targets:
+            transport.sendto(ping, target)
+        try:
+            await asyncio.wait_for(protocol.all_replied.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+    finally:
+        transport.close()
+
+    return sorted(protocol.nodes.values(), key=lambda node: node.reply_time), protocol.error
+
+async def start_responder(describe, port=DISCOVERY_PORT, membership=None):
+    """
+    Start answering the scans of other nodes on port, returning the
+    transport (to close, to stop) and the DiscoveryResponder, which
+    records gossip in membership, if given
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.create_datagram_endpoint(lambda: DiscoveryResponder(describe, membership),
+                                                   local_addr=('0.0.0.0', port), allow_broadcast=membership is not None)
+    except OSError as err:
+        raise DiscoveryError(f'Cannot answer scans on UDP port {port}: {err.strerror}')
+
+async def gossip(responder, membership, interval=1.0, fanout=3, join_port=DISCOVERY_PORT):
+    """
+    Gossip, each interval, to fanout members of the mesh at random, until
+    cancelled: this node's heartbeat, and the news of the members (see
+    Membership.news). First, the mesh is joined: the members known from
+    the last run are asked for their descriptors, or if none is known, the
+    nodes of the local network are, by a broadcast to join_port.
+    """
+    membership.interval = interval
+    members = [member for member, _ in membership.get_members()]
+    if members:
+        for member in members:
+            responder.ask(member.address, member.port)
+    else:
+        responder.ask('<broadcast>', join_port)
+
+    try:
+        while True:
+            await asyncio.sleep(interval * random.uniform(0.9, 1.1))  # so that nodes started together do not gossip together
+
+            descriptor = responder.describe()
+            port = responder.transport.get_extra_info('sockname')[1]
+            entries = [GossipEntry(descriptor.node_id, int(time.time() * 1000), services_digest(descriptor.services),
+                                   descriptor.load, '', port)]
+            entries += membership.news(MAX_GOSSIP_ENTRIES - 1)
+            datagram = encode_gossip(entries)
+            for member in membership.sample(fanout):
+                responder.send(datagram, (member.address, member.port))
+
+            membership.save()
+    finally:
+        membership.save(force=True)
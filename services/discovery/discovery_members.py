@@ -0,0 +1,244 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+from .discovery_protocol import GossipEntry, MAX_GOSSIP_ENTRIES, NodeDescriptor, services_digest
+
+# Terminology:
+#   member = a node of the mesh this node has heard of, by a scan, a reply
+#            or gossip, as recorded in the membership table
+#   state = how lately a member was last heard of (its heartbeat grew):
+#           alive, suspect (missed a few heartbeats) or dead
+#   news = a member whose heartbeat grew since this node last gossiped it,
+#          which is gossiped on, for it to reach the whole mesh
+#   see also discovery_protocol
+
+# the membership table, kept between runs of the CLP
+members_path = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'h8s', 'members.json')
+
+class Member():
+    """
+    What is known of a member: its descriptor (once asked for), where it
+    answers, its latest heartbeat and when that was heard (by this node's
+    clock, as the member's own is not comparable)
+    """
+
+    def __init__(self, node_id, hostname='', address='', port=0, load=0.0, cpus=0, services=None,
+                 heartbeat=0, digest=None, last_seen=0.0):
+        self.node_id = node_id
+        self.hostname = hostname
+        self.address = address
+        self.port = port
+        self.load = load
+        self.cpus = cpus
+        self.services = services or {}
+        self.heartbeat = heartbeat
+        self.digest = digest        # of the services heard in gossip, to ask for them if not those known
+        self.last_seen = last_seen
+        self.told = 0               # the heartbeat last gossiped on
+        self.told_at = 0.0          # when it was (monotonic)
+        self.asked = 0.0            # when its descriptor was last asked for (monotonic)
+
+    def known(self):
+        """
+        Whether its descriptor is that of its latest gossip
+        """
+        return self.hostname != '' and (self.digest is None or self.digest == services_digest(self.services))
+
+    def descriptor(self):
+
+        return NodeDescriptor(self.node_id, self.hostname, self.load, self.cpus, self.services)
+
+    def gossip_entry(self):
+
+        return GossipEntry(self.node_id, self.heartbeat, services_digest(self.services) if self.digest is None else self.digest,
+                           self.load, self.address, self.port)
+
+    def to_dict(self):
+
+        return {'node_id': str(self.node_id), 'hostname': self.hostname, 'address': self.address, 'port': self.port,
+                'load': self.load, 'cpus': self.cpus, 'services': self.services, 'heartbeat': self.heartbeat,
+                'digest': self.digest, 'last_seen': self.last_seen}
+
+    @classmethod
+    def from_dict(cls, record):
+
+        return cls(uuid.UUID(record['node_id']), record['hostname'], record['address'], record['port'], record['load'],
+                   record['cpus'], record['services'], record['heartbeat'], record['digest'], record['last_seen'])
+
+
+class Membership():
+    """
+    The membership table is every member of the mesh this node has heard
+    of, with its services and how lately it was heard of, so that the
+    mesh is known at once, without a scan, and kept on disk between runs.
+
+    It is kept up to date by gossip rather than by scans: each interval,
+    each node answering scans sends a few members a gossip of its own
+    heartbeat and of the members it heard news of since its last gossip
+    (and a few others, so that news lost on the way is made up for). A member whose
+    gossip carries a digest of services other than those known is asked
+    for its descriptor, once, by a ping to it alone. So a node sends and
+    receives a few small datagrams each interval however large the mesh,
+    and nothing is broadcast but to join a mesh of which no member is known.
+
+    A member is suspect when its heartbeat has not grown for SUSPECT_AFTER
+    intervals (of the gossip, which the table keeps), dead after
+    DEAD_AFTER, and forgotten after forget_after seconds. As a gossip
+    carries at most MAX_GOSSIP_ENTRIES, the heartbeats of a larger mesh
+    take longer to get around, so the first two grow with the mesh beyond
+    that many members. Where the table is read from disk, rather
+    than kept by gossip (e.g. by clp run on its own, while the daemon
+    gossips), they allow for its being written only every SAVE_EVERY.
+    """
+
+    VERSION = 1
+
+    SUSPECT_AFTER = 5   # intervals
+    DEAD_AFTER = 30     # intervals
+    SAVE_EVERY = 10.0   # seconds, at most, between writes of the table to disk
+    RESENT = 2          # members gossiped on each time that are not news
+
+    def __init__(self, path=members_path, forget_after=24 * 3600.0):
+        self.path = path
+        self.forget_after = forget_after
+        self.interval = 1.0
+        self.lock = threading.Lock()
+        self.members = {}   # node ID: Member
+        self.changed = False
+        self.saved = 0.0    # when the table was last written (monotonic)
+        self.live = False   # whether gossip keeps the table, rather than the disk
+
+        try:
+            with open(self.path) as f:
+                table = json.load(f)
+            if table.get('version') == self.VERSION:
+                self.interval = table['interval']
+                for record in table['members']:
+                    member = Member.from_dict(record)
+                    self.members[member.node_id] = member
+        except (IOError, ValueError, KeyError, TypeError):
+            self.members = {}
+
+    def save(self, force=False):
+        """
+        Write the table to disk, if it changed, but no more often than
+        every SAVE_EVERY seconds unless forced
+        """
+        now = time.monotonic()
+        with self.lock:
+            if not self.changed or (not force and now - self.saved < self.SAVE_EVERY):
+                return
+            forgotten = time.time() - self.forget_after
+            for node_id in [node_id for node_id, member in self.members.items() if member.last_seen < forgotten]:
+                del self.members[node_id]
+            table = {'version': self.VERSION, 'interval': self.interval,
+                     'members': [member.to_dict() for member in self.members.values()]}
+            self.changed = False
+            self.saved = now
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(table, f)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError:
+            pass  # the table is still known, until the CLP exits
+
+    def state(self, member, now=None):
+
+        age = (now or time.time()) - member.last_seen - (0 if self.live else self.SAVE_EVERY)
+        scale = max(1.0, len(self.members) / MAX_GOSSIP_ENTRIES)
+        if age < self.SUSPECT_AFTER * self.interval * scale:
+            return 'alive'
+        return 'suspect' if age < self.DEAD_AFTER * self.interval * scale else 'dead'
+
+    def get_members(self):
+        """
+        The (Member, state) of every member, by host name
+        """
+        now = time.time()
+        with self.lock:
+            members = sorted(self.members.values(), key=lambda member: (member.hostname, str(member.node_id)))
+        return [(member, self.state(member, now)) for member in members]
+
+    def heard(self, descriptor, address, port):
+        """
+        Record the descriptor of a member, as it replied from address and port
+        """
+        with self.lock:
+            member = self.members.get(descriptor.node_id)
+            if member is None:
+                member = self.members[descriptor.node_id] = Member(descriptor.node_id)
+            member.hostname = descriptor.hostname
+            member.services = descriptor.services
+            member.digest = services_digest(descriptor.services)
+            member.cpus = descriptor.cpus
+            member.load = descriptor.load
+            member.address, member.port = address, port
+            member.last_seen = time.time()
+            self.changed = True
+
+    def gossiped(self, entry, address=None):
+        """
+        Record the gossip entry of a member (sent by the member itself, from
+        address, if given), returning the member if its descriptor is to be
+        asked for, or else None
+        """
+        now = time.monotonic()
+        with self.lock:
+            member = self.members.get(entry.node_id)
+            if member is None:
+                if not (address or entry.address):
+                    return None
+                member = self.members[entry.node_id] = Member(entry.node_id, address=address or entry.address, port=entry.port)
+            if entry.heartbeat > member.heartbeat:
+                member.heartbeat = entry.heartbeat
+                member.digest = entry.digest
+                member.load = entry.load
+                member.last_seen = time.time()
+                self.changed = True
+            if address:
+                member.address, member.port = address, entry.port
+            if member.known() or now - member.asked < self.SUSPECT_AFTER * self.interval:
+                return None
+            member.asked = now
+            return member
+
+    def news(self, count):
+        """
+        The gossip entries of up to count members: those with news, the
+        longest untold first (so that, however many there are, each is told
+        in turn), and RESENT others at random, so that news lost on the way
+        still reaches every member
+        """
+        now = time.monotonic()
+        with self.lock:
+            members = [member for member in self.members.values() if member.heartbeat]
+            news = sorted((member for member in members if member.heartbeat > member.told),
+                          key=lambda member: member.told_at)[:max(count - self.RESENT, 0)]
+            others = [member for member in members if member.heartbeat <= member.told]
+            news += random.sample(others, min(len(others), count - len(news)))[:self.RESENT]
+            for member in news:
+                member.told, member.told_at = member.heartbeat, now
+            return [member.gossip_entry() for member in news]
+
+    def sample(self, count):
+        """
+        Up to count members to gossip to, at random, alive ones first, then
+        suspect ones, or else one dead one, so that a mesh split in two
+        (e.g. by a network outage) is made whole again
+        """
+        now = time.time()
+        with self.lock:
+            members = list(self.members.values())
+        states = {'alive': [], 'suspect': [], 'dead': []}
+        for member in members:
+            states[self.state(member, now)].append(member)
+        chosen = random.sample(states['alive'], min(count, len(states['alive'])))
+        chosen += random.sample(states['suspect'], min(count - len(chosen), len(states['suspect'])))
+        if not chosen and states['dead']:
+            chosen.append(random.choice(states['dead']))
+        return chosen
@@ -0,0 +1,205 @@
+import collections
+import os
+import socket
+import struct
+import uuid
+import zlib
+
+from service import Service
+
+# Terminology:
+#   node = a host of the mesh running the CLP, as found by a scan
+#   ping = the datagram a scan broadcasts, which every node replies to
+#   descriptor = what a node tells of itself in its reply: its ID, host
+#                name, load, and the commands (and versions) of each of
+#                its services
+#   spread = the time over which the nodes are to spread their replies,
+#            so that hundreds of them do not all reply at the same moment
+#   heartbeat = a node's clock (ms) when it last gossiped, which only ever
+#               grows, so that the latest news of a node is told apart
+#   gossip = the datagram a node sends a few members each interval: its
+#            own heartbeat, and those of the members it heard news of lately
+#   digest = a CRC of a node's services and their commands, in gossip, so
+#            that a node's descriptor is only asked for again when it changed
+
+DISCOVERY_PORT = 50000
+
+MAGIC = b'H8S'
+PROTOCOL_VERSION = 1
+MSG_PING = 0x01
+MSG_REPLY = 0x02
+MSG_GOSSIP = 0x03
+
+HEADER = struct.Struct('!3sBBI')    # magic, protocol version, msg type, nonce of the scan
+PING = struct.Struct('!H')          # spread (ms)
+NODE = struct.Struct('!16sHB')      # node ID, 1 min load average (hundredths), CPUs
+COUNT = struct.Struct('!B')         # of strings and lists, which are prefixed by it
+GOSSIP_ENTRY = struct.Struct('!16sQIH4sH')  # node ID, heartbeat, digest, load (hundredths), IPv4 address, port
+
+MAX_GOSSIP_ENTRIES = 32             # so that a gossip fits in a datagram that is not fragmented
+
+# the node ID, where there is no /etc/machine-id
+node_id_path = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'h8s', 'node-id')
+
+NodeDescriptor = collections.namedtuple('NodeDescriptor', ['node_id', 'hostname', 'load', 'cpus', 'services'])
+# services are {service name: {command name: version}}
+
+GossipEntry = collections.namedtuple('GossipEntry', ['node_id', 'heartbeat', 'digest', 'load', 'address', 'port'])
+# the address is '' for the node that sent the gossip, which is wherever it came from
+
+class DiscoveryError(Exception):
+    def __init__(self, msg):
+        self.data = msg
+
+def encode_ping(nonce, spread):
+    return HEADER.pack(MAGIC, PROTOCOL_VERSION, MSG_PING, nonce) + PING.pack(min(int(spread * 1000), 0xffff))
+
+def decode_ping(data):
+    """
+    The nonce and spread (in seconds) of a ping
+    """
+    nonce = _decode_header(data, MSG_PING)
+    try:
+        spread_ms, = PING.unpack_from(data, HEADER.size)
+    except struct.error:
+        raise DiscoveryError('Truncated ping')
+    return nonce, spread_ms / 1000
+
+def encode_reply(nonce, descriptor):
+    return b''.join([HEADER.pack(MAGIC, PROTOCOL_VERSION, MSG_REPLY, nonce),
+                     NODE.pack(descriptor.node_id.bytes, min(int(descriptor.load * 100), 0xffff), min(descriptor.cpus, 0xff)),
+                     _encode_str(descriptor.hostname),
+                     _encode_services(descriptor.services)])
+
+def decode_reply(data):
+    """
+    The nonce of the scan replied to, and the NodeDescriptor of the reply
+    """
+    nonce = _decode_header(data, MSG_REPLY)
+    try:
+        node_id, load, cpus = NODE.unpack_from(data, HEADER.size)
+        offset = HEADER.size + NODE.size
+        hostname, offset = _decode_str(data, offset)
+        services = {}
+        service_count, offset = _decode_count(data, offset)
+        for _ in range(service_count):
+            service_name, offset = _decode_str(data, offset)
+            commands = services[service_name] = {}
+            command_count, offset = _decode_count(data, offset)
+            for _ in range(command_count):
+                command_name, offset = _decode_str(data, offset)
+                commands[command_name], offset = _decode_count(data, offset)
+    except struct.error:
+        raise DiscoveryError('Truncated or malformed reply')
+    return nonce, NodeDescriptor(uuid.UUID(bytes=node_id), hostname, load / 100, cpus, services)
+
+def encode_gossip(entries):
+    parts = [HEADER.pack(MAGIC, PROTOCOL_VERSION, MSG_GOSSIP, 0), COUNT.pack(len(entries[:MAX_GOSSIP_ENTRIES]))]
+    for entry in entries[:MAX_GOSSIP_ENTRIES]:
+        parts.append(GOSSIP_ENTRY.pack(entry.node_id.bytes, entry.heartbeat, entry.digest, min(int(entry.load * 100), 0xffff),
+                                       socket.inet_aton(entry.address or '0.0.0.0'), entry.port))
+    return b''.join(parts)
+
+def decode_gossip(data):
+    """
+    The GossipEntries of a gossip, the first being of the node that sent it
+    """
+    _decode_header(data, MSG_GOSSIP)
+    try:
+        count, offset = _decode_count(data, HEADER.size)
+        entries = []
+        for _ in range(count):
+            node_id, heartbeat, digest, load, address, port = GOSSIP_ENTRY.unpack_from(data, offset)
+            offset += GOSSIP_ENTRY.size
+            address = socket.inet_ntoa(address)
+            entries.append(GossipEntry(uuid.UUID(bytes=node_id), heartbeat, digest, load / 100,
+                                       '' if address == '0.0.0.0' else address, port))
+    except struct.error:
+        raise DiscoveryError('Truncated or malformed gossip')
+    return entries
+
+def message_type(data):
+    """
+    The type of a discovery message (MSG_*), or None if it is not one
+    """
+    if len(data) < HEADER.size or data[:len(MAGIC)] != MAGIC or data[len(MAGIC)] != PROTOCOL_VERSION:
+        return None
+    return data[len(MAGIC) + 1]
+
+def services_digest(services):
+    return zlib.crc32(_encode_services(services))
+
+def local_descriptor(services_dir):
+    """
+    The NodeDescriptor of this node, with the commands of each service
+    found (by their files) in services_dir, none of which is imported
+    """
+    services = {}
+    for service_name in sorted(os.listdir(services_dir)):
+        path = os.path.join(services_dir, service_name)
+        if os.path.isdir(path) and not service_name.startswith(('_', '.')):
+            service = Service(path, name=service_name, description=None, version=None)
+            services[service_name] = dict(sorted(service.scan_commands().items()))
+    return NodeDescriptor(local_node_id(), socket.gethostname(), current_load(), os.cpu_count() or 1, services)
+
+def current_load():
+    try:
+        return os.getloadavg()[0]
+    except OSError:
+        return 0.0
+
+def local_node_id():
+    """
+    The ID of this node: that of the machine, or else one made up the
+    first time it is asked for, and kept
+    """
+    try:
+        with open('/etc/machine-id') as f:
+            return uuid.UUID(hex=f.read().strip())
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(node_id_path) as f:
+            return uuid.UUID(hex=f.read().strip())
+    except (OSError, ValueError):
+        pass
+    node_id = uuid.uuid4()
+    try:
+        os.makedirs(os.path.dirname(node_id_path), exist_ok=True)
+        with open(node_id_path, 'w') as f:
+            f.write(node_id.hex)
+    except OSError:
+        pass  # a new one next time, then
+    return node_id
+
+def _decode_header(data, msg_type):
+    try:
+        magic, version, found_type, nonce = HEADER.unpack_from(data)
+    except struct.error:
+        raise DiscoveryError('Truncated header')
+    if magic != MAGIC or version != PROTOCOL_VERSION or found_type != msg_type:
+        raise DiscoveryError(f'Not a discovery message of type {msg_type} (version {PROTOCOL_VERSION})')
+    return nonce
+
+def _encode_services(services):
+    parts = [COUNT.pack(len(services))]
+    for service_name, commands in services.items():
+        parts.append(_encode_str(service_name))
+        parts.append(COUNT.pack(len(commands)))
+        for command_name, version in commands.items():
+            parts.append(_encode_str(command_name))
+            parts.append(COUNT.pack(min(version, 0xff)))
+    return b''.join(parts)
+
+def _encode_str(text):
+    encoded = text.encode()[:0xff]
+    return COUNT.pack(len(encoded)) + encoded
+
+def _decode_str(data, offset):
+    length, offset = _decode_count(data, offset)
+    if offset + length > len(data):
+        raise struct.error('string beyond the end of the reply')
+    return data[offset:offset+length].decode(errors='replace'), offset + length
+
+def _decode_count(data, offset):
+    return COUNT.unpack_from(data, offset)[0], offset + COUNT.size
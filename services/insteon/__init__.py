@@ -1 +1,10 @@
-from .insteon import Insteon
+# The service is only imported when it is first asked for, so that
+# loading just its commands (see ServiceProxy) stays cheap
+def __getattr__(name):
+    if name == 'Insteon':
+        from .insteon import Insteon
+        return Insteon
+    if name in ('InsteonPLM', 'InsteonPLMConfigError'):
+        from . import insteon_plm
+        return getattr(insteon_plm, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1,9 +1,8 @@
-from command import Command, CommandInterface
+from command import Command, CommandInterface, Form, Table
 
 class Commands(Command):
     def __init__(self, owning_service, version):
         self.owning_service = owning_service
-        self.plm = owning_service.get_plm()
 
         self.interface = CommandInterface('commands', 'List Insteon PLM commands', version, self,
                                           {'type': {'type':str, 
@@ -15,18 +14,16 @@ class Commands(Command):
 
     def execute(self, args):
         if args.type == 'send':
-            cmds = self.plm.get_send_cmds()
+            cmds = self.owning_service.get_plm().get_send_cmds()
             if args.verbose:
-                output = [f'{cmd:30}\n  {cmds[cmd][2]}\n  Command: {cmds[cmd][0]}\n  Syntax:  {cmds[cmd][1]}' for cmd in cmds]
+                yield Form('{name:30}\n  {description}\n  Command: {command}\n  Syntax:  {syntax}')
             else:
-                output = [f'{cmd:30} {cmds[cmd][0]}' for cmd in cmds]
-                output.insert(0, '%-30s %s' % ("Name", "Hex Command String"))
+                yield Table(('name', 'Name', 30), ('command', 'Hex Command String', 0))
+            yield from ({'name': cmd, 'command': cmds[cmd][0], 'syntax': cmds[cmd][1], 'description': cmds[cmd][2]} for cmd in cmds)
         else:
-            cmds = self.plm.get_receive_cmds()
+            cmds = self.owning_service.get_plm().get_receive_cmds()
             if args.verbose:
-                output = [f'\n{cmds[cmd][2]}\n  Command: {cmd}\n  Msg len: {cmds[cmd][0]} bytes\n  Msg syntax: "{cmds[cmd][1]}"' for cmd in cmds]
+                yield Form('\n{description}\n  Command: {command}\n  Msg len: {length} bytes\n  Msg syntax: "{syntax}"')
             else:
-                output = [f'{cmd:8} {cmds[cmd][2]}' for cmd in cmds]
-                output.insert(0, '%-8s %s' % ("Command", "Description"))
-
-        return output
+                yield Table(('command', 'Command', 8), ('description', 'Description', 0))
+            yield from ({'command': cmd, 'length': cmds[cmd][0], 'syntax': cmds[cmd][1], 'description': cmds[cmd][2]} for cmd in cmds)
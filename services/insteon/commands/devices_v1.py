@@ -1,11 +1,10 @@
-from command import Command, CommandInterface
+from command import Command, CommandInterface, Form, Table
 
 class Devices(Command):
 
     def __init__(self, owning_service, version):
 
         self.owning_service = owning_service
-        self.plm = owning_service.get_plm()
 
         self.interface = CommandInterface('devices', 'List Insteon devices', version, self,
                                           {'type': {'type':str, 
@@ -18,21 +17,14 @@ class Devices(Command):
                                                          'help':'additional detail on each device'}})
 
     def execute(self, args):
-        devices = self.plm.get_devices()
+        devices = self.owning_service.get_plm().get_devices()
 
-        output_mask = '%s  %-19s %-33s %-23s %s'
         if args.verbose:
-            output = []
+            yield Form('ID = {id}\n  Type       : {type}\n  Name       : {name}\n  Room       : {room}\n  Location   : {location}\n'
+                       '  Category   : {category}\n  Subcategory: {subcategory}')
         else:
-            output=[output_mask % ('DeviceID','Type','Name','Room','Location')]
+            yield Table(('id', 'DeviceID', 9), ('type', 'Type', 19), ('name', 'Name', 33), ('room', 'Room', 23), ('location', 'Location', 0))
 
-        for dev in devices:
-            if args.type == 'all' or devices[dev]['type'].lower().endswith(args.type):
-                if args.verbose:
-                    output.append('ID = %s\n  Type       : %s\n  Name       : %s\n  Room       : %s\n  Location   : %s\n  Category   : %s\n  Subcategory: %s' % \
-                                  (dev,devices[dev]['type'],devices[dev]['name'],devices[dev]['room'],
-                                   devices[dev]['location'],devices[dev]['properties']['category'],devices[dev]['properties']['subcategory']))
-                else:
-                    output.append(output_mask % (dev,devices[dev]['type'],devices[dev]['name'],devices[dev]['room'],devices[dev]['location']))
-
-        return output
+        for dev in devices.select(type_name=None if args.type == 'all' else args.type):
+            yield {'id': dev.id, 'type': dev.type, 'name': dev.name, 'room': dev.room, 'location': dev.location,
+                   'category': dev.category, 'subcategory': dev.subcategory}
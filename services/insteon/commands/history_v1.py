@@ -0,0 +1,80 @@
+import collections
+import re
+import time
+
+from datetime import datetime
+
+from command import Command, CommandInterface, Table
+from devices import pack_id, unpack_id
+
+re_relative_time = re.compile(r'^(\d+(?:\.\d+)?)([smhd])$')
+SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+class History(Command):
+    starts_service = False
+
+    def __init__(self, owning_service, version):
+        self.owning_service = owning_service
+        self.interface = CommandInterface('history', 'List Insteon messages received in a time range', version, self,
+                                          {'--since': {'type':str,
+                                                       'default':'1h',
+                                                       'help':'start of the time range: how long ago (e.g. 30s, 15m, 2h, 1d), or YYYY-MM-DDTHH:MM:SS'},
+                                           '--until': {'type':str,
+                                                       'help':'end of the time range, as for --since (default: now)'},
+                                           '--filter_command': {'type':str,
+                                                                'dest':'num',
+                                                                'action':'store',
+                                                                'help':'show only received msgs of this command number'},
+                                           '--device': {'type':str,
+                                                        'help':'show only msgs from or to this device ID (e.g. 18.3D.DA)'},
+                                           '--limit': {'type':int,
+                                                       'default':100,
+                                                       'help':'show at most this many msgs, the latest ones '
+                                                              '(0 for all, shown as they are read)'}})
+
+    def execute(self, args):
+        # the log is on disk, so the service is not started (and no PLM
+        # looked for) just to read it
+        plm = self.owning_service.resolve().get_plm()
+        if not plm:
+            yield 'PLM is not configured'
+            return
+
+        now = time.time()
+        try:
+            start = self._parse_time(args.since, now)
+            end = self._parse_time(args.until, now) if args.until else float('inf')
+            cmd_num = int(args.num, 16) if args.num else None
+            dev_key = pack_id(args.device) if args.device else None
+        except ValueError as err:
+            yield f'ERROR: {err}'
+            return
+
+        events = plm.get_history().query(start, end, cmd_num, dev_key)
+        if args.limit:
+            events = collections.deque(events, maxlen=args.limit)
+
+        devices = plm.get_devices()
+        yield Table(('time', 'Time', 23), ('cmd_num', 'Cmd', 3, '02x'), ('from', 'From', 34), ('to', 'To', 34),
+                    ('msg_flags', 'Flags', 5, '02x'), ('cmd1', 'Cmd1', 4, '02x'), ('cmd2', 'Cmd2', 4, '02x'))
+        for event in events:
+            yield {'time': datetime.fromtimestamp(event.timestamp).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+                   'cmd_num': event.cmd_num,
+                   'from': self._device(devices, event.from_key),
+                   'to': self._device(devices, event.to_key),
+                   'msg_flags': event.msg_flags, 'cmd1': event.cmd1, 'cmd2': event.cmd2}
+
+    def _device(self, devices, dev_key):
+        if not dev_key:
+            return ''
+        device = devices.get(dev_key)
+        return f'{unpack_id(dev_key)} ({device.name if device else "unknown"})'
+
+    def _parse_time(self, text, now):
+        m = re_relative_time.match(text)
+        if m:
+            return now - float(m.group(1)) * SECONDS[m.group(2)]
+        try:
+            return datetime.fromisoformat(text).timestamp()
+        except ValueError:
+            raise ValueError(f'Not a time: "{text}"')
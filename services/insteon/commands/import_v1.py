@@ -0,0 +1,26 @@
+from command import Command, CommandInterface
+from services.insteon import InsteonPLMConfigError
+
+class Import(Command):
+
+    def __init__(self, owning_service, version):
+
+        self.owning_service = owning_service
+
+        self.interface = CommandInterface('import', 'Import Insteon devices from a HouseLinc settings export', version, self,
+                                          {'houselinc_file': {'type':str,
+                                                              'action':'store',
+                                                              'help':'HouseLinc settings export (XML)'}})
+
+    def execute(self, args):
+        try:
+            changed, removed = self.owning_service.get_plm().import_devices(args.houselinc_file)
+        except (OSError, SyntaxError) as err:   # ParseError is a SyntaxError
+            return [f'ERROR: Cannot import "{args.houselinc_file}": {err}']
+        except InsteonPLMConfigError as err:
+            return [f'ERROR: Cannot import "{args.houselinc_file}": {err.data}']
+
+        output = [f'Added or changed: {dev_id}' for dev_id in changed]
+        output += [f'Removed: {dev_id}' for dev_id in removed]
+        output.append(f'{len(changed)} devices added or changed, {len(removed)} removed')
+        return output
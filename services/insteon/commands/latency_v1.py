@@ -0,0 +1,24 @@
+from command import Command, CommandInterface, Form, Table
+
+class Latency(Command):
+    def __init__(self, owning_service, version):
+        self.owning_service = owning_service
+        self.interface = CommandInterface('latency', 'List latency of commands sent to the Insteon PLM', version, self,
+                                          {'--verbose': {'action':'store_true',
+                                                         'help':'additional detail on each command'}})
+
+    def execute(self, args):
+        if self.owning_service.is_initialized():
+            stats = self.owning_service.get_plm().get_send_stats()
+            if args.verbose:
+                output = [Form('{name}\n  Sent: {count}  NAKs: {naks}  Timeouts: {timeouts}\n'
+                               '  Latency (ms): mean={mean_ms:.1f} p50={p50_ms:.1f} p99={p99_ms:.1f} max={max_ms:.1f}')]
+            else:
+                output = [Table(('name', 'Name', 30), ('count', 'Sent', 7, 'd'), ('p50_ms', 'p50 (ms)', 9, '.1f'), ('p99_ms', 'p99 (ms)', 9, '.1f'))]
+            output += [{'name': cmd, 'count': s['count'], 'naks': s['naks'], 'timeouts': s['timeouts'],
+                        'mean_ms': s['mean']*1000, 'p50_ms': s['p50']*1000, 'p99_ms': s['p99']*1000, 'max_ms': s['max']*1000}
+                           for cmd, s in stats.items()]
+        else:
+            output = ['PLM is not initialized']
+
+        return output
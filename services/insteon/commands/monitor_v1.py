@@ -11,8 +11,7 @@ class Monitor(Command):
 
     def execute(self, args):
         if self.owning_service.is_initialized():
-            plm = self.owning_service.get_plm()
-            plm.monitor(args.num)
+            self.owning_service.monitor(args.num)
             ret = ['Monitoring terminated']
         else:
             ret = ['PLM is not initialized']
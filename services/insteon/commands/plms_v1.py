@@ -0,0 +1,43 @@
+from command import Command, CommandInterface, Table
+from devices import unpack_id
+
+class Plms(Command):
+    def __init__(self, owning_service, version):
+        self.owning_service = owning_service
+        self.interface = CommandInterface('plms', 'List the Insteon PLMs connected, and the devices routed to each', version, self,
+                                          {'--verbose': {'action':'store_true',
+                                                         'help':'list the hops from each PLM to each device heard from'}})
+
+    def execute(self, args):
+        if not self.owning_service.is_initialized():
+            return ['PLM is not initialized']
+
+        plm = self.owning_service.get_plm()
+        if not hasattr(plm, 'get_members'):  # e.g. the asyncio transport
+            return [Table(('plm_id', 'PLM ID', 10), ('port', 'Port', 50)), {'plm_id': plm.plm_id, 'port': plm.port}]
+
+        members = plm.get_members()
+        routes = plm.routes.routes()
+        routed = {member: 0 for member in members}
+        for dev_routes in routes.values():
+            best = min((m for m in dev_routes if m in routed), key=dev_routes.get, default=None)
+            if best is not None:
+                routed[best] += 1
+
+        output = [Table(('plm_id', 'PLM ID', 10), ('port', 'Port', 50), ('queued', 'Queued', 7, 'd'), ('devices', 'Devices', 8, 'd'))]
+        for member in members:
+            output.append({'plm_id': member.plm_id, 'port': member.port,
+                           'queued': member.sendq.backlog() if member.sendq else 0, 'devices': routed[member]})
+
+        if args.verbose:
+            # the hops from each PLM to each device, by PLM ID
+            devices = plm.get_devices()
+            output.append('')
+            output.append(Table(('device', 'Device', 8), ('name', 'Name', 35),
+                                *((member.plm_id, member.plm_id, 10, '.2f') for member in members)))
+            for dev_key in sorted(routes):
+                device = devices.get(dev_key)
+                record = {'device': unpack_id(dev_key), 'name': device.name if device else 'unknown'}
+                record.update((member.plm_id, routes[dev_key].get(member)) for member in members)
+                output.append(record)
+        return output
@@ -1,4 +1,4 @@
-from command import Command, CommandInterface
+from command import Command, CommandInterface, Form
 
 class Send_cmd(Command):
     def __init__(self, owning_service, version):
@@ -13,17 +13,25 @@ class Send_cmd(Command):
     def execute(self, args):
         if self.owning_service.is_initialized():
             if len(args.command_string) > 1:
-                cmd_args = args.command_string[1].decode('hex')
+                cmd_args = ''.join(args.command_string[1:])
             else:
                 cmd_args = ''
 
-            plm = self.owning_service.get_plm()
-            success, response = plm.send_command(args.command_string[0], cmd_args)
-            if success: 
-                ret = ['  --> %s = %s' % (key,''.join('\\x'+c.encode('hex') for c in response[key])) for key in response]
+            response = self.owning_service.send_command(args.command_string[0], cmd_args)
+            if response: 
+                record = {key: response[key] for key in response}
+                ret = [Form('\n'.join(f'  --> {key} = {{{key}}}' for key in record)), record]
             else:
                 ret = ['PLM command execution failure']
         else:
             ret = ['PLM is not initialized']
 
         return ret
+
+    def ordering(self, args):
+        # commands to a device are sent in order, and to different devices concurrently
+        plm = self.owning_service.resolve().get_plm()  # not connected until executed
+        dev_key = plm.device_of(args.command_string[0], ''.join(args.command_string[1:])) if plm else None
+        if dev_key is None:
+            return Command.ordering(self, args)
+        return (self.owning_service.getServiceName(), f'{dev_key:06X}')
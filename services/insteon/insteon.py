@@ -1,12 +1,24 @@
-from .insteon_plm import InsteonPLM, InsteonPLMConfigError
+import queue
+import threading
+
+from .insteon_group import InsteonPLMGroup
+from .insteon_plm import InsteonPLMConfigError, configured_transport
 from service import Service
 
 class Insteon(Service):
     """
     An Insteon is a service that manages an Insteon network of devices.
+
+    The PLM is talked to either by an InsteonPLM, with its own reader and
+    sender threads, or by an AsyncInsteonPLM on an event loop the service
+    runs in a thread of its own, as chosen by IM_TRANSPORT in im_parms.json.
+    With threads, there can be several PLMs (see IM_PORTS), which an
+    InsteonPLMGroup drives as one.
+    Commands go through send_command and monitor here to use either one.
+    (asyncio is only imported when it is chosen, as it is slow to import.)
     """
 
-    def __init__(self, path): 
+    def __init__(self, path, proxy=None):
     
         Service.__init__(self,
                          path,
@@ -14,9 +26,36 @@ class Insteon(Service):
                          description = 'Manages the devices, scenes, and schedules of a network of Insteon devices', 
                          version=1)
 
+        self.loop = None
+        self.state = 'uninitialized'
+
         try:
-            self.plm = InsteonPLM()
-            self.plm.connect()
+            if configured_transport() == 'asyncio':
+                from .insteon_aio import AsyncInsteonPLM
+                self.plm = AsyncInsteonPLM()
+            else:
+                self.plm = InsteonPLMGroup()
+        except InsteonPLMConfigError as PLMerr:
+            print(f'Insteon PLM config error: {PLMerr.data}')
+            self.plm = None
+
+        self.init_commands(proxy)
+
+    def start(self):
+        """
+        Find and connect to the PLM, which is left until a command of the
+        service is executed, since probing the USB ports takes a while
+        """
+
+        if not self.plm:
+            return
+
+        try:
+            if self.plm.IMParms.get('IM_TRANSPORT') == 'asyncio':
+                self._start_loop()
+                self.run(self.plm.connect())
+            else:
+                self.plm.connect()
         except InsteonPLMConfigError as PLMerr:
             print(f'Insteon PLM config error: {PLMerr.data}')
             self.state = 'uninitialized'
@@ -24,8 +63,6 @@ class Insteon(Service):
             print('Insteon PLM found and configured successfully')
             self.state = 'initialized'
 
-        self.load_commands()
-
 
     def get_plm(self):
 
@@ -35,3 +72,53 @@ class Insteon(Service):
 
         return self.state == 'initialized'
 
+    def is_async(self):
+
+        return self.loop is not None
+
+    def _start_loop(self):
+        import asyncio
+
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name='InsteonLoop', daemon=True).start()
+
+    def run(self, coro):
+        """
+        Run a coroutine on the service's event loop, waiting for its result
+        """
+        import asyncio
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def send_command(self, cmd, args=''):
+
+        if self.is_async():
+            return self.run(self.plm.send_command(cmd, args))
+        return self.plm.send_command(cmd, args)
+
+    def send_commands(self, cmds):
+
+        if self.is_async():
+            return self.run(self.plm.send_commands(cmds))
+        return self.plm.send_commands(cmds)
+
+    def monitor(self, filtered_cmd_num):
+
+        if not self.is_async():
+            self.plm.monitor(filtered_cmd_num)
+        elif filtered_cmd_num is None or filtered_cmd_num in self.plm.get_receive_cmds():
+            import asyncio
+
+            messages = queue.Queue()
+
+            async def relay():
+                async for cmd_num, msg in self.plm.monitor(filtered_cmd_num):
+                    messages.put((cmd_num, msg))
+
+            relaying = asyncio.run_coroutine_threadsafe(relay(), self.loop)
+            try:
+                self.plm.show_messages(filtered_cmd_num, messages)
+            finally:
+                relaying.cancel()
+        else:
+            print(f'ERROR: Not a valid command on which to filter received messages: "{filtered_cmd_num}".')
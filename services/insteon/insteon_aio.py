@@ -0,0 +1,299 @@
+import asyncio
+import collections
+import serial
+import threading
+
+from metrics import metrics
+from ports import PortInventory
+
+from .insteon_plm import InsteonPLM, InsteonPLMConfigError
+from .insteon_reader import PLMDispatcher
+from .insteon_sendq import CommandStats
+
+# Terminology:
+#   IM = Insteon PLM
+
+class AsyncInsteonPLM(InsteonPLM):
+    """
+    An AsyncInsteonPLM talks to the PLM just as an InsteonPLM does, but
+    from an asyncio event loop instead of a reader thread and a sender
+    thread. The serial port's fd is watched with loop.add_reader, and
+    sending commands and monitoring are coroutines, so any number of them
+    can be waiting on the PLM from the one thread running the loop.
+    With IM_RECONNECT, a task reconnects to the PLM once the connection
+    to it is lost, rather than a supervisor thread.
+
+    NOTE: Other than the configuration getters, the methods of an
+          AsyncInsteonPLM must be called from its event loop's thread.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.loop = None
+        self.inflight = None
+        self.online = None          # set while connected, an asyncio.Event
+        self.reconnecting = None    # task reconnecting to the PLM
+        self.stats = collections.defaultdict(CommandStats)
+
+    async def connect(self, port=None):
+
+        self.disconnect()
+
+        self.loop = asyncio.get_running_loop()
+        self.dispatcher = PLMDispatcher(self.decoder, self.layouts, self.loop.create_future)
+        self.inflight = asyncio.Semaphore(self.IMParms['IM_MAX_INFLIGHT'])
+        self.online = asyncio.Event()
+
+        device = port or self.IMParms.get('IM_PORT') or self._last_port() or \
+                     await self.loop.run_in_executor(None, self._find_port)
+        if device:
+            self._open_port(device, 0)  # reads never block, the loop says when there is data
+
+        if self.plm:
+            self._start_reading()
+            self._start_recording()
+            self.online.set()
+            response = await self.send_command('GET_VERSION')
+            if response:
+                self._show_version(response)
+                self._remember_port(device)
+                self.connections += 1
+            else:
+                print('  --> failed to send IM command to serial port')
+                self.disconnect() # assume not a PLM on this port
+
+        if not self.plm:
+            raise InsteonPLMConfigError(f'Could not find a PLM on "{device}"' if device else
+                                        'Could not find a PLM attached to a USB port')
+
+    def disconnect(self):
+
+        if self.reconnecting:
+            self.reconnecting.cancel()
+            self.reconnecting = None
+        if self.online:
+            self.online.clear()
+        if self.plm and self.loop:
+            self.loop.remove_reader(self.plm.fileno())
+            self.dispatcher.connection_lost(None)
+        super().disconnect()
+
+    def _start_reading(self):
+
+        self.decoder.reset()
+        self.loop.add_reader(self.plm.fileno(), self._data_ready)
+
+    def _data_ready(self):
+
+        try:
+            data = self.plm.read(self.plm.in_waiting or 1)
+        except serial.SerialException as err:  # e.g. PLM unplugged
+            self._connection_lost(err)
+            return
+
+        for cmd_num, body in self.decoder.decode(data):
+            self.dispatcher.dispatch(cmd_num, body)
+
+    def _connection_lost(self, err):
+        """
+        The PLM is gone (e.g. unplugged): reconnect to it, with IM_RECONNECT,
+        holding the commands sent meanwhile, or else disconnect
+        """
+        print(f'ERROR: Lost connection to PLM: {err}')  # TODO: convert to a log write
+        if metrics.enabled:
+            metrics.count('insteon_plm_connections_lost_total')
+        if not self.IMParms.get('IM_RECONNECT'):
+            self.disconnect()
+            return
+
+        self.online.clear()
+        self.loop.remove_reader(self.plm.fileno())
+        self.dispatcher.connection_lost(err)
+        try:
+            self.plm.close()
+        except (OSError, serial.SerialException):
+            pass
+        self.plm = None
+        self.reconnecting = self.loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        """
+        Reconnect to the PLM as InsteonPLM's supervisor does: after a
+        backoff doubling with each failure, or as soon as a serial device
+        is plugged in
+        """
+        inventory = PortInventory.shared()
+        started = self.loop.time()
+        backoff = self.IMParms['IM_RECONNECT_BACKOFF']
+        stopped = threading.Event()
+        try:
+            generation = inventory.generation()
+            while not await self._reopen():
+                waiting = self.loop.run_in_executor(None, inventory.wait_for_port, generation, backoff, stopped.is_set)
+                try:
+                    plugged = await asyncio.shield(waiting)
+                except asyncio.CancelledError:
+                    stopped.set()
+                    inventory.wake()
+                    await waiting
+                    raise
+                backoff = self.IMParms['IM_RECONNECT_BACKOFF'] if plugged else \
+                              min(backoff * 2, self.IMParms['IM_RECONNECT_BACKOFF_MAX'])
+                generation = inventory.generation()
+            print(f'Reconnected to the PLM on "{self.port}" after {self.loop.time() - started:.2f}s')
+        finally:
+            if self.reconnecting is asyncio.current_task():
+                self.reconnecting = None
+
+    async def _reopen(self):
+        """
+        Connect to the PLM on the port it was on, if that is back, else on
+        the port it is found on, returning whether it was
+        """
+        for device in dict.fromkeys([self.port, await self.loop.run_in_executor(None, self._find_port)]):
+            if not device:
+                continue
+            self._open_port(device, 0, report=False)
+            if not self.plm:
+                continue
+            self._start_reading()
+            if await self._probe():
+                self._remember_port(device)
+                self.connections += 1
+                self.online.set()
+                return True
+            self.loop.remove_reader(self.plm.fileno())
+            self.plm.close()
+            self.plm = None
+        return False
+
+    async def _probe(self):
+        """
+        Whether a PLM answers GET_VERSION, asked directly, as the commands
+        held meanwhile wait for the PLM to be online
+        """
+        cmd_str = self.IMSendCmds['GET_VERSION'][0]
+        reply = self.dispatcher.expect_reply(cmd_str[2:4].lower())
+        try:
+            self.plm.write(bytes.fromhex(cmd_str))
+        except (serial.SerialException, OSError):
+            self.dispatcher.cancel_reply(cmd_str[2:4].lower(), reply)
+            return False
+        done, _ = await asyncio.wait({reply}, timeout=self.IMParms['IM_CMD_TIMEOUT'])
+        if not done or reply.cancelled():
+            self.dispatcher.cancel_reply(cmd_str[2:4].lower(), reply)
+            return False
+        response = reply.result()
+        return bool(response) and response.ack == self.cmd_success
+
+    async def send_command(self, cmd, args=''):
+        """
+        Send a command to the PLM without governance by the protocol, as
+        InsteonPLM.send_command does, awaiting its reply
+        """
+
+        response = await self.submit_command(cmd, args)
+        if response and response.ack != self.cmd_success:
+            response = {}
+
+        return response
+
+    async def send_commands(self, cmds):
+
+        responses = await asyncio.gather(*[self.submit_command(cmd, args) for cmd, args in cmds])
+
+        return [response if response and response.ack == self.cmd_success else {}
+                    for response in responses]
+
+    async def submit_command(self, cmd, args=''):
+        """
+        Send a command to the PLM once one of the IM_MAX_INFLIGHT slots is
+        free, resending it after a backoff if the PLM NAKs it, returning
+        the PLM's final reply, or {} if there was none. While the PLM is
+        being reconnected to, the command waits up to IM_RECONNECT_HOLD
+        for it, and is sent again if its reply was lost with the connection.
+        """
+
+        cmd = cmd.upper()
+
+        if not self.online or not (self.online.is_set() or self.reconnecting):
+            print(f'ERROR: PLM is not connected, cannot send command: "{cmd}"')
+            return {}
+        if cmd not in self.IMSendCmds:
+            print(f'ERROR: Command not recognized: "{cmd}"')
+            return {}
+
+        cmd_str, _, cmd_help = self.IMSendCmds[cmd]
+        cmd_str = ''.join([cmd_str,args])
+        cmd_in_bytes = bytes.fromhex(cmd_str)
+        reply_cmd_num = cmd_str[2:4].lower()
+        echo = self._reply_echo(cmd_str)
+        nak = int(self.IMParms['IM_CMD_FAILURE'], 16)
+        stats = self.stats[cmd]
+        submitted = self.loop.time()
+
+        async with self.inflight:
+            attempt = 0
+            while True:
+                if not self.online.is_set():
+                    try:
+                        await asyncio.wait_for(self.online.wait(),
+                                               max(0, submitted + self.IMParms['IM_RECONNECT_HOLD'] - self.loop.time()))
+                    except asyncio.TimeoutError:
+                        print(f'ERROR: PLM is not connected, gave up on command: "{cmd}"')
+                        return {}
+
+                reply = self.dispatcher.expect_reply(reply_cmd_num, echo)
+                try:
+                    self.plm.write(cmd_in_bytes)
+                except serial.SerialException as err:
+                    self.dispatcher.cancel_reply(reply_cmd_num, reply)
+                    self._connection_lost(err)
+                    if self.reconnecting:
+                        continue
+                    return {}
+                if metrics.enabled:
+                    metrics.count('insteon_serial_sent_bytes_total', len(cmd_in_bytes))
+                done, _ = await asyncio.wait({reply}, timeout=self.IMParms['IM_CMD_TIMEOUT'])
+
+                if not done:
+                    self.dispatcher.cancel_reply(reply_cmd_num, reply)
+                    stats.timeouts += 1
+                    print(f'ERROR: Timed out waiting for reply to command: "{cmd}"')
+                    return {}
+                if reply.cancelled():
+                    if self.reconnecting:
+                        continue    # sent again once reconnected
+                    print(f'ERROR: Lost connection to PLM waiting for reply to command: "{cmd}"')
+                    return {}
+
+                response = reply.result()
+                if response.ack != nak:
+                    break
+                stats.naks += 1
+                attempt += 1
+                if attempt > self.IMParms['IM_NAK_RETRIES']:
+                    break
+                await asyncio.sleep(self.IMParms['IM_NAK_BACKOFF'] * 2 ** (attempt - 1))
+
+        stats.record(self.loop.time() - submitted)
+        return response
+
+    def get_send_stats(self):
+
+        return {name: self.stats[name].summary() for name in self.stats}
+
+    async def monitor(self, filtered_cmd_num=None):
+        """
+        Asynchronous generator of the (cmd_num, msg) received from the PLM,
+        only those of filtered_cmd_num if it is given
+        """
+
+        messages = asyncio.Queue()
+        subscriber = lambda cmd_num, msg: messages.put_nowait((cmd_num, msg))
+        self.subscribe(filtered_cmd_num, subscriber)
+        try:
+            while True:
+                yield await messages.get()
+        finally:
+            self.unsubscribe(filtered_cmd_num, subscriber)
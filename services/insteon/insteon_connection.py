@@ -0,0 +1,70 @@
+import threading
+import time
+
+from ports import PortInventory, by_id_link
+
+# Terminology:
+#   IM = Insteon PLM
+
+PLM_USB_ID = (0x0403, 0x6001)   # vendor and product IDs of the PLM's FTDI chip
+
+def find_plm_ports():
+    """
+    The ports of the PLMs plugged in, as their by-id links where they
+    have them
+    """
+    return [by_id_link(port.device) for port in PortInventory.shared().find(*PLM_USB_ID)]
+
+
+class PLMSupervisor(threading.Thread):
+    """
+    A PLMSupervisor keeps an InsteonPLM connected: once told the
+    connection was lost (e.g. the PLM was unplugged), it has the PLM
+    reconnect, trying again after a backoff that doubles with each
+    failure, up to backoff_max. Whenever a serial device is plugged in
+    meanwhile, it tries again at once, with the backoff starting over,
+    so that the PLM is back within moments of being plugged back in.
+
+    The PLM holds the commands sent meanwhile in its send queue, and
+    sends them once reconnected.
+    """
+
+    def __init__(self, plm, backoff, backoff_max):
+        threading.Thread.__init__(self, name='PLMSupervisor', daemon=True)
+        self.plm = plm
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.lost = threading.Event()
+        self.alive = True
+
+    def connection_lost(self):
+        self.lost.set()
+
+    def stop(self):
+        self.alive = False
+        self.lost.set()
+        PortInventory.shared().wake()
+        if threading.current_thread() is not self:
+            self.join()
+
+    def run(self):
+        while True:
+            self.lost.wait()
+            if not self.alive:
+                break
+            self.lost.clear()
+            self._reconnect()
+
+    def _reconnect(self):
+        inventory = PortInventory.shared()
+        started = time.monotonic()
+        backoff = self.backoff
+        while self.alive:
+            generation = inventory.generation()
+            if self.plm.reconnect():
+                print(f'Reconnected to the PLM on "{self.plm.port}" after {time.monotonic() - started:.2f}s')
+                return
+            if inventory.wait_for_port(generation, backoff, lambda: not self.alive):
+                backoff = self.backoff
+            else:
+                backoff = min(backoff * 2, self.backoff_max)
@@ -0,0 +1,117 @@
+# Terminology:
+#   IM = Insteon PLM
+#   frame = STX byte, command number byte, and the fixed-length message body
+
+HEX_BYTE = tuple(f'{b:02x}' for b in range(256))
+
+class FrameDecoder:
+    """
+    A FrameDecoder turns the byte stream arriving from the PLM into
+    complete frames. Bytes are read in whatever amount the port has
+    waiting, into one receive buffer that is allocated once and compacted
+    in place, so that scanning past garbage costs no extra reads.
+
+    Frames are handed out as (cmd_num, body) where cmd_num is the command
+    number byte as an int, and body is a memoryview into the receive
+    buffer. The body is only valid until the next frame is requested, so
+    a consumer that needs it longer must copy it (e.g. bytes(body)).
+    A command number that is not known has a body of None.
+    """
+
+    def __init__(self, stx, frame_lengths, capacity=4096):
+        self.stx = stx
+        self.stx_byte = bytes((stx,))
+        self.frame_lengths = frame_lengths
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.head = 0       # first byte not yet consumed
+        self.tail = 0       # one past the last byte received
+        self.received = 0   # bytes received
+        self.frames = 0     # frames handed out
+        self.skipped = 0    # garbage bytes discarded looking for STX
+        self.reads = 0      # number of reads issued against the port
+
+    def reset(self):
+        self.head = self.tail = 0
+
+    def free(self):
+        """
+        Room left in the receive buffer, after compacting it
+        """
+        if self.head:
+            pending = self.tail - self.head
+            self.buffer[:pending] = self.buffer[self.head:self.tail]
+            self.head, self.tail = 0, pending
+        return len(self.buffer) - self.tail
+
+    def fill(self, data):
+        """
+        Append received bytes to the buffer, returning how many of
+        them fit. Callers should consume frames before filling again
+        with the remainder.
+        """
+        n = min(len(data), self.free())
+        self.buffer[self.tail:self.tail+n] = data[:n]
+        self.tail += n
+        self.received += n
+        return n
+
+    def next_frame(self):
+        """
+        Extract the next complete frame from the buffer, or return
+        None when more bytes are needed to complete one
+        """
+        buffer = self.buffer
+        while True:
+            start = buffer.find(self.stx_byte, self.head, self.tail)
+            if start < 0:
+                self.skipped += self.tail - self.head
+                self.head = self.tail = 0
+                return None
+            self.skipped += start - self.head
+            self.head = start
+
+            if self.tail - start < 2:
+                return None
+
+            cmd_num = buffer[start+1]
+            frame_len = self.frame_lengths.get(cmd_num)
+            if frame_len is None:
+                self.head = start + 2
+                self.frames += 1
+                return cmd_num, None
+
+            end = start + 2 + frame_len
+            if end > self.tail:
+                return None
+            self.head = end
+            self.frames += 1
+            return cmd_num, self.view[start+2:end]
+
+    def decode(self, data):
+        """
+        Generator of all frames completed by the given bytes, for use
+        when the bytes are pushed at us (e.g. by a reader thread)
+        """
+        offset = 0
+        while offset < len(data):
+            offset += self.fill(data[offset:] if offset else data)
+            frame = self.next_frame()
+            while frame:
+                yield frame
+                frame = self.next_frame()
+
+    def read_frame(self, port):
+        """
+        Pull bytes from the port until a frame is complete. Returns None
+        if the port timed out before that happened.
+        """
+        frame = self.next_frame()
+        while frame is None:
+            self.reads += 1
+            data = port.read(min(port.in_waiting or 1, self.free()))
+            if not data:
+                return None
+            self.fill(data)
+            frame = self.next_frame()
+        return frame
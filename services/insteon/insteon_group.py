@@ -0,0 +1,269 @@
+import collections
+import threading
+
+from concurrent.futures import Future
+
+from .insteon_connection import find_plm_ports
+from .insteon_history import EventRecorder
+from .insteon_plm import InsteonPLM, InsteonPLMConfigError, port_cache_path
+from .insteon_sendq import CommandStats
+
+# Terminology:
+#   IM = Insteon PLM
+#   member = one of the PLMs of a group, with its own reader and sender threads
+#   route = the member that commands to a device are sent through
+#   hops = how many times a message was repeated by devices on its way, from
+#          the message flags: max hops (bits 0-1) less hops left (bits 2-3)
+
+class PLMRoutes:
+    """
+    PLMRoutes learn which member reaches each device best, from the
+    messages each member receives from the device: the fewer hops a
+    message took to arrive, the closer the member is to the device (e.g.
+    on the same electrical phase). Each member's hops to a device are a
+    moving average, so that routes follow changes to the network, and a
+    member whose command to the device got no reply is penalized, so that
+    it is routed around until it hears from the device again.
+    """
+
+    WEIGHT = 0.25       # of the latest hops, in the moving average
+    PENALTY = 1.0       # hops added to a member for a command unanswered
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hops = collections.defaultdict(dict)   # dev_key: {member: average hops}
+
+    def heard(self, member, dev_key, msg_flags):
+        hops = (msg_flags & 0x03) - ((msg_flags >> 2) & 0x03)
+        with self.lock:
+            routes = self.hops[dev_key]
+            average = routes.get(member)
+            routes[member] = hops if average is None else average + self.WEIGHT * (hops - average)
+
+    def failed(self, member, dev_key):
+        with self.lock:
+            routes = self.hops.get(dev_key)
+            if routes and member in routes:
+                routes[member] += self.PENALTY
+
+    def best(self, dev_key, members):
+        """
+        The member among members with the fewest hops to the device, or
+        None if none of them has heard from it
+        """
+        with self.lock:
+            routes = self.hops.get(dev_key, {})
+            heard = [member for member in members if member in routes]
+            return min(heard, key=routes.get) if heard else None
+
+    def routes(self):
+        """
+        The routes of every device, as {dev_key: {member: average hops}}
+        """
+        with self.lock:
+            return {dev_key: dict(routes) for dev_key, routes in self.hops.items()}
+
+
+class InsteonPLMGroup:
+    """
+    An InsteonPLMGroup drives several PLMs at once (e.g. one on each
+    electrical phase of a larger site), as one InsteonPLM: each member
+    has its own reader thread and send queue, commands to a device are
+    sent through the member that reaches the device best (or the least
+    busy one, until that is known), and the messages the members receive
+    are merged into one stream for subscribers, the history and monitoring.
+
+    The configuration, devices and history are those of the first member,
+    which the others share, so anything else asked of the group is asked
+    of the first member.
+    """
+
+    def __init__(self):
+        self.primary = InsteonPLM()
+        self.primary.recording = False
+        self.primary.group = self
+        self.members = []           # those connected, the primary (if it is) first
+        self.routes = PLMRoutes()
+        self.subscribers = []       # (cmd_num, subscriber) of each member
+        self.recorder = None
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # only called for what the group does not have itself, e.g. the
+        # configuration getters, format_message and import_devices
+        if name.startswith('__') or name == 'primary':
+            raise AttributeError(name)
+        return getattr(self.primary, name)
+
+    def get_members(self):
+
+        return list(self.members)
+
+    def connect(self, port=None):
+        """
+        Connect to the PLM on each port, at once: to the port if given, or
+        else the ports of IM_PORTS, or IM_PORT, or else every USB port a
+        PLM is found on (or the port one was last connected to)
+        """
+        self.disconnect()
+
+        if port:
+            ports = [port]
+        elif self.IMParms.get('IM_PORTS'):
+            ports = self.IMParms['IM_PORTS']
+        elif self.IMParms.get('IM_PORT'):
+            ports = [self.IMParms['IM_PORT']]
+        else:
+            ports = [port for port in find_plm_ports() or [self.primary._last_port()] if port]
+        if not ports:
+            raise InsteonPLMConfigError('Could not find a PLM attached to a USB port')
+
+        plms = [self.primary] + [self._new_member(idx) for idx in range(1, len(ports))]
+        errors = [None] * len(ports)
+
+        def connect_member(idx):
+            try:
+                plms[idx].connect(ports[idx])
+            except InsteonPLMConfigError as err:
+                errors[idx] = err.data
+
+        workers = [threading.Thread(target=connect_member, args=(idx,), name=f'PLMConnect-{idx}')
+                       for idx in range(len(ports))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.recorder = EventRecorder(self.primary.history)
+        self.recorder.start()
+        self.subscribers = [(None, self.recorder.record)]
+        for plm, error in zip(plms, errors):
+            if error:
+                print(f'Insteon PLM config error: {error}')  # TODO: convert to a log write
+            else:
+                self._add_member(plm)
+
+        if not self.members:
+            self.disconnect()
+            raise InsteonPLMConfigError(errors[0] if len(errors) == 1 else
+                                        f'Could not connect to a PLM on any of: {", ".join(ports)}')
+
+    def disconnect(self):
+
+        with self.lock:
+            members, self.members = self.members, []
+        for plm in members:
+            plm.disconnect()
+        self.primary.disconnect()
+        if self.recorder:
+            self.recorder.stop()
+            self.recorder = None
+
+    def subscribe(self, cmd_num, subscriber):
+        """
+        Have subscriber(cmd_num, msg) called with every message received
+        of the command number (all, if None) by any member, on the
+        reader thread of that member
+        """
+        with self.lock:
+            self.subscribers.append((cmd_num, subscriber))
+            members = list(self.members)
+        for plm in members:
+            plm.subscribe(cmd_num, subscriber)
+
+    def unsubscribe(self, cmd_num, subscriber):
+
+        with self.lock:
+            self.subscribers = [(c, s) for c, s in self.subscribers if not (c == cmd_num and s is subscriber)]
+            members = list(self.members)
+        for plm in members:
+            plm.unsubscribe(cmd_num, subscriber)
+
+    def send_command(self, cmd, args=''):
+        """
+        Send a command as InsteonPLM.send_command does, through the member
+        that reaches its device best
+        """
+        response = self.submit_command(cmd, args).result()
+        if response and response.ack != self.cmd_success:
+            response = {}
+
+        return response
+
+    def send_commands(self, cmds):
+        """
+        Send a list of (cmd, args), pipelined through the send queues of
+        all the members, returning the replies in the same order
+        """
+        futures = [self.submit_command(cmd, args) for cmd, args in cmds]
+        responses = [future.result() for future in futures]
+
+        return [response if response and response.ack == self.cmd_success else {}
+                    for response in responses]
+
+    def submit_command(self, cmd, args=''):
+        """
+        Queue a command to send through the member that reaches its device
+        best, or the least busy member if it is not known, or (if it is
+        not to a device) the first member, returning a future of the reply
+        """
+        members = list(self.members)
+        if not members:
+            print(f'ERROR: PLM is not connected, cannot send command: "{cmd.upper()}"')
+            future = Future()
+            future.set_result({})
+            return future
+
+        dev_key = self.device_of(cmd, args)
+        if dev_key is None:
+            return members[0].submit_command(cmd, args)
+
+        plm = self.routes.best(dev_key, members) or min(members, key=lambda m: m.sendq.backlog() if m.sendq else 0)
+        future = plm.submit_command(cmd, args)
+        future.add_done_callback(lambda reply: None if reply.result() else self.routes.failed(plm, dev_key))
+        return future
+
+    def get_send_stats(self):
+        """
+        Latency statistics of each command sent, through any member
+        """
+        stats = collections.defaultdict(CommandStats)
+        for plm in list(self.members):
+            if plm.sendq:
+                plm.sendq.merge_stats(stats)
+        return {name: stats[name].summary() for name in stats}
+
+    def monitor(self, filtered_cmd_num):
+        """
+        Show the messages received by all the members, as InsteonPLM.monitor
+        does for one PLM
+        """
+        # the group subscribes, and shows the messages, just as a PLM does
+        InsteonPLM.monitor(self, filtered_cmd_num)
+
+    def _new_member(self, idx):
+        """
+        A PLM sharing the first member's devices and history, with a port
+        cache of its own
+        """
+        plm = InsteonPLM()
+        plm.devices = self.primary.devices
+        plm.history = self.primary.history
+        plm.recording = False
+        plm.group = self
+        plm.port_cache = f'{port_cache_path}-{idx}'
+        return plm
+
+    def _add_member(self, plm):
+
+        heard = lambda cmd_num, msg: self._heard(plm, msg)
+        plm.subscribe(None, heard)
+        with self.lock:
+            for cmd_num, subscriber in self.subscribers:
+                plm.subscribe(cmd_num, subscriber)
+            self.members.append(plm)
+
+    def _heard(self, plm, msg):
+        # called on the member's reader thread, for every message
+        if 'from_id1' in msg and 'msg_flags' in msg:
+            self.routes.heard(plm, (msg.from_id1 << 16) | (msg.from_id2 << 8) | msg.from_id3, msg.msg_flags)
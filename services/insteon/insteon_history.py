@@ -0,0 +1,288 @@
+import bisect
+import collections
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+# Terminology:
+#   event   = one message received from the PLM, as recorded in the log
+#   segment = one file of the log, holding a fixed number of events
+#   key     = a device ID packed as a 24-bit integer
+
+SEGMENT_MAGIC = b'H8SEVLG1'
+SEGMENT_HEADER = struct.Struct('<8sIIIIdd')  # magic, version, capacity, count, unused, first & last timestamps
+SEGMENT_HEADER_SIZE = 64
+SEGMENT_VERSION = 1
+
+# the columns of a segment, each an array of capacity items, in this order
+COLUMNS = (('timestamp', 'd'), ('from_key', 'I'), ('to_key', 'I'),
+           ('cmd_num', 'B'), ('msg_flags', 'B'), ('cmd1', 'B'), ('cmd2', 'B'))
+EVENT_SIZE = sum(struct.calcsize(fmt) for _, fmt in COLUMNS)
+
+re_segment_fname = re.compile(r'^(\d{8})\.evl$')
+
+Event = collections.namedtuple('Event', [name for name, _ in COLUMNS])
+
+class Segment():
+    """
+    A Segment is one file of the event log, memory mapped, holding up to
+    capacity events column by column: all the timestamps, then all the
+    from IDs, and so on. As events are appended in time order, the
+    timestamp column is sorted, and is searched directly for the events
+    of a time range.
+
+    The count of events in the header is only updated once an event's
+    columns are written, so a reader (e.g. another process) never sees
+    half an event.
+    """
+
+    def __init__(self, path, capacity=None):
+        self.path = path
+        writable = capacity is not None
+        if writable and not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.truncate(SEGMENT_HEADER_SIZE + capacity * EVENT_SIZE)
+                f.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, capacity, 0, 0, 0.0, 0.0))
+
+        with open(path, 'r+b' if writable else 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+
+        magic, version, self.capacity, _, _, _, _ = SEGMENT_HEADER.unpack_from(self.mm)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            self.mm.close()
+            raise ValueError(f'Not an event log segment: "{path}"')
+
+        self.columns = {}
+        offset = SEGMENT_HEADER_SIZE
+        self.view = memoryview(self.mm)
+        for name, fmt in COLUMNS:
+            size = self.capacity * struct.calcsize(fmt)
+            self.columns[name] = self.view[offset:offset+size].cast(fmt)
+            offset += size
+
+    @property
+    def count(self):
+        return SEGMENT_HEADER.unpack_from(self.mm)[3]
+
+    def time_range(self):
+        _, _, _, count, _, first, last = SEGMENT_HEADER.unpack_from(self.mm)
+        return (first, last) if count else None
+
+    def is_full(self):
+        return self.count >= self.capacity
+
+    def append(self, events):
+        """
+        Append as many of the events (iterator of tuples in COLUMNS order)
+        as fit, returning how many did
+        """
+        _, _, capacity, count, _, first, last = SEGMENT_HEADER.unpack_from(self.mm)
+        columns = [self.columns[name] for name, _ in COLUMNS]
+        start = count
+        for event in events:
+            for column, value in zip(columns, event):
+                column[count] = value
+            count += 1
+            if count == capacity:
+                break
+        if count > start:
+            first = first if start else columns[0][0]
+            SEGMENT_HEADER.pack_into(self.mm, 0, SEGMENT_MAGIC, SEGMENT_VERSION, capacity, count, 0,
+                                     first, columns[0][count-1])
+        return count - start
+
+    def events(self, start, end):
+        """
+        The events timestamped from start up to (not including) end
+        """
+        count = self.count
+        timestamps = self.columns['timestamp']
+        lo = bisect.bisect_left(timestamps, start, 0, count)
+        hi = bisect.bisect_left(timestamps, end, lo, count)
+        columns = [self.columns[name] for name, _ in COLUMNS]
+        for idx in range(lo, hi):
+            yield Event(*[column[idx] for column in columns])
+
+    def close(self):
+        for column in self.columns.values():
+            column.release()
+        self.columns = {}
+        self.view.release()
+        self.mm.close()
+
+
+class EventLog():
+    """
+    An EventLog is an append-only log of the messages received from the
+    PLM, kept as a directory of fixed-size segments that are rolled over
+    when full, the oldest being removed once there are max_segments.
+
+    The time index of the log is the time range of each segment, kept in
+    its header, by which a query only looks at the segments overlapping
+    the times asked for (and within them, at the events in that range).
+    """
+
+    def __init__(self, log_dir, segment_events=65536, max_segments=32):
+        self.log_dir = log_dir
+        self.segment_events = segment_events
+        self.max_segments = max_segments
+        self.lock = threading.Lock()
+        self.segment = None   # the one being appended to
+
+    def segment_paths(self):
+        try:
+            fnames = sorted(fname for fname in os.listdir(self.log_dir) if re_segment_fname.match(fname))
+        except OSError:
+            return []
+        return [os.path.join(self.log_dir, fname) for fname in fnames]
+
+    def append(self, events):
+        """
+        Append the events, tuples in COLUMNS order, rolling over to a new
+        segment as each fills up
+        """
+        events = iter(events)
+        with self.lock:
+            while True:
+                if self.segment is None or self.segment.is_full():
+                    self._roll()
+                self.segment.append(events)
+                if not self.segment.is_full():
+                    break
+                # full, but maybe with events left over for the next one
+
+    def query(self, start=0.0, end=float('inf'), cmd_num=None, dev_key=None):
+        """
+        Generator of the events timestamped from start up to end, of the
+        command number and to or from the device, if given
+        """
+        for path in self.segment_paths():
+            try:
+                segment = Segment(path)
+            except (OSError, ValueError):  # e.g. removed meanwhile
+                continue
+            try:
+                time_range = segment.time_range()
+                if time_range is None or time_range[1] < start or time_range[0] >= end:
+                    continue
+                for event in segment.events(start, end):
+                    if cmd_num is not None and event.cmd_num != cmd_num:
+                        continue
+                    if dev_key is not None and dev_key not in (event.from_key, event.to_key):
+                        continue
+                    yield event
+            finally:
+                segment.close()
+
+    def last_timestamp(self):
+        """
+        The timestamp of the last event appended, 0.0 if there is none
+        """
+        paths = self.segment_paths()
+        if not paths:
+            return 0.0
+        try:
+            segment = Segment(paths[-1])
+        except (OSError, ValueError):
+            return 0.0
+        try:
+            time_range = segment.time_range()
+        finally:
+            segment.close()
+        return time_range[1] if time_range else 0.0
+
+    def close(self):
+        with self.lock:
+            if self.segment:
+                self.segment.mm.flush()
+                self.segment.close()
+                self.segment = None
+
+    def _roll(self):
+        paths = self.segment_paths()
+        if self.segment is None and paths:
+            try:
+                self.segment = Segment(paths[-1], self.segment_events)  # carry on where the last left off
+            except (OSError, ValueError):
+                self.segment = None
+            if self.segment and not self.segment.is_full():
+                return
+
+        if self.segment:
+            self.segment.close()
+        os.makedirs(self.log_dir, exist_ok=True)
+        seq = int(re_segment_fname.match(os.path.basename(paths[-1])).group(1)) + 1 if paths else 1
+        self.segment = Segment(os.path.join(self.log_dir, f'{seq:08d}.evl'), self.segment_events)
+
+        for path in paths[:max(0, len(paths) + 1 - self.max_segments)]:
+            os.unlink(path)
+
+
+class EventRecorder(threading.Thread):
+    """
+    An EventRecorder subscribes to every message received from the PLM
+    and appends each one to an EventLog. The subscriber only timestamps
+    the message and queues it, so the reader is never held up by the log;
+    the recorder's own thread writes what is queued a batch at a time.
+    """
+
+    FLUSH_INTERVAL = 0.1
+
+    def __init__(self, log):
+        threading.Thread.__init__(self, name='EventRecorder', daemon=True)
+        self.log = log
+        self.pending = collections.deque()
+        self.alive = True
+        self.recorded = 0
+        self.errors = 0
+        self.last_ts = 0.0
+
+    def record(self, cmd_num, msg):
+        # called on the reader thread: keep it to this
+        self.pending.append((time.time(), cmd_num, msg))
+
+    def stop(self):
+        self.alive = False
+        self.join()
+
+    def run(self):
+        # from where the log left off, as the last segment is carried on,
+        # and its timestamps are to stay sorted even if the clock has
+        # stepped back since
+        self.last_ts = max(self.last_ts, self.log.last_timestamp())
+        while self.alive:
+            time.sleep(self.FLUSH_INTERVAL)
+            self.flush()
+        self.flush()
+        self.log.close()
+
+    def flush(self):
+        events = []
+        while self.pending:
+            timestamp, cmd_num, msg = self.pending.popleft()
+            # kept in order, despite the clock stepping back
+            self.last_ts = max(self.last_ts, timestamp)
+            events.append(self._event(self.last_ts, cmd_num, msg))
+        if events:
+            try:
+                self.log.append(events)
+                self.recorded += len(events)
+            except (OSError, ValueError) as err:  # TODO: convert to a log write
+                self.errors += 1
+                print(f'ERROR: Cannot record PLM messages: {err}')
+
+    def _event(self, timestamp, cmd_num, msg):
+        # messages without a from ID (replies of the PLM) are to the device
+        # in their id1-3, if any
+        from_key = to_key = 0
+        if 'from_id1' in msg:
+            from_key = (msg.from_id1 << 16) | (msg.from_id2 << 8) | msg.from_id3
+        if 'to_id1' in msg:
+            to_key = (msg.to_id1 << 16) | (msg.to_id2 << 8) | msg.to_id3
+        elif 'id1' in msg:
+            to_key = (msg.id1 << 16) | (msg.id2 << 8) | msg.id3
+        return (timestamp, from_key, to_key, int(cmd_num, 16),
+                getattr(msg, 'msg_flags', 0), getattr(msg, 'cmd1', 0), getattr(msg, 'cmd2', 0))
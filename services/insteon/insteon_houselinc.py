@@ -0,0 +1,83 @@
+import re
+import xml.etree.ElementTree as ET
+
+from devices import pack_id
+
+# Terminology:
+#   HouseLinc = Insteon's Windows application, whose settings export
+#               (<settings><insteon><active_devices><device ...>) lists
+#               every device with its channels and link database
+
+# path of the elements of the devices, from the root
+DEVICE_PATH = ('settings', 'insteon', 'active_devices', 'device')
+
+# device attributes kept as properties, by the name devices.json has them
+DEVICE_PROPERTIES = {'category': 'category',
+                     'subcategory': 'subcategory',
+                     'revision': 'revision',
+                     'powerline': 'powerline',
+                     'radio': 'radio',
+                     'yakityYak': 'yakity_yak',
+                     'hopIfModSyncFails': 'hop_if_mod_sync_fails'}
+
+re_driver_type = re.compile(r'^[A-Za-z]+?(?=\d|$)')  # e.g. 'SwitchLinc02RCS' => 'SwitchLinc'
+
+def houselinc_devices(path):
+    """
+    Generator of (device ID, device entry, link records) of the devices of
+    a HouseLinc settings export, with the entry as in devices.json, and the
+    link records as (address, group, control, data1, data2, data3).
+
+    The export is parsed as a stream, and each element dropped from its
+    parent once it has been seen, so however large the export is, no more
+    than one device is held in memory at a time.
+    """
+    path_tags = []
+    parents = []
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            path_tags.append(elem.tag)
+            parents.append(elem)
+            continue
+
+        in_device = tuple(path_tags[:len(DEVICE_PATH)]) == DEVICE_PATH
+        if in_device and len(path_tags) > len(DEVICE_PATH):
+            # part of a device, which is needed until the device's end
+            path_tags.pop()
+            parents.pop()
+            continue
+
+        if in_device:
+            yield _device(elem)
+
+        path_tags.pop()
+        parents.pop()
+        if parents:
+            parents[-1].remove(elem)
+
+def _device(elem):
+    dev_id = elem.get('insteonID').upper()
+    driver = elem.get('driver', '')
+    m = re_driver_type.match(driver)
+    location = elem.find('location')
+    if location is None:
+        location = ET.Element('location')
+
+    entry = {'name': elem.get('displayName') or driver or dev_id,
+             'room': location.get('room', ''),
+             'location': location.get('value', ''),
+             'type': 'insteon/' + (m.group(0) if m else driver),
+             'active': elem.get('active', 'True'),
+             'properties': {DEVICE_PROPERTIES[attr]: elem.get(attr) for attr in DEVICE_PROPERTIES
+                                                                    if elem.get(attr) is not None}}
+
+    links = []
+    for record in elem.iterfind('database/record/device'):
+        links.append((pack_id(record.get('address')),
+                      int(record.get('group')),
+                      int(record.get('recordControl')),
+                      int(record.get('data1')),
+                      int(record.get('data2')),
+                      int(record.get('data3'))))
+
+    return dev_id, entry, links
@@ -0,0 +1,110 @@
+import re
+import struct
+
+from .insteon_decoder import HEX_BYTE
+
+# Terminology:
+#   layout = the position and permitted values of each field in the
+#            body of a received message, compiled from cmds_receive.json
+
+re_field = re.compile(r'\(\?P<(\w+)>([^()]*)\)')
+
+class InsteonMessage:
+    """
+    An InsteonMessage is a message received from the PLM, decoded straight
+    from the bytes of its frame. Each field of the message is an int
+    attribute, named after the group in the receive command's regex.
+
+    The hex string dict that the regex used to produce is still available,
+    built only when asked for, through groupdict() or msg['field'].
+
+    NOTE: You do not instantiate the InsteonMessage class. Each MessageLayout
+          creates a subclass of it with the fields of its command.
+    """
+
+    __slots__ = ('values', '_groups')
+    cmd_num = None
+    fields = ()
+
+    def __init__(self, values):
+        self.values = values
+        self._groups = None
+
+    def groupdict(self):
+        if self._groups is None:
+            self._groups = {name: HEX_BYTE[value] for name, value in zip(self.fields, self.values)}
+        return self._groups
+
+    def __getitem__(self, field):
+        return self.groupdict()[field]
+
+    def __contains__(self, field):
+        return field in self.fields
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __repr__(self):
+        return f'<{type(self).__name__} ' + ' '.join(f'{name}={HEX_BYTE[value]}' for name, value in zip(self.fields, self.values)) + '>'
+
+
+class MessageLayout:
+    """
+    A MessageLayout is a receive command's regex compiled into fixed
+    offsets, one byte per named group, along with the set of values a
+    byte may take where the regex constrains it (e.g. "06|15" for ack).
+
+    A regex that does not break down into one-byte groups is kept as is,
+    and messages of that command are decoded by matching it as before.
+    """
+
+    def __init__(self, cmd_num, msg_len, msg_regex, description):
+        self.cmd_num = cmd_num
+        self.msg_len = msg_len
+        self.description = description
+        self.regex = re.compile(msg_regex)
+        self.checks = ()
+
+        fields = self.regex.groupindex
+        names = sorted(fields, key=fields.get)
+        if ''.join(m.group(0) for m in re_field.finditer(msg_regex)) == msg_regex and len(names) == msg_len:
+            self.unpack = struct.Struct(f'{msg_len}B').unpack
+            checks = []
+            for idx, (name, pattern) in enumerate(re_field.findall(msg_regex)):
+                allowed = re.compile(f'(?:{pattern})$')
+                values = frozenset(b for b in range(256) if allowed.match(HEX_BYTE[b]))
+                if len(values) < 256:
+                    checks.append((idx, values))
+            self.checks = tuple(checks)
+        else:
+            self.unpack = None
+
+        attrs = {'__slots__': (), 'cmd_num': cmd_num, 'fields': tuple(names)}
+        attrs.update({name: property(lambda msg, idx=idx: msg.values[idx]) for idx, name in enumerate(names)})
+        self.message_class = type(f'InsteonMessage{cmd_num.upper()}', (InsteonMessage,), attrs)
+
+    def decode(self, body):
+        """
+        Decode the body of a frame into a message, or None if the
+        body does not satisfy the layout
+        """
+        if self.unpack is None:
+            m = self.regex.match(bytes(body).hex())
+            if not m:
+                return None
+            return self.message_class(tuple(int(m.group(name), 16) for name in self.message_class.fields))
+
+        values = self.unpack(body)
+        for idx, allowed in self.checks:
+            if values[idx] not in allowed:
+                return None
+        return self.message_class(values)
+
+
+def compile_layouts(receive_cmds):
+    """
+    Compile the receive command table into layouts, keyed on the
+    command number as an int (as it is handed out by FrameDecoder)
+    """
+    return {int(cmd_num, 16): MessageLayout(cmd_num, *receive_cmds[cmd_num])
+                for cmd_num in receive_cmds}
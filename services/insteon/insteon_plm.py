@@ -2,15 +2,77 @@ import codecs
 import glob
 import json
 import os
-import re
+import queue
 import serial
 import sys
 
+from concurrent.futures import CancelledError, Future, TimeoutError
+
 from pathlib import Path
 
+from devices import DeviceRegistry, DevicesIOError, unpack_id
+from metrics import metrics
+from ports import by_id_link
+from store import ConfigStore, ConfigStoreError
+
+from .insteon_connection import PLMSupervisor, find_plm_ports
+from .insteon_decoder import FrameDecoder, HEX_BYTE
+from .insteon_history import EventLog, EventRecorder
+from .insteon_message import compile_layouts
+from .insteon_reader import PLMDispatcher, PLMProtocol, PLMReaderThread
+from .insteon_sendq import SendQueue
+
 # Terminology:
 #   IM = Insteon PLM
 
+IM_SEND_MSG = '62'   # command number of sending a message to a device
+
+# the port the PLM was last connected to, tried first the next time (of
+# the first PLM of a group; the others' have their index appended)
+port_cache_path = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'h8s', 'insteon-port')
+
+# kind of configuration (in the configuration store) of each config file
+CONFIG_KINDS = {'im_parms.json':     'parms',
+                'cmds_receive.json': 'receive_cmds',
+                'cmds_send.json':    'send_cmds'}
+
+metrics.describe('insteon_serial_received_bytes_total', 'counter', 'Bytes received from the PLM')
+metrics.describe('insteon_serial_sent_bytes_total', 'counter', 'Bytes sent to the PLM')
+metrics.describe('insteon_frames_decoded_total', 'counter', 'Frames decoded from the bytes received from the PLM')
+metrics.describe('insteon_garbage_bytes_total', 'counter', 'Bytes received from the PLM skipped looking for STX')
+metrics.describe('insteon_commands_sent_total', 'counter', 'Commands the PLM replied to, by command')
+metrics.describe('insteon_command_naks_total', 'counter', 'Commands NAKed by the PLM, by command')
+metrics.describe('insteon_command_timeouts_total', 'counter', 'Commands the PLM never replied to, by command')
+metrics.describe('insteon_plm_connections_lost_total', 'counter', 'Connections to the PLM lost')
+metrics.describe('insteon_plm_reconnects_total', 'counter', 'Connections to the PLM made after the first')
+
+def load_config(store, config_file):
+    """
+    The config file's data, from the configuration store (if there is
+    one), which only reads the file again when it has changed
+    """
+    config_path = os.path.join(os.path.dirname(sys.modules['services.insteon'].__file__), 'config', config_file)
+    if store:
+        return store.load('insteon', CONFIG_KINDS[config_file], config_path)
+    try:
+        f = open(config_path)
+        config_data = json.load(f)
+        f.close()
+    except IOError:
+        config_data = {}
+    return config_data
+
+def configured_transport():
+    """
+    IM_TRANSPORT of im_parms.json, read before any PLM is made, so that
+    only the kind of PLM it chooses is
+    """
+    try:
+        store = ConfigStore.open()
+    except ConfigStoreError:
+        store = None  # the PLM made says so
+    return load_config(store, 'im_parms.json').get('IM_TRANSPORT')
+
 # Insteon service exceptions
 class InsteonException(Exception):
     def __init__(self, msg):
@@ -18,11 +80,13 @@ class InsteonException(Exception):
 class InsteonPLMConfigError(InsteonException): pass
 class InsteonPLMConfigInfo(InsteonException):  pass
 
-if os.name == 'posix':
-    from serial.tools.list_ports_posix import comports
-else:
+if os.name != 'posix':
     raise InsteonPLMConfigError(f'Platform ("{os.name}") is not supported')
 
+# for serial URLs of our own, e.g. plmsim:// to stand in for a PLM
+if 'services.insteon.urlhandler' not in serial.protocol_handler_packages:
+    serial.protocol_handler_packages.append('services.insteon.urlhandler')
+
 
 class InsteonPLM:
     """ 
@@ -33,16 +97,59 @@ class InsteonPLM:
     """
 
     def __init__(self):
-        self.config_dir = ''
         self.plm = None
+        self.plm_id = None      # e.g. '11.22.33', once connected
+        self.port = None        # the port connected to (last)
+        self.port_cache = port_cache_path
+        self.group = None       # the InsteonPLMGroup it is a member of, if any
+        self.reader = None
+        self.sendq = None
+        self.supervisor = None
+        try:
+            self.store = ConfigStore.open()
+        except ConfigStoreError as err:  # TODO: convert to a log write
+            print(f'Insteon PLM config store unavailable, reading JSON instead: {err.data}')
+            self.store = None
         self.IMParms = self._load_config('im_parms.json')
         self.IMReceiveCmds = self._load_config('cmds_receive.json')
         self.IMSendCmds = self._load_config('cmds_send.json')
-        self.devices = self._load_config('devices.json')
+        try:
+            self.devices = DeviceRegistry('services.insteon', devices_file=os.path.join('config', 'devices.json'))
+        except DevicesIOError:
+            self.devices = None
 
         if not self.IMSendCmds or not self.IMReceiveCmds or not self.IMParms or not self.devices:
             raise InsteonPLMConfigError('Unable to read configuration')
 
+        self.layouts = compile_layouts(self.IMReceiveCmds)
+        self.decoder = FrameDecoder(int(self.IMParms['IM_COMM_STX'], 16),
+                                    {cmd_num: self.layouts[cmd_num].msg_len for cmd_num in self.layouts},
+                                    self.IMParms['IM_RX_BUFSIZE'])
+        self.cmd_success = int(self.IMParms['IM_CMD_SUCCESS'], 16)
+        self.dispatcher = PLMDispatcher(self.decoder, self.layouts)
+
+        history_dir = self.IMParms.get('IM_HISTORY_DIR') or \
+                          os.path.join(os.environ.get('XDG_DATA_HOME', os.path.expanduser('~/.local/share')),
+                                       'h8s', 'history', 'insteon')
+        self.history = EventLog(history_dir,
+                                segment_events=self.IMParms['IM_HISTORY_SEGMENT_EVENTS'],
+                                max_segments=self.IMParms['IM_HISTORY_SEGMENTS'])
+        self.recorder = None
+        self.recording = True  # False when what it receives is recorded for it (e.g. by its group)
+        self.connections = 0   # made successfully
+        metrics.register(self._collect_metrics)
+
+    def subscribe(self, cmd_num, subscriber):
+        """
+        Have subscriber(cmd_num, msg) called, on the reader thread, with
+        every message received of the command number (all, if None)
+        """
+        self.dispatcher.subscribe(cmd_num, subscriber)
+
+    def unsubscribe(self, cmd_num, subscriber):
+
+        self.dispatcher.unsubscribe(cmd_num, subscriber)
+
     def get_send_cmds(self):
 
         return self.IMSendCmds
@@ -55,37 +162,95 @@ class InsteonPLM:
 
         return self.devices
 
+    def get_history(self):
+
+        return self.history
+
     def send_command(self, cmd, args=''):
         """
         Send a command to the PLM without governance by the protocol.
         That is, allow any valid command to be sent to the PLM without
         checking if it is a valid successor to the previous command.
         This will work in all cases because Insteon commands are idempotent.
+
+        The reply is picked out of the PLM's traffic by the reader thread,
+        so other messages arriving meanwhile still reach their subscribers.
+        """
+
+        response = self.submit_command(cmd, args).result()
+        if response and response.ack != self.cmd_success:
+            response = {}
+
+        return response
+
+    def send_commands(self, cmds):
+        """
+        Send a list of (cmd, args) to the PLM, pipelined through the send
+        queue rather than each waiting on the reply to the one before it,
+        returning the replies in the same order
+        """
+
+        futures = [self.submit_command(cmd, args) for cmd, args in cmds]
+        responses = [future.result() for future in futures]
+
+        return [response if response and response.ack == self.cmd_success else {}
+                    for response in responses]
+
+    def submit_command(self, cmd, args=''):
+        """
+        Queue a command to send to the PLM, returning a future of the PLM's
+        reply: the InsteonMessage, ACK or NAK, or {} if there was none
         """
 
-        response = {}
+        future = Future()
         cmd = cmd.upper()
 
-        if cmd in self.IMSendCmds:
+        if not self.sendq:
+            print(f'ERROR: PLM is not connected, cannot send command: "{cmd}"')
+        elif cmd in self.IMSendCmds:
             cmd_str, _, cmd_help = self.IMSendCmds[cmd]
             cmd_str = ''.join([cmd_str,args])
-            cmd_in_bytes = bytearray.fromhex(cmd_str)
-            write_len = len(cmd_in_bytes)
-            num_written = self.plm.write(cmd_in_bytes)
-
-            if num_written == write_len:
-                while True:
-                    cmd_num, response = self._receive_msg()
-                    if response and cmd_num == cmd_str[2:4]:
-                        if response['ack'] != self.IMParms['IM_CMD_SUCCESS']:
-                            response = {}
-                        break
-            else:
-                print(f'ERROR: Failure to send command: {num_written = }, {write_len = }')
+            return self.sendq.submit(cmd, bytes.fromhex(cmd_str), cmd_str[2:4].lower(), self._reply_echo(cmd_str))
         else:
             print(f'ERROR: Command not recognized: "{cmd}"')
 
-        return response
+        future.set_result({})
+        return future
+
+    def _reply_echo(self, cmd_str):
+        """
+        What the PLM's reply to the command starts with, if it is known: a
+        message sent to a device is echoed back (its ID, flags and
+        commands) ahead of the ACK or NAK
+        """
+
+        if cmd_str[2:4].lower() != IM_SEND_MSG:
+            return None
+        return bytes.fromhex(cmd_str[4:16])
+
+    def device_of(self, cmd, args=''):
+        """
+        The device (packed ID) a command is sent to, or None if it is not
+        sent to a device
+        """
+
+        send_cmd = self.IMSendCmds.get(cmd.upper())
+        if send_cmd is None:
+            return None
+        cmd_str = send_cmd[0] + args
+        if cmd_str[2:4].lower() != IM_SEND_MSG or len(cmd_str) < 10:
+            return None
+        try:
+            return int(cmd_str[4:10], 16)
+        except ValueError:
+            return None
+
+    def get_send_stats(self):
+        """
+        Latency statistics of each command sent, keyed on command name
+        """
+
+        return self.sendq.get_stats() if self.sendq else {}
 
 
     def monitor(self, filtered_cmd_num):
@@ -95,112 +260,343 @@ class InsteonPLM:
         1) Responses to 0x60 series commands
         2) All 0x50 series commands received by the PLM sent
            by other devices, hosts
+
+        Monitoring is just another subscriber of the reader thread, so
+        commands can still be sent while it runs.
         """
         if filtered_cmd_num is None or filtered_cmd_num in self.IMReceiveCmds:
-            print('Commencing monitoring...')
-            if filtered_cmd_num:
-                print(f'Filtering only messages with command number = "{filtered_cmd_num}".')
-            print('(Ctrl-C to terminate)')
+            messages = queue.Queue()
+            subscriber = lambda cmd_num, msg: messages.put((cmd_num, msg))
+            self.subscribe(filtered_cmd_num, subscriber)
             try:
-                while True:
-                    cmd_num, msg = self._receive_msg()
-                    if msg:
-                        if filtered_cmd_num is None or filtered_cmd_num == cmd_num:
-                            _, _, msg_description = self.IMReceiveCmds[cmd_num]
-                            print(f'{msg_description}:')
-                            dev_id, dev_name = self._construct_device_id('from_id', msg)
-                            print(f'  from: {dev_id} ({dev_name})')
-                            dev_id, dev_name = self._construct_device_id('to_id', msg)
-                            print(f'  to:   {dev_id} ({dev_name})')
-                            print(f"    => message flags: '{msg['msg_flags']}' cmds: '{msg['cmd1']}', '{msg['cmd2']}'")
-                    else:
-                        print(f'ERROR: Did not recognize the command "{cmd_num}" received. Aborting so that you can fix my metadata.')
-                        break
-            except KeyboardInterrupt:
-                print('\nCtrl-C received. Exiting monitoring.')
+                self.show_messages(filtered_cmd_num, messages)
+            finally:
+                self.unsubscribe(filtered_cmd_num, subscriber)
         else:
             print(f'ERROR: Not a valid command on which to filter received messages: "{filtered_cmd_num}".')
 
+    def show_messages(self, filtered_cmd_num, messages):
+        """
+        Print the (cmd_num, msg) arriving on the messages queue, until
+        Ctrl-C or a message that is not recognized
+        """
+        print('Commencing monitoring...')
+        if filtered_cmd_num:
+            print(f'Filtering only messages with command number = "{filtered_cmd_num}".')
+        print('(Ctrl-C to terminate)')
+        try:
+            while True:
+                cmd_num, msg = messages.get()
+                if msg:
+                    print(self.format_message(cmd_num, msg))
+                else:
+                    print(f'ERROR: Did not recognize the command "{cmd_num}" received. Aborting so that you can fix my metadata.')
+                    break
+        except KeyboardInterrupt:
+            print('\nCtrl-C received. Exiting monitoring.')
+
+    def format_message(self, cmd_num, msg):
+
+        _, _, msg_description = self.IMReceiveCmds[cmd_num]
+        if 'from_id1' not in msg:
+            # a reply of the PLM to a command, about the device in its id1-3
+            dev_id, dev_name = self._construct_device_id('id', msg)
+            fields = ' '.join(f"{field}: '{msg[field]}'" for field in msg if field not in ('id1', 'id2', 'id3'))
+            return (f'{msg_description}:\n'
+                    f'  device: {dev_id} ({dev_name})\n'
+                    f'    => {fields}')
+        from_id, from_name = self._construct_device_id('from_id', msg)
+        to_id, to_name = self._construct_device_id('to_id', msg)
+        return (f'{msg_description}:\n'
+                f'  from: {from_id} ({from_name})\n'
+                f'  to:   {to_id} ({to_name})\n'
+                f"    => message flags: '{msg.msg_flags:02x}' cmds: '{msg.cmd1:02x}', '{msg.cmd2:02x}'")
+
     def _construct_device_id(self, id_str, msg):
-        dev_id = '.'.join([msg[id_str+'1'], msg[id_str+'2'], msg[id_str+'3']]).upper()
-        dev_name = 'unknown'
-        if dev_id in self.devices:
-            dev_name = self.devices[dev_id]['name'] + " in " + self.devices[dev_id]['room'] + " at " + self.devices[dev_id]['location']
-        return dev_id, dev_name
+        dev_key = (getattr(msg, id_str+'1') << 16) | (getattr(msg, id_str+'2') << 8) | getattr(msg, id_str+'3')
+        device = self.devices.get(dev_key)
+        if device is None:
+            return unpack_id(dev_key), 'unknown'
+        return device.id, device.display
 
     def _receive_msg(self):
-        msg_groups = {}
-        # need to clear out any leading nulls or garbage, until
-        # we see the STX (Start TeXt) byte signaling the beginning
-        # of the reply string or other monitor messages we need
-        # to consume until we get the reply message for the command
-        # we sent
-        byte_read = self.plm.read(1)
-        while (byte_read != bytearray.fromhex(self.IMParms['IM_COMM_STX'])):
-            byte_read = self.plm.read(1)
-
-        cmd_num_in_bytes = self.plm.read(1)
-        cmd_num = cmd_num_in_bytes.hex()
-
-        if cmd_num in self.IMReceiveCmds:
-            msg_len, msg_regex, _ = self.IMReceiveCmds[cmd_num]
-            msg_in_bytes = self.plm.read(msg_len)
-            msg = msg_in_bytes.hex()
-    
-            m = re.match(msg_regex, msg)
-            if m: 
-                msg_groups = m.groupdict()
+        """
+        Receive the next message from the PLM, skipping over any leading
+        nulls or garbage before the STX (Start TeXt) byte, as well as
+        returning monitor messages we need to consume until we get the
+        reply message for the command we sent.
 
-        return cmd_num, msg_groups
+        This reads the port directly, so it is only for use when the
+        reader thread is not running against it.
+
+        Returns (cmd_num, msg) with cmd_num as a hex string, or as None
+        if the PLM had nothing to say before the read timed out. The msg
+        is an InsteonMessage, or {} if the message was not recognized.
+        """
+        msg = {}
+
+        frame = self.decoder.read_frame(self.plm)
+        if frame is None:
+            return None, msg
+
+        cmd_num_byte, msg_in_bytes = frame
+
+        if msg_in_bytes is not None:
+            msg = self.layouts[cmd_num_byte].decode(msg_in_bytes) or {}
+
+        return HEX_BYTE[cmd_num_byte], msg
+
+    def _collect_metrics(self):
+        """
+        What the PLM counts anyway, for the metrics
+        """
+        yield 'insteon_serial_received_bytes_total', {}, self.decoder.received
+        yield 'insteon_frames_decoded_total', {}, self.decoder.frames
+        yield 'insteon_garbage_bytes_total', {}, self.decoder.skipped
+        yield 'insteon_plm_reconnects_total', {}, max(0, self.connections - 1)
+        for cmd, stats in self.get_send_stats().items():
+            yield 'insteon_commands_sent_total', {'command': cmd}, stats['count']
+            yield 'insteon_command_naks_total', {'command': cmd}, stats['naks']
+            yield 'insteon_command_timeouts_total', {'command': cmd}, stats['timeouts']
+
+    def import_devices(self, houselinc_path):
+        """
+        Import the devices of a HouseLinc settings export into the
+        configuration store, in place of devices.json, and into the device
+        registry, applying only what changed since the last import. Returns
+        the IDs of the devices added or changed, and of those removed.
+        """
+        from .insteon_houselinc import houselinc_devices
+
+        if not self.devices.store:
+            raise InsteonPLMConfigError('No configuration store to import the devices into')
+
+        changed, removed = self.devices.store.import_devices('insteon', houselinc_devices(houselinc_path),
+                                                             houselinc_path)
+        for dev_id in removed:
+            self.devices.remove_device(dev_id)
+        for dev_id in changed:
+            self.devices.add_device(dev_id, changed[dev_id])
+
+        return list(changed), removed
 
     def _load_config(self, config_file):
-        if not self.config_dir:
-            self.config_dir = os.path.join(os.path.dirname(sys.modules['services.insteon'].__file__), 'config')
-        try:
-            f = open(os.path.join(self.config_dir, config_file))
-            config_data = json.load(f)
-            f.close()
-        except IOError:
-            config_data = {}
-        return config_data
+
+        return load_config(self.store, config_file)
 
     def disconnect(self):
 
+        if self.supervisor:
+            self.supervisor.stop()
+            self.supervisor = None
+        self._stop_recording()
+        if self.sendq:
+            self.sendq.close()
+            self.sendq = None
+        if self.reader:
+            self.reader.close()
+            self.reader = None
         if self.plm:
             self.plm.close()
             self.plm = None
+        self.decoder.reset()
 
-    def connect(self):
-    
-        self.disconnect()
+    def _start_reader(self):
 
-        device = None
-        for port, _, hwid in comports():
-            if re.search(r"0403:6001", hwid):
-                device = port
-                break
+        self._open_reader()
+        self._start_recording()
+        self.sendq = SendQueue(self.reader, self.dispatcher,
+                               max_inflight=self.IMParms['IM_MAX_INFLIGHT'],
+                               timeout=self.IMParms['IM_CMD_TIMEOUT'],
+                               nak=int(self.IMParms['IM_CMD_FAILURE'], 16),
+                               nak_retries=self.IMParms['IM_NAK_RETRIES'],
+                               nak_backoff=self.IMParms['IM_NAK_BACKOFF'],
+                               hold=self.IMParms['IM_RECONNECT_HOLD'] if self.IMParms.get('IM_RECONNECT') else 0,
+                               lost=self._connection_lost)
 
-        if device:
+    def _open_reader(self):
+
+        self.decoder.reset()
+        self.reader = PLMReaderThread(self.plm, lambda: PLMProtocol(self.dispatcher, self._connection_lost))
+        self.reader.start()
+        self.reader.connect()
+
+    def _connection_lost(self, err):
+        """
+        Called on the reader thread, or the sender's if a write fails first,
+        when the PLM is gone (e.g. unplugged): hold the commands sent until
+        the supervisor has reconnected
+        """
+        if self.supervisor and not self.sendq.suspend():
+            return  # already told, by the other thread
+        print(f'ERROR: Lost connection to PLM: {err}')  # TODO: convert to a log write
+        if metrics.enabled:
+            metrics.count('insteon_plm_connections_lost_total')
+        if self.supervisor:
+            self.supervisor.connection_lost()
+
+    def reconnect(self):
+        """
+        Connect to the PLM again, once the connection to it is lost, on the
+        port it was on if that is back, else on the port it is found on.
+        The commands held meanwhile are then sent. Returns whether the
+        PLM was reconnected.
+        """
+        if self.reader:
+            self.reader.close()
+            self.reader = None
+        if self.plm:
             try:
-                self.plm = serial.Serial(port=device,
-                                         baudrate=self.IMParms['IM_BAUDRATE'],
-                                         timeout=self.IMParms['IM_CMD_TIMEOUT'])
-            except serial.SerialException:  # TODO: convert each exception to a log write
-                print('  --> Failed to open serial port')
-                self.plm = None
+                self.plm.close()
+            except (OSError, serial.SerialException):
+                pass
+            self.plm = None
+
+        held = self._held_ports()
+        for device in dict.fromkeys([self.port, self._find_port()]):
+            if not device or os.path.realpath(device) in held:
+                continue
+            self._open_port(device, self.IMParms['IM_CMD_TIMEOUT'], report=False)
+            if not self.plm:
+                continue
+            self._open_reader()
+            if self._probe():
+                self._remember_port(device)
+                self.connections += 1
+                self.sendq.resume(self.reader)
+                return True
+            self.reader.close()
+            self.reader = None
+            self.plm.close()
+            self.plm = None
+        return False
+
+    def _probe(self):
+        """
+        Whether a PLM answers GET_VERSION, asked directly rather than
+        through the send queue, which is holding commands meanwhile
+        """
+        cmd_str = self.IMSendCmds['GET_VERSION'][0]
+        reply = self.dispatcher.expect_reply(cmd_str[2:4].lower())
+        try:
+            self.reader.write(bytes.fromhex(cmd_str))
+            response = reply.result(self.IMParms['IM_CMD_TIMEOUT'])
+        except (serial.SerialException, OSError, TimeoutError, CancelledError):
+            self.dispatcher.cancel_reply(cmd_str[2:4].lower(), reply)
+            return False
+        return bool(response) and response.ack == self.cmd_success
+
+    def _remember_port(self, device):
+
+        self.port = device
+        if os.path.exists(device):
+            try:
+                os.makedirs(os.path.dirname(self.port_cache), exist_ok=True)
+                with open(self.port_cache, 'w') as f:
+                    f.write(by_id_link(device) + '\n')
             except OSError:
+                pass
+
+    def _last_port(self):
+        """
+        The port the PLM was last connected to, if it is (still) there
+        """
+        try:
+            with open(self.port_cache) as f:
+                device = f.read().strip()
+        except OSError:
+            return None
+        return device if device and os.path.exists(device) else None
+
+    def _start_recording(self):
+        """
+        Record every message received from the PLM in the history
+        """
+        if not self.recording:
+            return
+        self.recorder = EventRecorder(self.history)
+        self.recorder.start()
+        self.subscribe(None, self.recorder.record)
+
+    def _stop_recording(self):
+
+        if self.recorder:
+            self.unsubscribe(None, self.recorder.record)
+            self.recorder.stop()
+            self.recorder = None
+
+    def _find_port(self):
+        """
+        The first port a PLM is found on, but for the ports the other
+        members of its group are connected to
+        """
+        held = self._held_ports()
+        for device in find_plm_ports():
+            if os.path.realpath(device) not in held:
+                return device
+        return None
+
+    def _held_ports(self):
+        """
+        The ports (their real paths) the other members of its group are
+        connected to, which are not to be opened a second time
+        """
+        if not self.group:
+            return set()
+        return {os.path.realpath(plm.port) for plm in self.group.get_members() if plm is not self and plm.port and plm.plm}
+
+    def _open_port(self, device, timeout, report=True):
+
+        try:
+            self.plm = serial.serial_for_url(device,
+                                             baudrate=self.IMParms['IM_BAUDRATE'],
+                                             timeout=timeout)
+        except serial.SerialException:  # TODO: convert each exception to a log write
+            if report:
+                print('  --> Failed to open serial port')
+            self.plm = None
+        except OSError:
+            if report:
                 print('  --> Unable to access serial port')
-                self.plm = None
+            self.plm = None
+
+    def _show_version(self, response):
+
+        print(f"Insteon PLM ID= {response['id1']}.{response['id2']}.{response['id3']}: ", end='')
+        print(f"device category={response['dev_cat']}, subcategory={response['dev_subcat']}, firmware version={response['firm_ver']}")
+
+    def connect(self, port=None):
+        """
+        Connect to the PLM on the port, which is a device or a serial URL
+        (e.g. plmsim://?trace=... for a simulated PLM), or IM_PORT if not
+        given, or else the port it was last connected to, or the first USB
+        port a PLM is found on. With IM_RECONNECT, the PLM is reconnected
+        to whenever the connection to it is lost.
+        """
     
+        self.disconnect()
+
+        device = port or self.IMParms.get('IM_PORT') or self._last_port() or self._find_port()
+        if device:
+            self._open_port(device, self.IMParms['IM_CMD_TIMEOUT'])
+
+        if self.plm:
+            self._start_reader()
             response = self.send_command('GET_VERSION')
             if response:
-                print(f"Insteon PLM ID= {response['id1']}.{response['id2']}.{response['id3']}: ", end='')
-                print(f"device category={response['dev_cat']}, subcategory={response['dev_subcat']}, firmware version={response['firm_ver']}")
+                self._show_version(response)
+                self.plm_id = f"{response['id1']}.{response['id2']}.{response['id3']}".upper()
+                self._remember_port(device)
+                self.connections += 1
+                if self.IMParms.get('IM_RECONNECT'):
+                    self.supervisor = PLMSupervisor(self, self.IMParms['IM_RECONNECT_BACKOFF'],
+                                                    self.IMParms['IM_RECONNECT_BACKOFF_MAX'])
+                    self.supervisor.start()
             else:
                 print('  --> failed to send IM command to serial port')
-                self.plm.close()
-                self.plm = None # assume not a PLM on this port
+                self.disconnect() # assume not a PLM on this port
 
         if not self.plm:
-            raise InsteonPLMConfigError('Could not find a PLM attached to a USB port')
+            raise InsteonPLMConfigError(f'Could not find a PLM on "{device}"' if device else
+                                        'Could not find a PLM attached to a USB port')
 
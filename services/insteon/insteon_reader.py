@@ -0,0 +1,160 @@
+import collections
+import threading
+
+from concurrent.futures import Future
+
+from serial.threaded import FramedPacket, ReaderThread
+
+from metrics import metrics
+
+from .insteon_decoder import HEX_BYTE
+
+# Terminology:
+#   IM = Insteon PLM
+#   subscriber = callable(cmd_num, msg) wanting every message received of
+#                a given command number (or of all of them, for None)
+#   reply = the message the PLM echoes back for a command sent to it,
+#           carrying the ACK/NAK for the command
+
+class PLMReaderThread(ReaderThread):
+    """
+    A PLMReaderThread owns the PLM's serial port: it is the only reader
+    of it, and writes to it are serialized through its lock.
+    """
+
+    def write(self, data):
+        """Thread safe writing (uses lock), returning the bytes written"""
+        with self._lock:
+            num_written = self.serial.write(data)
+        if metrics.enabled:
+            metrics.count('insteon_serial_sent_bytes_total', num_written)
+        return num_written
+
+
+class PLMProtocol(FramedPacket):
+    """
+    The protocol spoken by the PLM over the reader thread. Frames are not
+    delimited by START/STOP markers as FramedPacket expects, but by STX
+    and a length fixed by the command number, so the FrameDecoder finds
+    them and each one is handed to the dispatcher as a packet.
+    """
+
+    def __init__(self, dispatcher, lost=None):
+        super().__init__()
+        self.dispatcher = dispatcher
+        self.lost = lost    # called when the connection is lost, not closed
+
+    def data_received(self, data):
+        for cmd_num, body in self.dispatcher.decoder.decode(data):
+            self.handle_packet((cmd_num, body))
+
+    def handle_packet(self, packet):
+        self.dispatcher.dispatch(*packet)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.dispatcher.connection_lost(exc)
+        if exc is not None and self.lost:
+            self.lost(exc)
+
+
+class PLMDispatcher:
+    """
+    A PLMDispatcher demultiplexes the messages arriving from the PLM:
+    first to the oldest outstanding reply future for the message's command
+    number (whose echo it carries, if any), then to every subscriber of that command number, and to every
+    subscriber of all messages. Subscribers run on the reader thread, so
+    they must be quick; those with real work to do should queue it.
+    """
+
+    def __init__(self, decoder, layouts, future_factory=Future):
+        self.decoder = decoder
+        self.future_factory = future_factory
+        self.layouts = layouts
+        self.lock = threading.Lock()
+        self.replies = collections.defaultdict(collections.deque)
+        self.subscribers = collections.defaultdict(list)
+        self.error = None
+
+    def subscribe(self, cmd_num, subscriber):
+        """
+        Subscribe to messages of the command number (a hex string),
+        or to all messages when cmd_num is None
+        """
+        key = None if cmd_num is None else int(cmd_num, 16)
+        with self.lock:
+            self.subscribers[key] = self.subscribers[key] + [subscriber]
+
+    def unsubscribe(self, cmd_num, subscriber):
+        key = None if cmd_num is None else int(cmd_num, 16)
+        with self.lock:
+            self.subscribers[key] = [s for s in self.subscribers[key] if s is not subscriber]
+
+    def expect_reply(self, cmd_num, echo=None):
+        """
+        Register for the next reply of the command number (a hex string),
+        which must be done before the command is written to the PLM. With
+        echo, only a reply whose body starts with it is taken, as the PLM
+        echoes back some commands (e.g. a message sent to a device) in
+        their replies, so that a late reply to a command that timed out
+        is not taken for the reply to the next one.
+        """
+        future = self.future_factory()
+        with self.lock:
+            self.replies[int(cmd_num, 16)].append((future, echo))
+        return future
+
+    def cancel_reply(self, cmd_num, future):
+        with self.lock:
+            replies = self.replies[int(cmd_num, 16)]
+            for waiter in replies:
+                if waiter[0] is future:
+                    replies.remove(waiter)
+                    break
+        future.cancel()
+
+    def dispatch(self, cmd_num, body):
+        msg = {}
+        if body is not None:
+            msg = self.layouts[cmd_num].decode(body) or {}
+
+        with self.lock:
+            future = None
+            replies = self.replies.get(cmd_num)
+            for waiter in list(replies or ()) if msg else ():
+                waiter_future, echo = waiter
+                if echo is not None and body[:len(echo)] != echo:
+                    continue    # e.g. the late reply to a command that timed out
+                replies.remove(waiter)
+                if self._claim(waiter_future):  # else e.g. cancelled by a waiter timing out
+                    future = waiter_future
+                    break
+            subscribers = self.subscribers.get(cmd_num, []) + self.subscribers.get(None, [])
+
+        if future is not None:
+            future.set_result(msg)
+
+        cmd_num = HEX_BYTE[cmd_num]
+        for subscriber in subscribers:
+            try:
+                subscriber(cmd_num, msg)
+            except Exception as err:  # TODO: convert to a log write
+                print(f'ERROR: Subscriber to "{cmd_num}" messages failed: {err}')
+
+    def connection_lost(self, exc):
+        self.error = exc
+        with self.lock:
+            pending = [future for replies in self.replies.values() for future, _ in replies]
+            self.replies.clear()
+        for future in pending:
+            future.cancel()
+
+    def _claim(self, future):
+        """
+        Whether the reply future is still waited on, claiming it for the
+        reply so that it can no longer be cancelled (e.g. by the send queue
+        timing it out, on its own thread) before the reply is set
+        """
+        if isinstance(future, Future):
+            return future.set_running_or_notify_cancel()
+        return not future.done()    # e.g. asyncio's, only ever cancelled on its loop's thread
@@ -0,0 +1,293 @@
+import collections
+import heapq
+import itertools
+import threading
+import time
+
+from concurrent.futures import Future
+
+# Terminology:
+#   IM = Insteon PLM
+#   in flight = written to the PLM, its reply (ACK/NAK) not yet received
+#   NAK = the PLM's reply that it could not take the command (e.g. its
+#         buffer is full), and that the command should be sent again
+#   suspended = the connection to the PLM is lost, so commands are held
+#               until it is back
+
+class PendingCommand:
+    """
+    A command submitted to the send queue, until its reply is final
+    """
+
+    __slots__ = ('name', 'data', 'reply_cmd_num', 'echo', 'future', 'reply',
+                 'submitted', 'sent', 'deadline', 'attempts')
+
+    def __init__(self, name, data, reply_cmd_num, echo=None):
+        self.name = name
+        self.data = data
+        self.reply_cmd_num = reply_cmd_num
+        self.echo = echo            # what its reply starts with, see PLMDispatcher.expect_reply
+        self.future = Future()
+        self.reply = None
+        self.submitted = time.monotonic()
+        self.sent = None            # order in which it was last written, among all commands
+        self.deadline = None
+        self.attempts = 0
+
+
+class CommandStats:
+    """
+    Latency of a command, from submission to its final reply, over the
+    most recent samples, along with its counts of NAKs and timeouts
+    """
+
+    SAMPLES = 1024
+
+    def __init__(self):
+        self.count = 0
+        self.naks = 0
+        self.timeouts = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = collections.deque(maxlen=self.SAMPLES)
+
+    def record(self, latency):
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+        self.samples.append(latency)
+
+    def merge(self, other):
+        """
+        Take in the counts and samples of another command's stats (e.g. of
+        the same command sent through another PLM)
+        """
+        self.count += other.count
+        self.naks += other.naks
+        self.timeouts += other.timeouts
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.samples.extend(other.samples)
+
+    def percentile(self, pct):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def summary(self):
+        return {'count': self.count,
+                'naks': self.naks,
+                'timeouts': self.timeouts,
+                'mean': self.total / self.count if self.count else 0.0,
+                'p50': self.percentile(50),
+                'p99': self.percentile(99),
+                'max': self.max}
+
+
+class SendQueue:
+    """
+    A SendQueue pipelines commands to the PLM: up to max_inflight of them
+    are written before their replies come back. The PLM replies to the
+    commands of a command number in the order they were sent, so each
+    reply is correlated to its command by the dispatcher's FIFO of reply
+    futures. A NAK puts the command back on the queue after a backoff
+    that doubles with each attempt, up to nak_retries times.
+
+    One sender thread does all writes, so that the order in which replies
+    are expected is the order in which commands reach the PLM.
+
+    While the connection to the PLM is lost, the queue is suspended: the
+    commands in flight go back to the front of the queue, to be sent
+    again (in the same order) once it is resumed on the new connection,
+    and commands are held for up to hold seconds waiting for it. Should
+    a write fail first, the queue suspends itself, and lost(err) is called
+    (on the sender thread) to have the connection made again.
+    """
+
+    def __init__(self, reader, dispatcher, max_inflight, timeout, nak, nak_retries, nak_backoff, hold=0, lost=None):
+        self.reader = reader
+        self.dispatcher = dispatcher
+        self.max_inflight = max_inflight
+        self.timeout = timeout
+        self.nak = nak
+        self.nak_retries = nak_retries
+        self.nak_backoff = nak_backoff
+        self.hold = hold
+        self.lost = lost
+        self.suspended = False
+        self.cond = threading.Condition()
+        self.waiting = collections.deque()
+        self.delayed = []               # heap of (due, seq, pending) backing off after a NAK
+        self.seq = itertools.count()
+        self.inflight = set()
+        self.stats = collections.defaultdict(CommandStats)
+        self.alive = True
+        self.sender = threading.Thread(target=self._run, name='PLMSender', daemon=True)
+        self.sender.start()
+
+    def submit(self, name, data, reply_cmd_num, echo=None):
+        """
+        Queue a command for the PLM, returning a future of its reply:
+        the InsteonMessage the PLM replied with, or {} if it never did.
+        With echo, only a reply starting with it is taken for the command.
+        """
+        pending = PendingCommand(name, data, reply_cmd_num, echo)
+        with self.cond:
+            if not self.alive:
+                pending.future.set_result({})
+                return pending.future
+            self.waiting.append(pending)
+            self.cond.notify()
+        return pending.future
+
+    def close(self):
+        """
+        Stop sending, giving an empty reply to all commands not yet done
+        """
+        with self.cond:
+            self.alive = False
+            abandoned = list(self.waiting) + [pending for _, _, pending in self.delayed] + list(self.inflight)
+            self.waiting.clear()
+            self.delayed.clear()
+            self.inflight.clear()
+            self.cond.notify()
+        for pending in abandoned:
+            if pending.reply:
+                self.dispatcher.cancel_reply(pending.reply_cmd_num, pending.reply)
+            if not pending.future.done():
+                pending.future.set_result({})
+        self.sender.join(2)
+
+    def suspend(self):
+        """
+        Stop sending, as the connection to the PLM is lost, taking back the
+        commands in flight to send again on resuming. Returns whether it
+        was sending, i.e. whether this is the first news of the loss.
+        """
+        with self.cond:
+            if self.suspended:
+                return False
+            self.suspended = True
+            for pending in sorted(self.inflight, key=lambda p: p.sent, reverse=True):
+                self.dispatcher.cancel_reply(pending.reply_cmd_num, pending.reply)
+                pending.attempts -= 1   # it was never answered, NAK or not
+                self.waiting.appendleft(pending)
+            self.inflight.clear()
+            self.cond.notify()
+        return True
+
+    def resume(self, reader):
+        """
+        Send again, through the reader of the new connection to the PLM
+        """
+        with self.cond:
+            self.reader = reader
+            self.suspended = False
+            self.cond.notify()
+
+    def get_stats(self):
+        with self.cond:
+            return {name: self.stats[name].summary() for name in self.stats}
+
+    def merge_stats(self, stats):
+        """
+        Merge the stats of each command into stats, a defaultdict of
+        CommandStats (e.g. those of the queues of other PLMs)
+        """
+        with self.cond:
+            for name in self.stats:
+                stats[name].merge(self.stats[name])
+
+    def backlog(self):
+        """
+        How many commands are not yet done: queued, in flight, or backing off
+        """
+        with self.cond:
+            return len(self.waiting) + len(self.inflight) + len(self.delayed)
+
+    def _run(self):
+        with self.cond:
+            while self.alive:
+                now = time.monotonic()
+
+                while self.delayed and self.delayed[0][0] <= now:
+                    self.waiting.append(heapq.heappop(self.delayed)[2])
+
+                for pending in [p for p in self.inflight if p.deadline <= now]:
+                    self.inflight.discard(pending)
+                    self.dispatcher.cancel_reply(pending.reply_cmd_num, pending.reply)
+                    self.stats[pending.name].timeouts += 1
+                    print(f'ERROR: Timed out waiting for reply to command: "{pending.name}"')
+                    pending.future.set_result({})
+
+                if self.suspended:
+                    for pending in [p for p in self.waiting if p.submitted + self.hold <= now]:
+                        self.waiting.remove(pending)
+                        print(f'ERROR: PLM is not connected, gave up on command: "{pending.name}"')
+                        pending.future.set_result({})
+                    wakeups = [p.submitted + self.hold for p in self.waiting]
+                    if self.delayed:
+                        wakeups.append(self.delayed[0][0])
+                    self.cond.wait(min(wakeups) - now if wakeups else None)
+                    continue
+
+                while self.waiting and len(self.inflight) < self.max_inflight and not self.suspended:
+                    self._send(self.waiting.popleft(), now)
+                if self.suspended:
+                    continue    # a write failed, so hold the commands
+
+                wakeups = [p.deadline for p in self.inflight]
+                if self.delayed:
+                    wakeups.append(self.delayed[0][0])
+                self.cond.wait(min(wakeups) - now if wakeups else None)
+
+    def _send(self, pending, now):
+        pending.attempts += 1
+        pending.sent = next(self.seq)   # several are sent at the same now
+        pending.deadline = now + self.timeout
+        pending.reply = self.dispatcher.expect_reply(pending.reply_cmd_num, pending.echo)
+        pending.reply.add_done_callback(lambda reply: self._replied(pending, reply))
+        self.inflight.add(pending)
+        try:
+            num_written = self.reader.write(pending.data)
+        except Exception as err:  # e.g. serial.SerialException, port gone
+            print(f'ERROR: Failure to send command "{pending.name}": {err}')
+            if self.hold:   # held for the connection to come back
+                self.inflight.discard(pending)
+                self.dispatcher.cancel_reply(pending.reply_cmd_num, pending.reply)
+                pending.attempts -= 1
+                self.waiting.appendleft(pending)
+                if self.lost:
+                    self.lost(err)  # which suspends the queue, as the reader would on noticing
+                self.suspend()
+                return
+            num_written = 0
+        if num_written != len(pending.data):
+            self.inflight.discard(pending)
+            self.dispatcher.cancel_reply(pending.reply_cmd_num, pending.reply)
+            print(f'ERROR: Failure to send command: {num_written = }, write_len = {len(pending.data)}')
+            pending.future.set_result({})
+
+    def _replied(self, pending, reply):
+        """
+        Called on the reader thread when the reply to a command arrives
+        """
+        if reply.cancelled():
+            return
+        msg = reply.result()
+        with self.cond:
+            if pending not in self.inflight:
+                return
+            self.inflight.discard(pending)
+            stats = self.stats[pending.name]
+            if msg.ack == self.nak and pending.attempts <= self.nak_retries:
+                stats.naks += 1
+                due = time.monotonic() + self.nak_backoff * 2 ** (pending.attempts - 1)
+                heapq.heappush(self.delayed, (due, next(self.seq), pending))
+            else:
+                if msg.ack == self.nak:
+                    stats.naks += 1
+                stats.record(time.monotonic() - pending.submitted)
+                pending.future.set_result(msg)
+            self.cond.notify()
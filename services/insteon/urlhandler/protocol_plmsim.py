@@ -0,0 +1,406 @@
+#
+# This module implements a simulated Insteon PLM, as a serial port.
+#
+# It plays back a captured trace of what a PLM sent (garbage before an
+# STX, 0x50 broadcasts, ...), and answers the commands written to it as a
+# PLM would, after a configurable latency, NAKing a configurable share of
+# them. Bytes the PLM sends are read from a pipe, so the port has a file
+# descriptor that select() and asyncio's add_reader can watch.
+#
+# URL format:    plmsim://[?option=value[&option=value...]]
+# options:
+# - trace=<path>     trace to play back: lines of "<seconds> <hex bytes>",
+#                    the seconds being since the start of the trace
+# - speed=<factor>   play the trace this many times faster (0: no waiting)
+# - repeat=<count>   play the trace this many times (0: forever), default 1
+# - latency=<secs>   delay before answering a command, default 0
+# - nak=<fraction>   share of messages sent (0x62) NAKed, as a busy PLM
+#                    does, default 0
+# - id=<AA.BB.CC>    ID of the simulated PLM, default 11.22.33
+# - seed=<int>       seed of the NAKs' randomness
+# - unplug=<secs>    act as if the PLM is unplugged this long after opening,
+#                    failing reads and writes as pyserial does then
+# - replug=<secs>    how long it stays unplugged: opening the same URL
+#                    fails meanwhile, default 0.2
+# - logging={debug|info|warning|error}
+import fcntl
+import heapq
+import logging
+import os
+import random
+import select
+import struct
+import termios
+import threading
+import time
+import urllib.parse as urlparse
+
+from serial.serialutil import SerialBase, SerialException, to_bytes, portNotOpenError
+
+# Terminology:
+#   IM = Insteon PLM
+
+LOGGER_LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+}
+
+IM_STX = 0x02
+IM_ACK = 0x06
+IM_NAK = 0x15
+IM_GET_VERSION = 0x60
+IM_SEND_MSG = 0x62
+IM_EXTENDED_FLAG = 0x10
+
+# bytes following the command number of each command the host sends,
+# from the PLM developer's guide
+IM_SEND_LENGTHS = {0x60: 0, 0x61: 3, 0x62: 6, 0x63: 2, 0x64: 2, 0x65: 0, 0x66: 3, 0x67: 0,
+                   0x68: 1, 0x69: 0, 0x6a: 0, 0x6b: 1, 0x6c: 0, 0x6d: 0, 0x6e: 0, 0x6f: 9,
+                   0x70: 1, 0x71: 2, 0x72: 0, 0x73: 0}
+
+IM_DEVICE_CATEGORY = (0x03, 0x15, 0x9b)  # category, subcategory, firmware of a 2413U
+
+
+def read_trace(path):
+    """
+    Generator of (seconds, bytes) of a trace file, skipping blank lines
+    and # comments
+    """
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                offset, _, hex_bytes = line.partition(' ')
+                yield float(offset), bytes.fromhex(hex_bytes)
+
+
+class Serial(SerialBase):
+    """Serial port implementation that simulates an Insteon PLM in plain software."""
+
+    BAUDRATES = (9600, 19200, 38400, 57600, 115200)
+
+    unplugged = {}  # URL: when the PLM simulated by it is plugged back in
+
+    def __init__(self, *args, **kwargs):
+        self.logger = None
+        self.trace = None
+        self.speed = 1.0
+        self.repeat = 1
+        self.latency = 0.0
+        self.nak = 0.0
+        self.plm_id = bytes.fromhex('112233')
+        self.random = random.Random()
+        self.rx_fd = self.tx_fd = None
+        self.cancel_fd = self.cancelled_fd = None
+        self.lock = threading.Condition()
+        self.scheduled = []      # heap of (due, seq, bytes) the PLM is to send
+        self.seq = 0
+        self.received = bytearray()  # what the host sent, not yet a whole command
+        self.player = None
+        self.commands = 0
+        self.naks = 0
+        self.unplug = None
+        self.replug = 0.2
+        self.unplug_at = None
+        super(Serial, self).__init__(*args, **kwargs)
+
+    def open(self):
+        """\
+        Open port with current settings. This may throw a SerialException
+        if the port cannot be opened.
+        """
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+        self.from_url(self.port)
+        if time.monotonic() < self.unplugged.get(self.port, 0):
+            raise SerialException('could not open port {}: [Errno 2] No such file or directory'.format(self.port))
+
+        self.rx_fd, self.tx_fd = os.pipe()
+        os.set_blocking(self.rx_fd, False)
+        os.set_blocking(self.tx_fd, False)
+        self.cancelled_fd, self.cancel_fd = os.pipe()
+        os.set_blocking(self.cancelled_fd, False)
+
+        self.is_open = True
+        if self.unplug is not None:
+            self.unplug_at = time.monotonic() + self.unplug
+        self.player = threading.Thread(target=self._play, name='PLMSimulator', daemon=True)
+        self.player.start()
+
+    def close(self):
+        if self.is_open:
+            with self.lock:
+                self.is_open = False
+                self.lock.notify_all()
+            self.player.join()
+            for fd in (self.rx_fd, self.tx_fd, self.cancel_fd, self.cancelled_fd):
+                os.close(fd)
+            self.rx_fd = self.tx_fd = self.cancel_fd = self.cancelled_fd = None
+        super(Serial, self).close()
+
+    def _reconfigure_port(self):
+        """Set communication parameters on opened port: all are ignored"""
+        if self.logger:
+            self.logger.info('_reconfigure_port()')
+
+    def from_url(self, url):
+        """extract the simulation's options from an URL string"""
+        parts = urlparse.urlsplit(url)
+        if parts.scheme != "plmsim":
+            raise SerialException(
+                'expected a string in the form "plmsim://[?option=value[&...]]": '
+                'not starting with plmsim:// ({!r})'.format(parts.scheme))
+        try:
+            for option, values in urlparse.parse_qs(parts.query, True).items():
+                if option == 'logging':
+                    logging.basicConfig()
+                    self.logger = logging.getLogger('pySerial.plmsim')
+                    self.logger.setLevel(LOGGER_LEVELS[values[0]])
+                    self.logger.debug('enabled logging')
+                elif option == 'trace':
+                    if not os.path.isfile(values[0]):
+                        raise ValueError('no such trace: {!r}'.format(values[0]))
+                    self.trace = values[0]
+                elif option == 'speed':
+                    self.speed = float(values[0])
+                elif option == 'repeat':
+                    self.repeat = int(values[0])
+                elif option == 'latency':
+                    self.latency = float(values[0])
+                elif option == 'nak':
+                    self.nak = float(values[0])
+                elif option == 'id':
+                    self.plm_id = bytes.fromhex(values[0].replace('.', ''))
+                elif option == 'seed':
+                    self.random.seed(int(values[0]))
+                elif option == 'unplug':
+                    self.unplug = float(values[0])
+                elif option == 'replug':
+                    self.replug = float(values[0])
+                else:
+                    raise ValueError('unknown option: {!r}'.format(option))
+        except (ValueError, KeyError) as e:
+            raise SerialException(
+                'expected a string in the form "plmsim://[?option=value[&...]]": {}'.format(e))
+
+    #  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -
+
+    def fileno(self):
+        """For select(): readable when the PLM has sent something"""
+        if not self.is_open:
+            raise portNotOpenError
+        return self.rx_fd
+
+    @property
+    def in_waiting(self):
+        """Return the number of bytes currently in the input buffer."""
+        if not self.is_open:
+            raise portNotOpenError
+        return struct.unpack('I', fcntl.ioctl(self.rx_fd, termios.FIONREAD, b'\0\0\0\0'))[0]
+
+    def read(self, size=1):
+        """\
+        Read size bytes from the serial port. If a timeout is set it may
+        return less characters as requested. With no timeout it will block
+        until the requested number of bytes is read.
+        """
+        if not self.is_open:
+            raise portNotOpenError
+        deadline = None if self._timeout is None else time.monotonic() + self._timeout
+        data = bytearray()
+        while len(data) < size:
+            self._check_plugged()
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            if self.unplug_at is not None:
+                timeout = max(0, self.unplug_at - time.monotonic()) if timeout is None else \
+                              min(timeout, max(0, self.unplug_at - time.monotonic()))
+            ready, _, _ = select.select([self.rx_fd, self.cancelled_fd], [], [], timeout)
+            if self.cancelled_fd in ready:
+                os.read(self.cancelled_fd, 1024)
+                break
+            if not ready:
+                break
+            try:
+                data += os.read(self.rx_fd, size - len(data))
+            except BlockingIOError:
+                pass
+        return bytes(data)
+
+    def cancel_read(self):
+        if self.is_open:
+            os.write(self.cancel_fd, b'x')
+
+    def write(self, data):
+        """\
+        Take what the host sends, answering each whole command in it as
+        a PLM would
+        """
+        if not self.is_open:
+            raise portNotOpenError
+        self._check_plugged(writing=True)
+        data = to_bytes(data)
+        with self.lock:
+            self.received += data
+            while True:
+                command = self._next_command()
+                if command is None:
+                    break
+                reply = self._reply(command)
+                if self.logger:
+                    self.logger.debug('command {} -> reply {}'.format(command.hex(), reply.hex()))
+                self._schedule(time.monotonic() + self.latency, reply)
+        return len(data)
+
+    def reset_input_buffer(self):
+        """Clear input buffer, discarding all that is in the buffer."""
+        if not self.is_open:
+            raise portNotOpenError
+        try:
+            while os.read(self.rx_fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def reset_output_buffer(self):
+        """Clear output buffer: there is none"""
+        if not self.is_open:
+            raise portNotOpenError
+
+    def _update_break_state(self):
+        pass
+
+    def _update_rts_state(self):
+        pass
+
+    def _update_dtr_state(self):
+        pass
+
+    @property
+    def cts(self):
+        return True
+
+    @property
+    def dsr(self):
+        return True
+
+    @property
+    def ri(self):
+        return False
+
+    @property
+    def cd(self):
+        return True
+
+    # - - - the simulated PLM - - -
+
+    def _check_plugged(self, writing=False):
+        """Fail as pyserial does once the PLM is unplugged"""
+        if self.unplug_at is None or time.monotonic() < self.unplug_at:
+            return
+        if self.unplugged.get(self.port, 0) < self.unplug_at:
+            self.unplugged[self.port] = self.unplug_at + self.replug
+        if writing:
+            raise SerialException('write failed: [Errno 5] Input/output error')
+        raise SerialException('device reports readiness to read but returned no data '
+                              '(device disconnected or multiple access on port?)')
+
+    def _next_command(self):
+        """Take the next whole command out of what the host sent, if any"""
+        # a PLM ignores whatever does not start with STX
+        start = self.received.find(IM_STX)
+        if start < 0:
+            del self.received[:]
+            return None
+        del self.received[:start]
+        if len(self.received) < 2:
+            return None
+
+        cmd_num = self.received[1]
+        length = 2 + IM_SEND_LENGTHS.get(cmd_num, 0)
+        if cmd_num == IM_SEND_MSG and len(self.received) >= 6 and self.received[5] & IM_EXTENDED_FLAG:
+            length += 14  # extended message: user data
+        if len(self.received) < length:
+            return None
+
+        command = bytes(self.received[:length])
+        del self.received[:length]
+        return command
+
+    def _reply(self, command):
+        self.commands += 1
+        if command[1] not in IM_SEND_LENGTHS:
+            self.naks += 1
+            return bytes([IM_NAK])
+        if command[1] == IM_SEND_MSG and self.nak and self.random.random() < self.nak:
+            self.naks += 1
+            return command + bytes([IM_NAK])
+        if command[1] == IM_GET_VERSION:
+            return command + self.plm_id + bytes(IM_DEVICE_CATEGORY) + bytes([IM_ACK])
+        return command + bytes([IM_ACK])
+
+    def _schedule(self, due, data):
+        heapq.heappush(self.scheduled, (due, self.seq, data))
+        self.seq += 1
+        self.lock.notify()
+
+    def _trace(self):
+        """Generator of (due, bytes) of the trace, played repeat times from now"""
+        if not self.trace:
+            return
+        played = 0
+        while self.repeat == 0 or played < self.repeat:
+            start = time.monotonic()
+            for offset, data in read_trace(self.trace):
+                yield (start + offset / self.speed if self.speed else 0), data
+            played += 1
+
+    def _play(self):
+        """Send what is due: the trace and the replies to commands, in time order"""
+        trace = self._trace()
+        next_trace = next(trace, None)
+        with self.lock:
+            while self.is_open:
+                due = [self.scheduled[0][0]] if self.scheduled else []
+                if next_trace:
+                    due.append(next_trace[0])
+                if not due:
+                    self.lock.wait()
+                    continue
+                wait = min(due) - time.monotonic()
+                if wait > 0:
+                    self.lock.wait(wait)
+                    continue
+
+                if next_trace and (not self.scheduled or next_trace[0] <= self.scheduled[0][0]):
+                    data = next_trace[1]
+                    next_trace = next(trace, None)
+                else:
+                    data = heapq.heappop(self.scheduled)[2]
+                self.lock.release()
+                try:
+                    self._send(data)
+                finally:
+                    self.lock.acquire()
+
+    def _send(self, data):
+        # waits while the host has not read enough, as long as it is open
+        data = memoryview(data)
+        while data and self.is_open:
+            _, ready, _ = select.select([], [self.tx_fd], [], 0.1)
+            if ready:
+                data = data[os.write(self.tx_fd, data):]
+
+
+# simple client test
+if __name__ == '__main__':
+    import sys
+    s = Serial('plmsim://?latency=0.01')
+    sys.stdout.write('{}\n'.format(s))
+    s.timeout = 1
+    s.write(bytes.fromhex('0260'))
+    sys.stdout.write("read: {!r}\n".format(s.read(9).hex()))
+    s.close()
@@ -1 +1,7 @@
-from .serial import Serial
+# The service is only imported when it is first asked for, so that
+# loading just its commands (see ServiceProxy) stays cheap
+def __getattr__(name):
+    if name == 'Serial':
+        from .serial import Serial
+        return Serial
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1,10 +1,9 @@
 import os
-import serial.tools
 
-from command import Command, CommandInterface
+from command import Command, CommandInterface, Form
 
 if os.name == 'posix':
-    from serial.tools.list_ports_posix import comports
+    from ports import PortInventory
 else:
     raise ImportError(f'ERROR: platform ("{os.name}") not supported')
 
@@ -23,7 +22,9 @@ class Devices(Command):
                                             })
 
     def execute(self, args):
-        devices= sorted(comports(include_links=args.symlinks))
-        return [f'{port}' + (f'\n   ID={hwid}: {desc}' if args.verbose else '')
-                  for entry, (port, desc, hwid) in enumerate(devices, 1)
-                      if args.entry is None or args.entry == entry]
+        devices= sorted(PortInventory.shared().comports(include_links=args.symlinks))
+        output = [Form('{device}\n   ID={hwid}: {description}' if args.verbose else '{device}')]
+        output += [{'device': port, 'description': desc, 'hwid': hwid}
+                      for entry, (port, desc, hwid) in enumerate(devices, 1)
+                          if args.entry is None or args.entry == entry]
+        return output
@@ -4,7 +4,7 @@ from service import Service
 
 class Serial(Service):
 
-    def __init__(self, path):
+    def __init__(self, path, proxy=None):
         Service.__init__(self,
                          path,
                          name='serial', 
@@ -13,4 +13,4 @@ class Serial(Service):
 
         self.state = 'initialized'
 
-        self.load_commands()
+        self.init_commands(proxy)
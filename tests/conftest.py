@@ -0,0 +1,10 @@
+import os
+import sys
+
+# as clp is run: from the root of the tree, with the libraries of lib/ on
+# the path, which importing services.config puts there
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if sys.path[0] != root_dir:
+    sys.path.insert(0, root_dir)
+
+import services.config
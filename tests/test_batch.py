@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from batch import Batch, BatchSyntaxError
+
+def parse(tokens):
+    """
+    A command line is a command name and the key it orders on; "quit"
+    ends the script, and "bad" is in error
+    """
+    if tokens[0] == 'quit':
+        return None
+    if tokens[0] == 'bad':
+        raise BatchSyntaxError('bad: unrecognized arguments')
+    return tokens
+
+def ordering(args):
+    return args[1:]
+
+def make_batch(*lines):
+    return Batch(lines, parse, ordering)
+
+def dependents(batch):
+    return {command.lineno: [dependent.lineno for dependent in command.dependents] for command in batch.commands}
+
+def test_same_key_waits_for_the_one_before():
+    batch = make_batch('on insteon 1a', 'off insteon 1a', 'on insteon 2b')
+
+    assert [command.waiting for command in batch.commands] == [0, 1, 0]
+    assert dependents(batch) == {1: [2], 2: [], 3: []}
+
+def test_key_within_another_waits_for_it_and_it_for_all_within():
+    batch = make_batch('on insteon 1a', 'on insteon 2b', 'plms insteon', 'off insteon 1a')
+
+    # plms waits for both devices, and the last command for plms alone
+    assert [command.waiting for command in batch.commands] == [0, 0, 2, 1]
+    assert dependents(batch) == {1: [3], 2: [3], 3: [4], 4: []}
+
+def test_empty_key_waits_for_everything():
+    batch = make_batch('on insteon 1a', 'devices serial', 'status', 'devices serial')
+
+    assert [command.waiting for command in batch.commands] == [0, 0, 2, 1]
+    assert dependents(batch) == {1: [3], 2: [3], 3: [4], 4: []}
+
+def test_different_keys_do_not_wait():
+    batch = make_batch('on insteon 1a', 'devices serial', 'on insteon 1b')
+
+    assert [command.waiting for command in batch.commands] == [0, 0, 0]
+
+def test_errors_are_reported_by_line_and_parsing_stops_at_quit():
+    batch = make_batch('on insteon 1a', '# a comment', '', 'bad', 'on "insteon', 'quit', 'bad')
+
+    assert [command.lineno for command in batch.commands] == [1]
+    assert [lineno for lineno, _ in batch.errors] == [4, 5]
+    assert batch.errors[0][1] == 'bad: unrecognized arguments'
+
+def test_run_keeps_the_order_of_a_key_and_prints_in_script_order(capsys):
+    lock = threading.Lock()
+    executed = []
+    released = threading.Event()
+
+    def execute(args):
+        if args == ['slow', 'insteon', '1a']:
+            assert released.wait(2)
+        with lock:
+            executed.append(' '.join(args))
+        if args[0] == 'fast':
+            released.set()
+        print(' '.join(args))
+        return 2 if args[0] == 'fail' else 0
+
+    batch = make_batch('slow insteon 1a', 'fast serial', 'fail insteon 1a', 'last')
+    status = batch.run(execute, jobs=4)
+
+    # fast ran while slow waited, but fail only after slow, and last after all
+    assert executed == ['fast serial', 'slow insteon 1a', 'fail insteon 1a', 'last']
+    assert capsys.readouterr().out.splitlines() == ['slow insteon 1a', 'fast serial', 'fail insteon 1a', 'last']
+    assert status == 2
+
+def test_run_reports_a_failing_command(capsys):
+    def execute(args):
+        raise RuntimeError('port gone')
+
+    status = make_batch('on insteon 1a').run(execute)
+
+    assert status == 1
+    assert 'ERROR: Command failed: port gone' in capsys.readouterr().out
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_run_executes_every_command(jobs, capsys):
+    lines = [f'on insteon {idx % 3}' for idx in range(12)]
+
+    assert make_batch(*lines).run(lambda args: print(args[2]), jobs=jobs) == 0
+    assert capsys.readouterr().out.split() == [str(idx % 3) for idx in range(12)]
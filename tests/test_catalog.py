@@ -0,0 +1,132 @@
+import os
+
+from catalog import CommandCatalog
+
+class FakeInterface:
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def getName(self):
+        return self.name
+
+    def getFQN(self):
+        return 'fake.' + self.name
+
+    def getDescription(self):
+        return 'does ' + self.name
+
+    def getVersion(self):
+        return 'v0.1'
+
+    def getArgs(self):
+        return self.args
+
+class FakeService:
+    """
+    Has what the catalog needs of a service: its name, its commands
+    directory, what its commands depend on, and its command interfaces
+    """
+
+    def __init__(self, cmd_dir, depends=(), args=None):
+        self.cmd_dir = str(cmd_dir)
+        self.depends = list(depends)
+        self.args = args if args is not None else {'device': {'type': str, 'help': 'the device'}}
+
+    def getServiceName(self):
+        return 'fake'
+
+    def catalog_depends(self):
+        return self.depends
+
+    def command_interfaces(self):
+        return [FakeInterface(fname[:-3], self.args) for fname in sorted(os.listdir(self.cmd_dir)) if fname.endswith('.py')]
+
+def set_mtime(path, mtime_ns):
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def make_service(tmp_path, **options):
+    cmd_dir = tmp_path / 'commands'
+    cmd_dir.mkdir()
+    (cmd_dir / 'status.py').write_text('# status\n')
+    (cmd_dir / 'devices.py').write_text('# devices\n')
+    return FakeService(cmd_dir, **options)
+
+def recorded(tmp_path, service):
+    catalog = CommandCatalog(str(tmp_path / 'cache' / 'catalog.json'), str(tmp_path))
+    catalog.record(service)
+    catalog.save()
+    return CommandCatalog(str(tmp_path / 'cache' / 'catalog.json'), str(tmp_path))
+
+def test_recorded_entry_is_looked_up_from_disk(tmp_path):
+    catalog = recorded(tmp_path, make_service(tmp_path))
+
+    commands = catalog.lookup(FakeService(tmp_path / 'commands'))
+    assert [command['name'] for command in commands] == ['devices', 'status']
+    assert commands[0]['args'] == {'device': {'type': 'str', 'help': 'the device'}}
+    assert catalog.decode_args(commands[0]['args'])['device']['type'] is str
+
+def test_changed_command_file_is_stale(tmp_path):
+    service = make_service(tmp_path)
+    catalog = recorded(tmp_path, service)
+
+    (tmp_path / 'commands' / 'status.py').write_text('# status, changed\n')
+    assert catalog.is_stale(service)
+
+def test_changed_file_of_the_same_size_and_mtime_is_not_rehashed(tmp_path):
+    service = make_service(tmp_path)
+    path = tmp_path / 'commands' / 'status.py'
+    set_mtime(path, 1_000_000_000)
+    catalog = recorded(tmp_path, service)
+
+    path.write_text('# STATUS\n')
+    set_mtime(path, 1_000_000_000)
+    assert not catalog.is_stale(service)
+
+def test_added_command_file_is_stale(tmp_path):
+    service = make_service(tmp_path)
+    catalog = recorded(tmp_path, service)
+
+    (tmp_path / 'commands' / 'link.py').write_text('# link\n')
+    set_mtime(tmp_path / 'commands', os.stat(tmp_path / 'commands').st_mtime_ns + 1_000_000_000)
+    assert catalog.is_stale(service)
+
+def test_removed_command_file_is_stale(tmp_path):
+    service = make_service(tmp_path)
+    catalog = recorded(tmp_path, service)
+
+    (tmp_path / 'commands' / 'devices.py').unlink()
+    set_mtime(tmp_path / 'commands', os.stat(tmp_path / 'commands').st_mtime_ns + 1_000_000_000)
+    assert catalog.is_stale(service)
+
+def test_touched_command_file_is_not_stale(tmp_path):
+    service = make_service(tmp_path)
+    catalog = recorded(tmp_path, service)
+
+    path = tmp_path / 'commands' / 'status.py'
+    set_mtime(path, os.stat(path).st_mtime_ns + 1_000_000_000)
+    assert not catalog.is_stale(service)
+    assert catalog.changed     # the new mtime is recorded
+
+def test_changed_dependency_is_stale(tmp_path):
+    services_file = tmp_path / 'services.json'
+    services_file.write_text('{}')
+    service = make_service(tmp_path, depends=[str(services_file)])
+    catalog = recorded(tmp_path, service)
+
+    set_mtime(services_file, os.stat(services_file).st_mtime_ns + 1_000_000_000)
+    assert catalog.is_stale(service)
+
+def test_uncacheable_args_are_not_recorded(tmp_path):
+    service = make_service(tmp_path, args={'when': {'type': lambda value: value}})
+    catalog = recorded(tmp_path, service)
+
+    assert catalog.is_stale(service)
+
+def test_other_root_dir_discards_the_catalog(tmp_path):
+    service = make_service(tmp_path)
+    recorded(tmp_path, service)
+
+    catalog = CommandCatalog(str(tmp_path / 'cache' / 'catalog.json'), str(tmp_path / 'elsewhere'))
+    assert catalog.is_stale(service)
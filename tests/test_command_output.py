@@ -0,0 +1,108 @@
+import csv
+import io
+import json
+import sys
+
+import pytest
+
+from command import Form, OutputFormatError, Table, write_output
+
+def output():
+    """
+    A command's output: lines, a Table and its records, then a Form and
+    records whose fields differ from one to the next
+    """
+    yield 'Devices found:'
+    yield Table(('id', 'ID', 8), ('level', 'Level', 5, 'd'))
+    yield {'id': '1A.2B.3C', 'level': 255}
+    yield {'id': '4D.5E.6F', 'level': None}
+    yield 'ERROR: Device 7A.8B.9C did not reply'
+    yield Form('{port}: {description}')
+    yield {'port': '/dev/ttyUSB0', 'description': 'PLM'}
+    yield {'port': '/dev/ttyS0', 'hwid': 'PNP0501'}
+
+def write(output_format, stream=None):
+    stream = stream or io.StringIO()
+    messages = io.StringIO()
+    error = write_output(output(), stream, output_format, messages)
+    return stream.getvalue(), messages.getvalue(), error
+
+def test_text_renders_records_in_their_layout():
+    out = io.StringIO()
+    assert write_output((item for item in output() if not (isinstance(item, dict) and 'hwid' in item)), out)
+    assert out.getvalue().splitlines() == ['Devices found:',
+                                           'ID       Level',
+                                           '1A.2B.3C   255',
+                                           '4D.5E.6F',
+                                           'ERROR: Device 7A.8B.9C did not reply',
+                                           '/dev/ttyUSB0: PLM']
+
+def test_records_without_a_layout_are_fields_and_values():
+    out = io.StringIO()
+    write_output(iter([{'port': '/dev/ttyS0', 'hwid': 'PNP0501'}]), out)
+    assert out.getvalue() == 'port=/dev/ttyS0  hwid=PNP0501\n'
+
+def test_json_is_an_array_of_the_records():
+    out, messages, error = write('json')
+
+    assert json.loads(out) == [{'id': '1A.2B.3C', 'level': 255}, {'id': '4D.5E.6F', 'level': None},
+                               {'port': '/dev/ttyUSB0', 'description': 'PLM'},
+                               {'port': '/dev/ttyS0', 'hwid': 'PNP0501'}]
+    assert messages == 'Devices found:\nERROR: Device 7A.8B.9C did not reply\n'
+    assert error
+
+def test_json_of_no_records_is_an_empty_array():
+    out = io.StringIO()
+    assert not write_output(iter(['Nothing found']), out, 'json', io.StringIO())
+    assert json.loads(out.getvalue()) == []
+
+def test_jsonl_is_a_record_a_line():
+    out, messages, error = write('jsonl')
+
+    assert [json.loads(line) for line in out.splitlines()] == [
+        {'id': '1A.2B.3C', 'level': 255}, {'id': '4D.5E.6F', 'level': None},
+        {'port': '/dev/ttyUSB0', 'description': 'PLM'}, {'port': '/dev/ttyS0', 'hwid': 'PNP0501'}]
+    assert messages == 'Devices found:\nERROR: Device 7A.8B.9C did not reply\n'
+    assert error
+
+def test_json_values_that_are_not_json_are_strings():
+    out = io.StringIO()
+    write_output(iter([{'when': b'\x01'}]), out, 'jsonl', io.StringIO())
+    assert json.loads(out.getvalue()) == {'when': "b'\\x01'"}
+
+def test_csv_has_a_section_for_each_layout_with_every_field_in_its_header():
+    out, messages, error = write('csv')
+
+    assert list(csv.reader(io.StringIO(out))) == [['id', 'level'],
+                                                  ['1A.2B.3C', '255'],
+                                                  ['4D.5E.6F', ''],
+                                                  ['port', 'description', 'hwid'],
+                                                  ['/dev/ttyUSB0', 'PLM', ''],
+                                                  ['/dev/ttyS0', '', 'PNP0501']]
+    assert messages == 'Devices found:\nERROR: Device 7A.8B.9C did not reply\n'
+    assert error
+
+def test_no_errors_among_the_lines():
+    out = io.StringIO()
+    assert not write_output(iter(['Devices found:', {'id': '1A.2B.3C'}]), out, 'csv', io.StringIO())
+
+def test_msgpack_is_the_records_packed():
+    msgpack = pytest.importorskip('msgpack')
+    out = io.TextIOWrapper(io.BytesIO(), write_through=True)
+    messages = io.StringIO()
+
+    assert write_output(output(), out, 'msgpack', messages)
+    assert list(msgpack.Unpacker(io.BytesIO(out.buffer.getvalue()))) == [
+        {'id': '1A.2B.3C', 'level': 255}, {'id': '4D.5E.6F', 'level': None},
+        {'port': '/dev/ttyUSB0', 'description': 'PLM'}, {'port': '/dev/ttyS0', 'hwid': 'PNP0501'}]
+    assert messages.getvalue() == 'Devices found:\nERROR: Device 7A.8B.9C did not reply\n'
+
+def test_msgpack_needs_the_package(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'msgpack', None)
+
+    with pytest.raises(OutputFormatError):
+        write_output(output(), io.TextIOWrapper(io.BytesIO()), 'msgpack', io.StringIO())
+
+def test_no_such_format():
+    with pytest.raises(OutputFormatError):
+        write_output(output(), io.StringIO(), 'xml')
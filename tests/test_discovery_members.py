@@ -0,0 +1,177 @@
+import json
+import time
+import uuid
+
+import pytest
+
+from services.discovery.discovery_members import Member, Membership
+from services.discovery.discovery_protocol import GossipEntry, MAX_GOSSIP_ENTRIES, NodeDescriptor, services_digest
+
+SERVICES = {'insteon': {'devices': 1}}
+
+def make_membership(tmp_path, live=True):
+    membership = Membership(str(tmp_path / 'members.json'))
+    membership.live = live
+    return membership
+
+def entry(idx, heartbeat, services=SERVICES, address=''):
+    return GossipEntry(uuid.UUID(int=idx), heartbeat, services_digest(services), 0.5, address, 50000)
+
+def add_members(membership, count, last_seen):
+    for idx in range(count):
+        membership.members[uuid.UUID(int=idx)] = Member(uuid.UUID(int=idx), hostname=f'node{idx}', heartbeat=1,
+                                                        last_seen=last_seen)
+
+def test_gossip_of_an_unknown_member_with_no_address_is_ignored(tmp_path):
+    membership = make_membership(tmp_path)
+
+    assert membership.gossiped(entry(1, 100)) is None
+    assert membership.members == {}
+
+def test_new_member_is_asked_for_its_descriptor_once(tmp_path):
+    membership = make_membership(tmp_path)
+
+    member = membership.gossiped(entry(1, 100), address='10.0.0.1')
+    assert (member.address, member.port, member.heartbeat) == ('10.0.0.1', 50000, 100)
+    assert membership.changed
+    # not again while the ask may still be answered
+    assert membership.gossiped(entry(1, 101), address='10.0.0.1') is None
+
+def test_member_whose_services_are_known_is_not_asked(tmp_path):
+    membership = make_membership(tmp_path)
+    membership.heard(NodeDescriptor(uuid.UUID(int=1), 'node1', 0.5, 2, SERVICES), '10.0.0.1', 50000)
+
+    assert membership.gossiped(entry(1, 100), address='10.0.0.1') is None
+
+def test_member_whose_services_changed_is_asked_again(tmp_path):
+    membership = make_membership(tmp_path)
+    membership.heard(NodeDescriptor(uuid.UUID(int=1), 'node1', 0.5, 2, SERVICES), '10.0.0.1', 50000)
+
+    changed = {'insteon': {'devices': 2}}
+    assert membership.gossiped(entry(1, 100, services=changed), address='10.0.0.1') is not None
+
+def test_older_heartbeat_is_no_news(tmp_path):
+    membership = make_membership(tmp_path)
+    membership.gossiped(entry(1, 100, address='10.0.0.1'))
+    last_seen = membership.members[uuid.UUID(int=1)].last_seen
+
+    membership.gossiped(entry(1, 99, address='10.0.0.1'))
+    assert membership.members[uuid.UUID(int=1)].heartbeat == 100
+    assert membership.members[uuid.UUID(int=1)].last_seen == last_seen
+
+def test_news_is_told_once_longest_untold_first(tmp_path, monkeypatch):
+    monkeypatch.setattr(Membership, 'RESENT', 0)
+    membership = make_membership(tmp_path)
+    for idx in range(3):
+        membership.gossiped(entry(idx, 100, address='10.0.0.1'))
+    membership.members[uuid.UUID(int=2)].told_at = -1.0
+
+    first = membership.news(2)
+    assert [news.node_id.int for news in first] == [2, 0]
+    assert [news.node_id.int for news in membership.news(2)] == [1]
+    assert membership.news(2) == []
+
+    membership.gossiped(entry(0, 101, address='10.0.0.1'))
+    assert [(news.node_id.int, news.heartbeat) for news in membership.news(2)] == [(0, 101)]
+
+def test_news_is_made_up_with_resent_members(tmp_path):
+    membership = make_membership(tmp_path)
+    for idx in range(5):
+        membership.gossiped(entry(idx, 100, address='10.0.0.1'))
+    membership.news(10)
+
+    resent = membership.news(10)
+    assert len(resent) == Membership.RESENT
+    assert len({news.node_id for news in resent}) == Membership.RESENT
+
+def test_news_leaves_room_for_resent_members(tmp_path):
+    membership = make_membership(tmp_path)
+    for idx in range(5):
+        membership.gossiped(entry(idx, 100, address='10.0.0.1'))
+    membership.news(10)
+    membership.gossiped(entry(0, 101, address='10.0.0.1'))
+
+    news = membership.news(Membership.RESENT + 1)
+    assert len(news) == Membership.RESENT + 1
+    assert news[0].node_id.int == 0
+
+@pytest.mark.parametrize('age, state', [(0, 'alive'), (4.9, 'alive'), (5, 'suspect'), (29.9, 'suspect'), (30, 'dead')])
+def test_state_by_intervals_since_last_heard(tmp_path, age, state):
+    membership = make_membership(tmp_path)
+    membership.interval = 2.0
+    member = Member(uuid.UUID(int=1), last_seen=1000.0)
+
+    assert membership.state(member, now=1000.0 + age * membership.interval) == state
+
+def test_state_allows_for_the_table_being_saved_only_every_so_often(tmp_path):
+    membership = make_membership(tmp_path, live=False)
+    member = Member(uuid.UUID(int=1), last_seen=1000.0)
+
+    assert membership.state(member, now=1000.0 + Membership.SAVE_EVERY + 4.9) == 'alive'
+    assert membership.state(member, now=1000.0 + Membership.SAVE_EVERY + 5) == 'suspect'
+
+def test_state_scales_with_a_mesh_larger_than_a_gossip(tmp_path):
+    membership = make_membership(tmp_path)
+    add_members(membership, 2 * MAX_GOSSIP_ENTRIES, last_seen=1000.0)
+    member = membership.members[uuid.UUID(int=0)]
+
+    assert membership.state(member, now=1000.0 + 9.9) == 'alive'
+    assert membership.state(member, now=1000.0 + 10) == 'suspect'
+    assert membership.state(member, now=1000.0 + 60) == 'dead'
+
+def test_table_is_saved_and_read_back(tmp_path):
+    membership = make_membership(tmp_path)
+    membership.interval = 2.0
+    membership.heard(NodeDescriptor(uuid.UUID(int=1), 'node1', 0.5, 2, SERVICES), '10.0.0.1', 50000)
+    membership.gossiped(entry(1, 100), address='10.0.0.1')
+    membership.save(force=True)
+
+    read = Membership(str(tmp_path / 'members.json'))
+    assert read.interval == 2.0
+    assert read.members[uuid.UUID(int=1)].to_dict() == membership.members[uuid.UUID(int=1)].to_dict()
+
+def test_save_is_throttled_unless_forced(tmp_path):
+    membership = make_membership(tmp_path)
+    membership.gossiped(entry(1, 100, address='10.0.0.1'))
+    membership.save(force=True)
+    membership.gossiped(entry(2, 100, address='10.0.0.1'))
+
+    membership.save()
+    assert len(Membership(str(tmp_path / 'members.json')).members) == 1
+    membership.save(force=True)
+    assert len(Membership(str(tmp_path / 'members.json')).members) == 2
+
+def test_save_forgets_members_not_heard_of_for_long(tmp_path):
+    membership = make_membership(tmp_path)
+    add_members(membership, 2, last_seen=time.time())
+    membership.members[uuid.UUID(int=1)].last_seen = time.time() - membership.forget_after - 1
+    membership.changed = True
+    membership.save(force=True)
+
+    assert list(Membership(str(tmp_path / 'members.json')).members) == [uuid.UUID(int=0)]
+
+@pytest.mark.parametrize('table', ['not json', json.dumps({'version': Membership.VERSION + 1, 'members': []}),
+                                   json.dumps({'version': Membership.VERSION, 'interval': 1.0, 'members': [{}]})])
+def test_unreadable_table_is_empty(tmp_path, table):
+    (tmp_path / 'members.json').write_text(table)
+
+    assert make_membership(tmp_path).members == {}
+
+def test_sample_prefers_alive_then_suspect_members(tmp_path):
+    membership = make_membership(tmp_path)
+    now = time.time()
+    add_members(membership, 6, last_seen=now)
+    for idx in (2, 3):
+        membership.members[uuid.UUID(int=idx)].last_seen = now - 10 * membership.interval
+    for idx in (4, 5):
+        membership.members[uuid.UUID(int=idx)].last_seen = now - 100 * membership.interval
+
+    assert {member.node_id.int for member in membership.sample(2)} == {0, 1}
+    assert {member.node_id.int for member in membership.sample(4)} == {0, 1, 2, 3}
+    assert {member.node_id.int for member in membership.sample(6)} == {0, 1, 2, 3}
+
+def test_sample_of_a_dead_mesh_is_one_member(tmp_path):
+    membership = make_membership(tmp_path)
+    add_members(membership, 3, last_seen=time.time() - 100 * membership.interval)
+
+    assert len(membership.sample(2)) == 1
@@ -0,0 +1,84 @@
+import uuid
+
+import pytest
+
+from services.discovery.discovery_protocol import (DiscoveryError, GossipEntry, HEADER, MAX_GOSSIP_ENTRIES, MSG_GOSSIP,
+                                                   MSG_PING, MSG_REPLY, NodeDescriptor, decode_gossip, decode_ping,
+                                                   decode_reply, encode_gossip, encode_ping, encode_reply, message_type,
+                                                   services_digest)
+
+NODE_ID = uuid.UUID('0123456789abcdef0123456789abcdef')
+
+SERVICES = {'insteon': {'devices': 1, 'on': 2}, 'serial': {'devices': 1}}
+
+def make_descriptor(**fields):
+    descriptor = dict(node_id=NODE_ID, hostname='kitchen', load=0.25, cpus=4, services=SERVICES)
+    descriptor.update(fields)
+    return NodeDescriptor(**descriptor)
+
+def make_entry(idx, address='192.168.1.10'):
+    return GossipEntry(uuid.UUID(int=idx), 1_700_000_000_000 + idx, services_digest(SERVICES), 1.5, address, 50000)
+
+def test_ping_round_trip():
+    data = encode_ping(0xdeadbeef, 1.5)
+
+    assert message_type(data) == MSG_PING
+    assert decode_ping(data) == (0xdeadbeef, 1.5)
+
+def test_ping_spread_is_capped():
+    assert decode_ping(encode_ping(1, 1000.0)) == (1, 65.535)
+
+def test_reply_round_trip():
+    descriptor = make_descriptor()
+    data = encode_reply(42, descriptor)
+
+    assert message_type(data) == MSG_REPLY
+    assert decode_reply(data) == (42, descriptor)
+
+def test_reply_caps_what_does_not_fit():
+    descriptor = make_descriptor(hostname='h' * 300, load=1000.0, cpus=512, services={'config': {'stats': 300}})
+
+    _, decoded = decode_reply(encode_reply(42, descriptor))
+    assert decoded.hostname == 'h' * 255
+    assert decoded.load == 655.35
+    assert decoded.cpus == 255
+    assert decoded.services == {'config': {'stats': 255}}
+
+def test_gossip_round_trip():
+    entries = [make_entry(0, address=''), make_entry(1), make_entry(2)]
+    data = encode_gossip(entries)
+
+    assert message_type(data) == MSG_GOSSIP
+    assert decode_gossip(data) == entries
+
+def test_gossip_carries_at_most_max_entries():
+    entries = [make_entry(idx) for idx in range(MAX_GOSSIP_ENTRIES + 5)]
+
+    assert decode_gossip(encode_gossip(entries)) == entries[:MAX_GOSSIP_ENTRIES]
+
+def test_services_digest_changes_with_the_commands():
+    assert services_digest(SERVICES) == services_digest({'insteon': {'devices': 1, 'on': 2}, 'serial': {'devices': 1}})
+    assert services_digest(SERVICES) != services_digest({'insteon': {'devices': 1, 'on': 3}, 'serial': {'devices': 1}})
+
+@pytest.mark.parametrize('data', [b'', b'H8', b'XYZ' + bytes(HEADER.size - 3), b'H8S\x02' + bytes(HEADER.size - 4)])
+def test_other_datagrams_are_not_discovery_messages(data):
+    assert message_type(data) is None
+
+@pytest.mark.parametrize('encoded, decode', [
+    (encode_ping(1, 1.0), decode_ping),
+    (encode_reply(1, make_descriptor()), decode_reply),
+    (encode_gossip([make_entry(0), make_entry(1)]), decode_gossip),
+])
+def test_truncated_messages_are_errors(encoded, decode):
+    for length in range(len(encoded)):
+        with pytest.raises(DiscoveryError):
+            decode(encoded[:length])
+
+@pytest.mark.parametrize('data, decode', [
+    (encode_ping(1, 1.0), decode_reply),
+    (encode_reply(1, make_descriptor()), decode_gossip),
+    (encode_gossip([make_entry(0)]), decode_ping),
+])
+def test_other_message_types_are_errors(data, decode):
+    with pytest.raises(DiscoveryError):
+        decode(data)
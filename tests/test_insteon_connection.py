@@ -0,0 +1,100 @@
+import itertools
+import time
+
+import pytest
+
+import store
+
+from services.insteon.insteon_plm import InsteonPLM
+
+urls = itertools.count()
+
+def plmsim_url(**options):
+    """
+    A plmsim URL of its own (as plmsim keeps which URLs are unplugged)
+    """
+    options.setdefault('seed', next(urls))
+    return 'plmsim://?' + '&'.join(f'{option}={value}' for option, value in options.items())
+
+@pytest.fixture
+def make_plm(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, 'store_path', str(tmp_path / 'config.db'))
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path / 'data'))
+    plms = []
+
+    def make_plm(**parms):
+        plm = InsteonPLM()
+        plm.port_cache = str(tmp_path / 'insteon-port')
+        plm.IMParms.update(IM_RECONNECT=True, IM_RECONNECT_BACKOFF=0.02, IM_RECONNECT_BACKOFF_MAX=0.1,
+                           IM_CMD_TIMEOUT=1)
+        plm.IMParms.update(parms)
+        plms.append(plm)
+        return plm
+
+    yield make_plm
+    for plm in plms:
+        plm.disconnect()
+
+def commands(count):
+    return [('SEND_STD_MSG', f'1B037E0511{level:02X}') for level in range(count)]
+
+def test_commands_in_flight_are_sent_again_on_reconnecting(make_plm, capsys):
+    plm = make_plm(IM_RECONNECT_HOLD=5)
+    plm.connect(plmsim_url(unplug=0.1, replug=0.05, latency=0.002))
+
+    # unplugged often enough that a write fails before the reader notices
+    replies = []
+    started = time.monotonic()
+    while plm.connections < 10:
+        assert time.monotonic() - started < 20, 'never reconnected'
+        futures = [plm.submit_command(cmd, args) for cmd, args in commands(50)]
+        replies += [future.result(5) for future in futures]
+
+    assert replies and all(replies)
+    out = capsys.readouterr().out
+    # each loss told once, by whichever of the reader and sender noticed first
+    assert out.count('ERROR: Lost connection to PLM') == plm.connections - 1
+    assert out.count('ERROR: Failure to send command') <= plm.connections - 1
+    assert out.count('Reconnected to the PLM') == plm.connections - 1
+
+def test_commands_are_given_up_once_held_for_longer_than_hold(make_plm, capsys):
+    plm = make_plm(IM_RECONNECT_HOLD=0.2)
+    plm.connect(plmsim_url(unplug=0.05, replug=60))
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    assert plm.send_commands(commands(5)) == [{}] * 5
+    assert 0.1 < time.monotonic() - started < 2
+    out = capsys.readouterr().out
+    assert out.count('ERROR: PLM is not connected, gave up on command') == 5
+    assert plm.connections == 1
+
+def test_commands_sent_while_unplugged_go_once_plugged_back_in(make_plm):
+    plm = make_plm(IM_RECONNECT_HOLD=5)
+    plm.connect(plmsim_url(unplug=0.05, replug=0.3))
+    time.sleep(0.1)
+
+    assert all(plm.send_commands(commands(10)))
+    assert plm.connections == 2
+
+def test_disconnecting_stops_reconnecting(make_plm):
+    plm = make_plm(IM_RECONNECT_HOLD=5)
+    plm.connect(plmsim_url(unplug=0.05, replug=60))
+    time.sleep(0.1)
+    future = plm.submit_command('SEND_STD_MSG', '1B037E051100')
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    plm.disconnect()
+    assert time.monotonic() - started < 2
+    assert future.result(1) == {}
+    assert plm.supervisor is None and plm.sendq is None
+
+def test_without_reconnect_commands_fail_at_once(make_plm):
+    plm = make_plm(IM_RECONNECT=False)
+    plm.connect(plmsim_url(unplug=0.05, replug=60))
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    assert plm.send_commands(commands(3)) == [{}] * 3
+    assert time.monotonic() - started < 0.5
@@ -0,0 +1,75 @@
+from services.insteon.insteon_decoder import FrameDecoder
+
+STX = 0x02
+FRAME_LENGTHS = {0x50: 9, 0x60: 7}
+
+STANDARD = bytes.fromhex('0250' '112233' '445566' '0b' '11' 'ff')
+VERSION = bytes.fromhex('0260' '112233' '0315' '9b' '06')
+
+def frames(decoder):
+    found = []
+    frame = decoder.next_frame()
+    while frame:
+        cmd_num, body = frame
+        found.append((cmd_num, None if body is None else bytes(body)))
+        frame = decoder.next_frame()
+    return found
+
+def test_whole_frames():
+    decoder = FrameDecoder(STX, FRAME_LENGTHS, 64)
+    decoder.fill(STANDARD + VERSION)
+
+    assert frames(decoder) == [(0x50, STANDARD[2:]), (0x60, VERSION[2:])]
+    assert decoder.frames == 2
+    assert decoder.skipped == 0
+
+def test_frame_split_across_reads():
+    decoder = FrameDecoder(STX, FRAME_LENGTHS, 64)
+    for split in (1, 2, 5, len(STANDARD) - 1):
+        decoder.fill(STANDARD[:split])
+        assert decoder.next_frame() is None
+        decoder.fill(STANDARD[split:])
+        assert frames(decoder) == [(0x50, STANDARD[2:])]
+
+def test_garbage_before_and_between_frames_is_skipped():
+    decoder = FrameDecoder(STX, FRAME_LENGTHS, 64)
+    decoder.fill(b'\xff\x00' + STANDARD + b'\x15\x15\x15' + VERSION)
+
+    assert frames(decoder) == [(0x50, STANDARD[2:]), (0x60, VERSION[2:])]
+    assert decoder.skipped == 5
+
+def test_garbage_alone_empties_the_buffer():
+    decoder = FrameDecoder(STX, FRAME_LENGTHS, 16)
+    decoder.fill(b'\x15' * 10)
+
+    assert decoder.next_frame() is None
+    assert decoder.skipped == 10
+    assert decoder.free() == 16
+
+def test_unknown_command_number_has_no_body():
+    decoder = FrameDecoder(STX, FRAME_LENGTHS, 64)
+    decoder.fill(b'\x02\x99' + VERSION)
+
+    assert frames(decoder) == [(0x99, None), (0x60, VERSION[2:])]
+
+def test_stx_alone_waits_for_the_command_number():
+    decoder = FrameDecoder(STX, FRAME_LENGTHS, 64)
+    decoder.fill(b'\x02')
+    assert decoder.next_frame() is None
+    decoder.fill(VERSION[1:])
+    assert frames(decoder) == [(0x60, VERSION[2:])]
+
+def test_buffer_is_compacted_to_take_more():
+    decoder = FrameDecoder(STX, FRAME_LENGTHS, len(STANDARD) + 4)
+    decoder.fill(STANDARD)
+    assert frames(decoder) == [(0x50, STANDARD[2:])]
+    assert decoder.free() == len(STANDARD) + 4
+    assert decoder.fill(STANDARD) == len(STANDARD)
+
+def test_decode_yields_frames_of_data_larger_than_the_buffer():
+    decoder = FrameDecoder(STX, FRAME_LENGTHS, 16)
+    data = (STANDARD + b'\x00' + VERSION) * 5
+
+    decoded = [(cmd_num, bytes(body)) for cmd_num, body in decoder.decode(data)]
+    assert decoded == [(0x50, STANDARD[2:]), (0x60, VERSION[2:])] * 5
+    assert decoder.skipped == 5
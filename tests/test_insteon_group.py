@@ -0,0 +1,142 @@
+from concurrent.futures import Future
+
+import pytest
+
+import store
+
+from services.insteon.insteon_group import InsteonPLMGroup, PLMRoutes
+
+DEVICE = 0x1b037e
+
+def flags(max_hops, hops_left):
+    return (hops_left << 2) | max_hops
+
+class FakeQueue:
+
+    def __init__(self, backlog):
+        self.count = backlog
+
+    def backlog(self):
+        return self.count
+
+class FakeMember:
+    """
+    A member of a group, which replies to each command with its reply
+    """
+
+    def __init__(self, name, backlog=0, reply=None):
+        self.name = name
+        self.sendq = FakeQueue(backlog)
+        self.reply = {'ack': 0x06} if reply is None else reply
+        self.sent = []
+
+    def submit_command(self, cmd, args=''):
+        self.sent.append(cmd)
+        future = Future()
+        future.set_result(self.reply)
+        return future
+
+    def __repr__(self):
+        return self.name
+
+@pytest.fixture
+def group(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, 'store_path', str(tmp_path / 'config.db'))
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path / 'data'))
+    return InsteonPLMGroup()
+
+def test_hops_are_those_taken_of_the_max():
+    routes = PLMRoutes()
+    routes.heard('a', DEVICE, flags(3, 1))
+    routes.heard('b', DEVICE, flags(3, 3))
+
+    assert routes.routes() == {DEVICE: {'a': 2, 'b': 0}}
+
+def test_hops_are_a_moving_average():
+    routes = PLMRoutes()
+    routes.heard('a', DEVICE, flags(3, 0))
+    routes.heard('a', DEVICE, flags(3, 3))
+
+    assert routes.routes()[DEVICE]['a'] == 3 + PLMRoutes.WEIGHT * (0 - 3)
+
+def test_best_is_the_member_with_the_fewest_hops_among_those_given():
+    routes = PLMRoutes()
+    routes.heard('a', DEVICE, flags(3, 1))
+    routes.heard('b', DEVICE, flags(3, 2))
+    routes.heard('c', DEVICE, flags(3, 3))
+
+    assert routes.best(DEVICE, ['a', 'b', 'c']) == 'c'
+    assert routes.best(DEVICE, ['a', 'b']) == 'b'
+    assert routes.best(DEVICE, ['d']) is None
+    assert routes.best(0x445566, ['a', 'b']) is None
+
+def test_unanswered_member_is_routed_around_until_heard_from_again():
+    routes = PLMRoutes()
+    routes.heard('a', DEVICE, flags(3, 2))
+    routes.heard('b', DEVICE, flags(3, 3))
+
+    routes.failed('b', DEVICE)
+    routes.failed('b', DEVICE)
+    assert routes.best(DEVICE, ['a', 'b']) == 'a'
+    for _ in range(5):
+        routes.heard('b', DEVICE, flags(3, 3))
+    assert routes.best(DEVICE, ['a', 'b']) == 'b'
+
+def test_failure_of_a_member_not_heard_from_is_not_a_route():
+    routes = PLMRoutes()
+    routes.failed('a', DEVICE)
+
+    assert routes.routes() == {}
+
+def test_routes_are_a_copy():
+    routes = PLMRoutes()
+    routes.heard('a', DEVICE, flags(3, 3))
+    routes.routes()[DEVICE]['a'] = 3
+
+    assert routes.routes() == {DEVICE: {'a': 0}}
+
+def test_command_to_a_device_goes_through_its_best_member(group):
+    near, far = FakeMember('near', backlog=5), FakeMember('far')
+    group.members = [far, near]
+    group.routes.heard(near, DEVICE, flags(3, 3))
+    group.routes.heard(far, DEVICE, flags(3, 0))
+
+    assert group.submit_command('SEND_STD_MSG', '1B037E0511FF').result() == {'ack': 0x06}
+    assert near.sent == ['SEND_STD_MSG'] and far.sent == []
+
+def test_command_to_a_device_not_heard_from_goes_through_the_least_busy_member(group):
+    busy, idle = FakeMember('busy', backlog=3), FakeMember('idle', backlog=1)
+    group.members = [busy, idle]
+
+    group.submit_command('SEND_STD_MSG', '1B037E0511FF')
+    assert idle.sent == ['SEND_STD_MSG'] and busy.sent == []
+
+def test_command_not_to_a_device_goes_through_the_first_member(group):
+    first, second = FakeMember('first', backlog=9), FakeMember('second')
+    group.members = [first, second]
+
+    group.submit_command('GET_VERSION')
+    assert first.sent == ['GET_VERSION'] and second.sent == []
+
+def test_unanswered_command_penalizes_its_member(group):
+    near, far = FakeMember('near', reply={}), FakeMember('far')
+    group.members = [near, far]
+    group.routes.heard(near, DEVICE, flags(3, 3))
+    group.routes.heard(far, DEVICE, flags(3, 3))
+
+    assert group.submit_command('SEND_STD_MSG', '1B037E0511FF').result() == {}
+    group.submit_command('SEND_STD_MSG', '1B037E0511FF')
+    assert near.sent == ['SEND_STD_MSG'] and far.sent == ['SEND_STD_MSG']
+
+def test_messages_heard_by_a_member_are_its_routes(group):
+    member = FakeMember('member')
+    standard = group.primary.layouts[0x50].decode(bytes.fromhex('1b037e' '112233' '0b' '11' 'ff'))
+    version = group.primary.layouts[0x60].decode(bytes.fromhex('112233' '0315' '9b' '06'))
+
+    group._heard(member, standard)
+    group._heard(member, version)
+    assert group.routes.routes() == {DEVICE: {member: 1}}
+
+def test_command_without_members_is_an_empty_reply(group, capsys):
+    assert group.submit_command('GET_VERSION').result() == {}
+    assert 'ERROR: PLM is not connected' in capsys.readouterr().out
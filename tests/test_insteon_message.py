@@ -0,0 +1,46 @@
+import json
+import os
+
+from services.insteon.insteon_message import MessageLayout, compile_layouts
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'services', 'insteon', 'config')
+
+BYTE = '[0-9a-f][0-9a-f]'
+VERSION_REGEX = (f'(?P<id1>{BYTE})(?P<id2>{BYTE})(?P<id3>{BYTE})(?P<dev_cat>{BYTE})'
+                 f'(?P<dev_subcat>{BYTE})(?P<firm_ver>{BYTE})(?P<ack>06|15)')
+
+def test_layout_decodes_fields_by_offset():
+    layout = MessageLayout('60', 7, VERSION_REGEX, 'GET IM VERSION')
+    msg = layout.decode(bytes.fromhex('112233' '0315' '9b' '06'))
+
+    assert layout.unpack is not None
+    assert msg.cmd_num == '60'
+    assert (msg.id1, msg.id2, msg.id3, msg.dev_cat, msg.dev_subcat, msg.firm_ver, msg.ack) == \
+           (0x11, 0x22, 0x33, 0x03, 0x15, 0x9b, 0x06)
+    assert msg['firm_ver'] == '9b'
+    assert 'ack' in msg and 'cmd1' not in msg
+
+def test_layout_checks_constrained_bytes():
+    layout = MessageLayout('60', 7, VERSION_REGEX, 'GET IM VERSION')
+
+    assert layout.checks == ((6, frozenset((0x06, 0x15))),)
+    assert layout.decode(bytes.fromhex('112233' '0315' '9b' '15')).ack == 0x15
+    assert layout.decode(bytes.fromhex('112233' '0315' '9b' '07')) is None
+
+def test_layout_falls_back_to_the_regex():
+    # a group of two bytes cannot be decoded by offset
+    layout = MessageLayout('6a', 3, f'(?P<id>{BYTE}{BYTE})(?P<ack>06|15)', 'not one byte a group')
+    msg = layout.decode(bytes.fromhex('1122' '06'))
+
+    assert layout.unpack is None
+    assert msg.id == 0x1122 and msg.ack == 0x06
+    assert layout.decode(bytes.fromhex('1122' '00')) is None
+
+def test_layouts_of_the_receive_commands():
+    with open(os.path.join(CONFIG_DIR, 'cmds_receive.json')) as f:
+        layouts = compile_layouts(json.load(f))
+
+    assert set(layouts) == {0x50, 0x60, 0x62}
+    msg = layouts[0x50].decode(bytes.fromhex('112233' '445566' '0b' '11' 'ff'))
+    assert (msg.from_id1, msg.to_id3, msg.msg_flags, msg.cmd1, msg.cmd2) == (0x11, 0x66, 0x0b, 0x11, 0xff)
+    assert layouts[0x62].decode(bytes.fromhex('112233' '0f' '11' 'ff' '99')) is None
@@ -0,0 +1,111 @@
+import json
+import os
+
+from concurrent.futures import Future
+
+from services.insteon.insteon_decoder import FrameDecoder
+from services.insteon.insteon_message import compile_layouts
+from services.insteon.insteon_reader import PLMDispatcher
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'services', 'insteon', 'config')
+
+VERSION_BODY = bytes.fromhex('112233' '0315' '9b' '06')
+STANDARD_BODY = bytes.fromhex('112233' '445566' '0b' '11' 'ff')
+
+def make_dispatcher(future_factory=Future):
+    with open(os.path.join(CONFIG_DIR, 'cmds_receive.json')) as f:
+        layouts = compile_layouts(json.load(f))
+    decoder = FrameDecoder(0x02, {cmd_num: layouts[cmd_num].msg_len for cmd_num in layouts})
+    return PLMDispatcher(decoder, layouts, future_factory)
+
+def test_replies_go_to_the_oldest_waiter():
+    dispatcher = make_dispatcher()
+    first, second = dispatcher.expect_reply('60'), dispatcher.expect_reply('60')
+
+    dispatcher.dispatch(0x60, VERSION_BODY)
+    assert first.done() and not second.done()
+    assert first.result().firm_ver == 0x9b
+
+    dispatcher.dispatch(0x60, VERSION_BODY)
+    assert second.result().id1 == 0x11
+
+def test_cancelled_waiters_are_passed_over():
+    dispatcher = make_dispatcher()
+    first, second = dispatcher.expect_reply('60'), dispatcher.expect_reply('60')
+    first.cancel()
+
+    dispatcher.dispatch(0x60, VERSION_BODY)
+    assert second.result().ack == 0x06
+
+def test_waiter_timing_out_as_its_reply_arrives():
+    dispatcher = None
+
+    class TimingOut(Future):
+        # the waiter times out between the reply being taken for it and set
+        def set_result(self, result):
+            dispatcher.cancel_reply('60', self)
+            super().set_result(result)
+
+    dispatcher = make_dispatcher(TimingOut)
+    received = []
+    dispatcher.subscribe('60', lambda cmd_num, msg: received.append(cmd_num))
+    reply = dispatcher.expect_reply('60')
+
+    dispatcher.dispatch(0x60, VERSION_BODY)
+    assert reply.result(0).ack == 0x06
+    assert received == ['60']
+
+def test_replies_go_to_the_oldest_waiter_whose_echo_they_carry():
+    dispatcher = make_dispatcher()
+    received = []
+    dispatcher.subscribe('62', lambda cmd_num, msg: received.append(msg.id3))
+    first = dispatcher.expect_reply('62', bytes.fromhex('112201' '0f1100'))
+    second = dispatcher.expect_reply('62', bytes.fromhex('112202' '0f1100'))
+
+    # the late reply to a command that timed out is no one's, but is still seen
+    dispatcher.dispatch(0x62, bytes.fromhex('112200' '0f1100' '06'))
+    assert not first.done() and not second.done()
+
+    dispatcher.dispatch(0x62, bytes.fromhex('112202' '0f1100' '06'))
+    assert second.result(0).id3 == 0x02 and not first.done()
+    dispatcher.dispatch(0x62, bytes.fromhex('112201' '0f1100' '15'))
+    assert first.result(0).ack == 0x15
+    assert received == [0x00, 0x02, 0x01]
+
+def test_subscribers_of_the_command_and_of_all():
+    dispatcher = make_dispatcher()
+    standard, everything = [], []
+    dispatcher.subscribe('50', lambda cmd_num, msg: standard.append((cmd_num, msg.cmd1)))
+    dispatcher.subscribe(None, lambda cmd_num, msg: everything.append(cmd_num))
+
+    dispatcher.dispatch(0x50, STANDARD_BODY)
+    dispatcher.dispatch(0x60, VERSION_BODY)
+    assert standard == [('50', 0x11)]
+    assert everything == ['50', '60']
+
+def test_unsubscribed_and_failing_subscribers():
+    dispatcher = make_dispatcher()
+    received = []
+    subscriber = lambda cmd_num, msg: received.append(cmd_num)
+    dispatcher.subscribe(None, lambda cmd_num, msg: 1 / 0)
+    dispatcher.subscribe(None, subscriber)
+
+    dispatcher.dispatch(0x60, VERSION_BODY)     # the failure does not stop the others
+    dispatcher.unsubscribe(None, subscriber)
+    dispatcher.dispatch(0x60, VERSION_BODY)
+    assert received == ['60']
+
+def test_undecodable_message_is_no_reply():
+    dispatcher = make_dispatcher()
+    reply = dispatcher.expect_reply('60')
+
+    dispatcher.dispatch(0x60, bytes.fromhex('112233' '0315' '9b' '99'))
+    assert not reply.done()
+
+def test_connection_lost_cancels_the_waiters():
+    dispatcher = make_dispatcher()
+    reply = dispatcher.expect_reply('62')
+
+    dispatcher.connection_lost(OSError('unplugged'))
+    assert reply.cancelled()
+    assert isinstance(dispatcher.error, OSError)
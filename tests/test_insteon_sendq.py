@@ -0,0 +1,250 @@
+import json
+import os
+import threading
+import time
+
+from services.insteon.insteon_decoder import FrameDecoder
+from services.insteon.insteon_message import compile_layouts
+from services.insteon.insteon_reader import PLMDispatcher
+from services.insteon.insteon_sendq import SendQueue
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'services', 'insteon', 'config')
+
+ACK, NAK = 0x06, 0x15
+
+class FakeReader:
+    """
+    Stands in for the PLM's reader: takes the commands written, when
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.written = []   # (monotonic time, data)
+
+    def write(self, data):
+        with self.lock:
+            self.written.append((time.monotonic(), data))
+        return len(data)
+
+    def count(self):
+        with self.lock:
+            return len(self.written)
+
+def command(dev_id):
+    return bytes.fromhex('0262' + dev_id + '0f1100')
+
+def reply(dev_id, ack):
+    return bytes.fromhex(dev_id + '0f1100') + bytes((ack,))
+
+def make_queue(**options):
+    with open(os.path.join(CONFIG_DIR, 'cmds_receive.json')) as f:
+        layouts = compile_layouts(json.load(f))
+    dispatcher = PLMDispatcher(FrameDecoder(0x02, {cmd_num: layouts[cmd_num].msg_len for cmd_num in layouts}), layouts)
+    reader = FakeReader()
+    parms = dict(max_inflight=2, timeout=1.0, nak=NAK, nak_retries=2, nak_backoff=0.05)
+    parms.update(options)
+    return SendQueue(reader, dispatcher, **parms), dispatcher, reader
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+def test_no_more_than_max_inflight_are_written():
+    sendq, dispatcher, reader = make_queue()
+    try:
+        futures = [sendq.submit('ON', command(f'1122{idx:02x}'), '62') for idx in range(4)]
+        wait_for(lambda: reader.count() == 2)
+        time.sleep(0.05)
+        assert reader.count() == 2
+        assert sendq.backlog() == 4
+
+        dispatcher.dispatch(0x62, reply('112200', ACK))
+        assert futures[0].result(1).ack == ACK
+        wait_for(lambda: reader.count() == 3)
+        assert reader.written[2][1] == command('112202')
+    finally:
+        sendq.close()
+
+def test_replies_are_correlated_in_the_order_sent():
+    sendq, dispatcher, reader = make_queue()
+    try:
+        first, second = sendq.submit('ON', command('112200'), '62'), sendq.submit('OFF', command('112201'), '62')
+        wait_for(lambda: reader.count() == 2)
+        dispatcher.dispatch(0x62, reply('112200', ACK))
+        dispatcher.dispatch(0x62, reply('112201', ACK))
+
+        assert first.result(1).id3 == 0x00
+        assert second.result(1).id3 == 0x01
+        assert sendq.get_stats()['ON']['count'] == 1
+    finally:
+        sendq.close()
+
+def test_nak_is_sent_again_after_a_doubling_backoff():
+    sendq, dispatcher, reader = make_queue()
+    try:
+        future = sendq.submit('ON', command('112200'), '62')
+        for attempt in range(1, 3):
+            wait_for(lambda: reader.count() == attempt)
+            dispatcher.dispatch(0x62, reply('112200', NAK))
+        wait_for(lambda: reader.count() == 3)
+        dispatcher.dispatch(0x62, reply('112200', ACK))
+        assert future.result(1).ack == ACK
+
+        times = [sent for sent, _ in reader.written]
+        assert times[1] - times[0] >= 0.05
+        assert times[2] - times[1] >= 0.1
+        assert sendq.get_stats()['ON']['naks'] == 2
+    finally:
+        sendq.close()
+
+def test_nak_beyond_the_retries_is_the_reply():
+    sendq, dispatcher, reader = make_queue(nak_retries=1, nak_backoff=0.01)
+    try:
+        future = sendq.submit('ON', command('112200'), '62')
+        for attempt in range(1, 3):
+            wait_for(lambda: reader.count() == attempt)
+            dispatcher.dispatch(0x62, reply('112200', NAK))
+
+        assert future.result(1).ack == NAK
+        assert reader.count() == 2
+    finally:
+        sendq.close()
+
+def test_unanswered_command_times_out():
+    sendq, dispatcher, reader = make_queue(timeout=0.05)
+    try:
+        future = sendq.submit('ON', command('112200'), '62')
+        assert future.result(1) == {}
+        assert sendq.get_stats()['ON']['timeouts'] == 1
+        assert sendq.backlog() == 0
+    finally:
+        sendq.close()
+
+def test_late_reply_to_a_command_timed_out_is_not_taken_for_the_next():
+    sendq, dispatcher, reader = make_queue(timeout=0.1)
+    try:
+        timed_out = sendq.submit('ON', command('112200'), '62', echo=command('112200')[2:])
+        assert timed_out.result(1) == {}
+        future = sendq.submit('OFF', command('112201'), '62', echo=command('112201')[2:])
+        wait_for(lambda: reader.count() == 2)
+
+        dispatcher.dispatch(0x62, reply('112200', ACK))
+        assert not future.done()
+        dispatcher.dispatch(0x62, reply('112201', NAK))
+        wait_for(lambda: reader.count() == 3)
+        dispatcher.dispatch(0x62, reply('112201', ACK))
+        assert future.result(1).id3 == 0x01
+    finally:
+        sendq.close()
+
+def test_inflight_are_sent_again_in_order_on_resuming():
+    sendq, dispatcher, reader = make_queue(hold=5)
+    try:
+        futures = [sendq.submit('ON', command(f'1122{idx:02x}'), '62') for idx in range(3)]
+        wait_for(lambda: reader.count() == 2)
+        sendq.suspend()
+        time.sleep(0.05)
+        assert reader.count() == 2
+
+        new_reader = FakeReader()
+        sendq.resume(new_reader)
+        wait_for(lambda: new_reader.count() == 2)
+        assert [data for _, data in new_reader.written] == [command('112200'), command('112201')]
+        for idx in range(3):
+            wait_for(lambda: new_reader.count() > idx)
+            dispatcher.dispatch(0x62, reply(f'1122{idx:02x}', ACK))
+        assert [future.result(1).id3 for future in futures] == [0, 1, 2]
+    finally:
+        sendq.close()
+
+def test_close_gives_empty_replies():
+    sendq, dispatcher, reader = make_queue()
+    future = sendq.submit('ON', command('112200'), '62')
+    wait_for(lambda: reader.count() == 1)
+    sendq.close()
+
+    assert future.result(1) == {}
+    assert sendq.submit('ON', command('112200'), '62').result(1) == {}
+
+class BrokenReader(FakeReader):
+    """
+    A reader of a PLM that is gone: its writes fail, once broken
+    """
+
+    def __init__(self, broken=True):
+        super().__init__()
+        self.broken = broken
+        self.attempts = 0
+
+    def write(self, data):
+        with self.lock:
+            self.attempts += 1
+        if self.broken:
+            raise OSError('device reports readiness to read but returned no data')
+        return super().write(data)
+
+def test_failed_write_suspends_the_queue_and_reports_the_loss():
+    lost = []
+    sendq, dispatcher, reader = make_queue(hold=5, lost=lambda err: lost.append(err) or sendq.suspend())
+    reader = sendq.reader = BrokenReader(broken=False)
+    try:
+        first = sendq.submit('ON', command('112200'), '62')
+        wait_for(lambda: reader.count() == 1)
+        reader.broken = True
+        second = sendq.submit('OFF', command('112201'), '62')
+        wait_for(lambda: sendq.suspended)
+        time.sleep(0.05)
+
+        # written once, and not again and again, with the queue still usable
+        assert reader.attempts == 2
+        assert len(lost) == 1 and isinstance(lost[0], OSError)
+        assert sendq.cond.acquire(timeout=1)
+        sendq.cond.release()
+        assert sendq.backlog() == 2
+
+        new_reader = FakeReader()
+        sendq.resume(new_reader)
+        wait_for(lambda: new_reader.count() == 2)
+        assert [data for _, data in new_reader.written] == [command('112200'), command('112201')]
+        dispatcher.dispatch(0x62, reply('112200', ACK))
+        dispatcher.dispatch(0x62, reply('112201', ACK))
+        assert first.result(1).id3 == 0x00
+        assert second.result(1).id3 == 0x01
+    finally:
+        sendq.close()
+
+def test_failed_write_suspends_the_queue_without_a_loss_to_report():
+    sendq, dispatcher, reader = make_queue(hold=5)
+    reader = sendq.reader = BrokenReader()
+    try:
+        sendq.submit('ON', command('112200'), '62')
+        wait_for(lambda: sendq.suspended)
+        time.sleep(0.05)
+        assert reader.attempts == 1
+    finally:
+        sendq.close()
+
+def test_commands_held_longer_than_hold_are_given_up():
+    sendq, dispatcher, reader = make_queue(hold=0.1)
+    reader = sendq.reader = BrokenReader()
+    try:
+        future = sendq.submit('ON', command('112200'), '62')
+        wait_for(lambda: sendq.suspended)
+        assert not future.done()
+
+        assert future.result(1) == {}
+        assert reader.attempts == 1
+        assert sendq.backlog() == 0
+    finally:
+        sendq.close()
+
+def test_failed_write_without_hold_is_an_empty_reply():
+    sendq, dispatcher, reader = make_queue()
+    reader = sendq.reader = BrokenReader()
+    try:
+        assert sendq.submit('ON', command('112200'), '62').result(1) == {}
+        assert not sendq.suspended
+    finally:
+        sendq.close()
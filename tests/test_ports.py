@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+
+import pytest
+
+import ports
+
+from serial.tools import list_ports_common
+
+from ports import PortInventory
+
+PLM = (0x0403, 0x6001)
+
+class FakeDevices:
+    """
+    The serial devices in /dev, as sysfs has them: device: (vid, pid,
+    serial number, subsystem)
+    """
+
+    def __init__(self):
+        self.devices = {'/dev/ttyS0': (None, None, None, 'platform'),
+                        '/dev/ttyS1': (None, None, None, 'pnp'),
+                        '/dev/ttyUSB1': PLM + ('A1', 'usb-serial'),
+                        '/dev/ttyUSB0': PLM + ('B2', 'usb-serial'),
+                        '/dev/ttyACM0': (0x2341, 0x0043, 'C3', 'usb')}
+
+    def glob(self, pattern):
+        prefix = pattern.rstrip('*')
+        return [device for device in self.devices if device.startswith(prefix)]
+
+    def port(self, device):
+        port = list_ports_common.ListPortInfo(device)
+        port.vid, port.pid, port.serial_number, port.subsystem = self.devices[device]
+        return port
+
+def no_netlink(*args):
+    raise OSError('Protocol not supported')
+
+@pytest.fixture
+def devices(monkeypatch):
+    """
+    The fake devices, which an inventory made in the test finds, by
+    looking for them (as netlink cannot be listened to)
+    """
+    devices = FakeDevices()
+    monkeypatch.setattr(ports.glob, 'glob', devices.glob)
+    monkeypatch.setattr(ports, 'SysFS', devices.port)
+    monkeypatch.setattr(ports, 'SYSFS_TTY_DIR', os.path.dirname(__file__))
+    monkeypatch.setattr(ports.socket, 'socket', no_netlink)
+    return devices
+
+def names(found):
+    return [port.device for port in found]
+
+def uevent(action, devname, subsystem='tty'):
+    return b'\0'.join([f'{action}@/devices/{devname}'.encode(), f'ACTION={action}'.encode(),
+                       f'SUBSYSTEM={subsystem}'.encode(), f'DEVNAME={devname}'.encode()])
+
+def test_find_by_usb_id_and_serial_number(devices):
+    inventory = PortInventory()
+
+    assert names(inventory.find(*PLM)) == ['/dev/ttyUSB0', '/dev/ttyUSB1']
+    assert names(inventory.find(PLM[0])) == ['/dev/ttyUSB0', '/dev/ttyUSB1']
+    assert names(inventory.find(*PLM, serial_number='A1')) == ['/dev/ttyUSB1']
+    assert names(inventory.find(serial_number='C3')) == ['/dev/ttyACM0']
+    assert names(inventory.find(0x1234, 0x5678)) == []
+
+def test_platform_ports_are_not_present(devices):
+    inventory = PortInventory()
+
+    assert names(inventory.find()) == ['/dev/ttyACM0', '/dev/ttyS1', '/dev/ttyUSB0', '/dev/ttyUSB1']
+    assert inventory.get('/dev/ttyS0') is None
+
+def test_ports_come_and_gone_are_found_when_asked(devices):
+    inventory = PortInventory()
+    devices.devices['/dev/ttyUSB2'] = PLM + ('D4', 'usb-serial')
+    del devices.devices['/dev/ttyUSB0']
+
+    assert names(inventory.find(*PLM)) == ['/dev/ttyUSB1', '/dev/ttyUSB2']
+    assert inventory.find(serial_number='B2') == []
+
+def test_uevents_add_and_remove_ports(devices):
+    inventory = PortInventory()
+    inventory.sock = object()   # as if listening, so the ports are only those of the uevents
+
+    devices.devices['/dev/ttyUSB2'] = PLM + ('D4', 'usb-serial')
+    inventory._apply_uevent(uevent('add', 'ttyUSB2'))
+    assert names(inventory.find(*PLM)) == ['/dev/ttyUSB0', '/dev/ttyUSB1', '/dev/ttyUSB2']
+
+    inventory._apply_uevent(uevent('remove', 'ttyUSB0'))
+    assert names(inventory.find(*PLM)) == ['/dev/ttyUSB1', '/dev/ttyUSB2']
+    assert inventory.find(serial_number='B2') == []
+
+def test_uevent_of_a_port_plugged_back_in_takes_its_new_ids(devices):
+    inventory = PortInventory()
+    inventory.sock = object()
+
+    devices.devices['/dev/ttyUSB0'] = (0x2341, 0x0043, 'E5', 'usb')
+    inventory._apply_uevent(uevent('add', 'ttyUSB0'))
+    assert names(inventory.find(*PLM)) == ['/dev/ttyUSB1']
+    assert names(inventory.find(serial_number='E5')) == ['/dev/ttyUSB0']
+
+@pytest.mark.parametrize('event', [uevent('add', 'ttyUSB3', subsystem='usb'), uevent('add', 'tty1'),
+                                   b'add@/devices/ttyUSB3\0ACTION=add\0SUBSYSTEM=tty'])
+def test_other_uevents_are_ignored(devices, event):
+    inventory = PortInventory()
+    inventory.sock = object()
+    added = inventory.generation()
+
+    inventory._apply_uevent(event)
+    assert inventory.generation() == added
+
+def test_wait_for_port_added(devices):
+    inventory = PortInventory()
+    generation = inventory.generation()
+
+    def plug_in():
+        time.sleep(0.05)
+        devices.devices['/dev/ttyUSB2'] = PLM + ('D4', 'usb-serial')
+    threading.Thread(target=plug_in).start()
+
+    assert inventory.wait_for_port(generation, 2)
+    assert inventory.generation() != generation
+    assert not inventory.wait_for_port(inventory.generation(), 0.05)
+
+def test_wait_for_port_ends_when_stopped(devices):
+    inventory = PortInventory()
+    stopped = threading.Event()
+    threading.Timer(0.05, lambda: (stopped.set(), inventory.wake())).start()
+
+    started = time.monotonic()
+    assert not inventory.wait_for_port(inventory.generation(), 5, stopped.is_set)
+    assert time.monotonic() - started < 1
+
+def test_without_sysfs_the_ports_are_those_of_comports(devices, tmp_path, monkeypatch):
+    monkeypatch.setattr(ports, 'SYSFS_TTY_DIR', str(tmp_path / 'no-sysfs'))
+    found = [devices.port(device) for device in ('/dev/ttyUSB0', '/dev/ttyACM0')]
+    monkeypatch.setattr(ports.list_ports, 'comports', lambda: found)
+    inventory = PortInventory()
+
+    assert names(inventory.find(*PLM)) == ['/dev/ttyUSB0']
+    found.append(devices.port('/dev/ttyUSB1'))
+    assert names(inventory.find(*PLM)) == ['/dev/ttyUSB0', '/dev/ttyUSB1']
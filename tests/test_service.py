@@ -0,0 +1,41 @@
+import os
+
+from catalog import CommandCatalog
+from service import ServiceProxy
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVICE_DIR = os.path.join(root_dir, 'services', 'discovery')
+
+def make_proxy(tmp_path):
+    """
+    A proxy of the discovery service, with its commands in the catalog,
+    as they are once the clp has run before
+    """
+    catalog = CommandCatalog(str(tmp_path / 'catalog.json'), root_dir)
+    ServiceProxy(SERVICE_DIR, 'services.discovery', catalog)
+    return ServiceProxy(SERVICE_DIR, 'services.discovery', catalog)
+
+def test_proxy_takes_the_commands_from_the_catalog(tmp_path):
+    proxy = make_proxy(tmp_path)
+
+    assert proxy.commands == {}
+    assert proxy.command_fqns() == {'discovery.members', 'discovery.respond', 'discovery.scan'}
+    assert not proxy.is_loaded()
+
+def test_service_built_behind_a_proxy_loads_no_commands(tmp_path):
+    proxy = make_proxy(tmp_path)
+    service = proxy.resolve()
+
+    assert service.proxy is proxy
+    assert service.commands == {} and proxy.commands == {}
+    assert {interface.getFQN() for interface in service.command_interfaces()} == proxy.command_fqns()
+
+def test_commands_are_loaded_one_at_a_time_by_the_proxy(tmp_path):
+    proxy = make_proxy(tmp_path)
+    service = proxy.resolve()
+
+    command = service.get_command('members')
+    assert command is proxy.get_command('members')
+    assert command.owning_service is proxy
+    assert list(proxy.commands) == ['members'] and service.commands == {}